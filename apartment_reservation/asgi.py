@@ -2,6 +2,9 @@
 ASGI config for apartment_reservation project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn apartment_reservation.asgi:application``)
+to enable the live ``/events/`` stream; under WSGI that endpoint answers 204
+and pages fall back to reloading.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
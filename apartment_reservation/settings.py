@@ -1,6 +1,6 @@
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 
 # BASE_DIR setup
@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'cloudinary_storage',
     'django.contrib.staticfiles',
     'cloudinary',
+    'rest_framework',
     'reservations',
     'django.contrib.humanize',
 ]
@@ -30,6 +31,10 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Removes itself unless SQL_PROFILER is on; outside the session middleware so it sees its queries too
+    'reservations.profiling.SQLProfilerMiddleware',
+    # Before the session middleware, so session and user lookups can read from a replica too
+    'reservations.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -40,18 +45,29 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'apartment_reservation.urls'
 
+# Templates with their static {% include %}s inlined, written by `manage.py compile_templates`
+# (build.sh). When enabled they shadow the originals; rerun the command after editing templates.
+COMPILED_TEMPLATES_DIR = BASE_DIR / 'build' / 'templates'
+USE_COMPILED_TEMPLATES = config('USE_COMPILED_TEMPLATES', default=not DEBUG, cast=bool) and COMPILED_TEMPLATES_DIR.is_dir()
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
+        'DIRS': ([COMPILED_TEMPLATES_DIR] if USE_COMPILED_TEMPLATES else []) + [BASE_DIR / 'templates'],
         'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
+                'reservations.context_processors.unread_badges',
             ],
         },
     },
@@ -68,6 +84,37 @@ DATABASES = {
     )
 }
 
+# Read replicas (reservations/replicas.py): comma-separated URLs, added as replica_1, replica_2, ...
+# Safe requests read from one of them unless the client wrote in the last REPLICA_PIN_SECONDS.
+# Locally, point them at other SQLite files and copy the primary over with `manage.py sync_replica`.
+DATABASE_REPLICAS = []
+for _number, _url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), 1):
+    DATABASES[f'replica_{_number}'] = {
+        **dj_database_url.parse(_url, conn_max_age=600, conn_health_checks=True),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+DATABASE_ROUTERS = ['reservations.replicas.ReplicaRouter']
+# Replicas further behind than this many seconds are skipped (reads go to the primary)
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', default=2.0, cast=float)
+REPLICA_LAG_CHECK_INTERVAL = 1.0
+# Keep above REPLICA_MAX_LAG + REPLICA_LAG_CHECK_INTERVAL
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# Cache. The header counters, dashboard stats, facet counts, card fragments and ETags (and the
+# version keys that invalidate them) live here and are shifted with incr(), which must be atomic.
+# CACHE_URL is one of:
+#   'locmem' (default): per process, so only for a single process (web server plus jobs);
+#   'redis://host:6379/0': Redis (needs the redis package), shared and atomic.
+# WEB_CONCURRENCY counts the processes sharing the database (web workers and runworker
+# processes); above 1 the cache must be Redis (check reservations.E001).
+CACHE_URL = config('CACHE_URL', default='locmem')
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -97,7 +144,8 @@ CLOUDINARY_STORAGE = {
 # Storage Configuration for Django 4.2+
 STORAGES = {
     "default": {
-        "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+        # Set MEDIA_STORAGE_BACKEND=django.core.files.storage.FileSystemStorage to keep uploads in MEDIA_ROOT
+        "BACKEND": config('MEDIA_STORAGE_BACKEND', default="cloudinary_storage.storage.MediaCloudinaryStorage"),
     },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -112,4 +160,64 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Run reservations.bootstrap (migrate/superuser/fixture, fingerprinted) when wsgi.py is imported
+BOOTSTRAP_ON_STARTUP = config('BOOTSTRAP_ON_STARTUP', default=True, cast=bool)
+
+# Deliver deferred notifications (e.g. the staff fan-out for new reservations) on a
+# background thread instead of after commit in the request. Leave off on serverless hosts.
+NOTIFICATIONS_IN_BACKGROUND = config('NOTIFICATIONS_IN_BACKGROUND', default=False, cast=bool)
+
+# Background job queue (reservations/jobs.py), worked by `manage.py runworker`. When on, deferred
+# notification deliveries and image variant builds are queued instead of run in the request.
+BACKGROUND_JOBS = config('BACKGROUND_JOBS', default=False, cast=bool)
+# A failed job is retried after BASE * 2 ** (attempts - 1) seconds, at most MAX, jittered
+JOB_RETRY_BASE_SECONDS = 10
+JOB_RETRY_MAX_SECONDS = 3600
+# A job still running after this long is assumed to have lost its worker and is queued again
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=900, cast=int)
+# Finished (done or failed) jobs are deleted after this many days
+JOB_KEEP_DAYS = 7
+# Periodic jobs: registered job name -> seconds between the end of one run and the next,
+# e.g. {'retention.apply': 86400}
+JOB_SCHEDULE = {}
+
+# Pub/sub backend for the live /events/ stream (see reservations/events.py). The default
+# in-memory broker only reaches clients of the same ASGI process.
+EVENTS_BROKER = config('EVENTS_BROKER', default='reservations.events.InMemoryBroker')
+
+# JSON API (reservations/api.py), mounted at /api/v1/
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
+    'ALLOWED_VERSIONS': ['v1'],
+}
+
+# Per-request SQL profiling and N+1 detection (reservations/profiling.py). Off by default;
+# when on, responses carry a Server-Timing header and staff can browse /admin-panel/sql/.
+SQL_PROFILER_ENABLED = config('SQL_PROFILER', default=False, cast=bool)
+SQL_PROFILER_BUFFER_SIZE = 200
+SQL_PROFILER_SLOWEST = 5
+# The same query shape this many times in one request is reported as a likely N+1
+SQL_PROFILER_REPEAT_THRESHOLD = 3
+
+# Retention for read notifications and messages (reservations/retention.py, run with
+# `manage.py apply_retention`). Rows read and older than `days` are moved to the archive
+# tables ('archive'), removed ('delete') or left alone ('keep').
+RETENTION_POLICIES = {
+    'notifications': {
+        'days': config('NOTIFICATION_RETENTION_DAYS', default=90, cast=int),
+        'action': config('NOTIFICATION_RETENTION_ACTION', default='archive'),
+    },
+    'messages': {
+        'days': config('MESSAGE_RETENTION_DAYS', default=365, cast=int),
+        'action': config('MESSAGE_RETENTION_ACTION', default='archive'),
+    },
+}
+# Rows per transaction; each batch holds its write locks only this long
+RETENTION_BATCH_SIZE = 500
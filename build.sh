@@ -1,4 +1,5 @@
 #!/bin/bash
 pip install -r requirements.txt
-python3.12 manage.py migrate --noinput
-python3.12 manage.py collectstatic --noinput
\ No newline at end of file
+python3.12 manage.py bootstrap
+python3.12 manage.py collectstatic --noinput
+python3.12 manage.py compile_templates
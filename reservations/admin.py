@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Apartment, Reservation, Tenant, Notification, Conversation, Message
+from . import counters, notifications
+from .models import Apartment, Reservation, Tenant, Notification, Conversation, Message, NotificationArchive, MessageArchive, Job
 
 @admin.register(Apartment)
 class ApartmentAdmin(admin.ModelAdmin):
@@ -9,8 +10,8 @@ class ApartmentAdmin(admin.ModelAdmin):
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'apartment', 'check_in', 'status', 'created_at']  # REMOVED: 'check_out', 'months'
-    list_filter = ['status', 'check_in', 'created_at']  # REMOVED: 'check_out'
+    list_display = ['id', 'user', 'apartment', 'check_in', 'check_out', 'status', 'created_at']
+    list_filter = ['status', 'check_in', 'check_out', 'created_at']
     search_fields = ['user__username', 'apartment__unit_number']
     readonly_fields = ['created_at', 'updated_at', 'reviewed_at']
 
@@ -25,14 +26,43 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ['notification_type', 'is_read', 'created_at']
     search_fields = ['user__username', 'message']
 
+    def delete_queryset(self, request, queryset):
+        notifications.delete(queryset)
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'subject', 'created_at', 'updated_at']
+    list_display = ['id', 'subject', 'last_message_at', 'created_at', 'updated_at']
     search_fields = ['subject']
     filter_horizontal = ['participants']
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['sender', 'conversation', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at']
-    search_fields = ['sender__username', 'content']
\ No newline at end of file
+    list_display = ['sender', 'conversation', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['sender__username', 'content']
+
+    def delete_model(self, request, obj):
+        counters.forget_message_readers(Message.objects.filter(pk=obj.pk))
+        obj.delete()
+
+    def delete_queryset(self, request, queryset):
+        counters.forget_message_readers(queryset)
+        queryset.delete()
+
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ['original_id', 'user', 'notification_type', 'created_at', 'archived_at']
+    list_filter = ['notification_type', 'archived_at']
+    search_fields = ['user__username', 'message']
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['original_id', 'sender', 'conversation_id', 'created_at', 'archived_at']
+    list_filter = ['archived_at']
+    search_fields = ['sender__username', 'content']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'queue', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'queue', 'name']
+    search_fields = ['name', 'key', 'last_error']
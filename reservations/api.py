@@ -0,0 +1,185 @@
+"""
+Read-only JSON API, mounted at /api/<version>/ (only ``v1`` so far).
+
+* Every endpoint loads its relations with select_related/prefetch_related,
+  so the query count per request is fixed, not one per row (see the
+  API tests).
+* ``?fields=a,b`` returns only those fields (SparseFieldsMixin). Joins
+  for relations that were not asked for are skipped.
+* Lists use the same keyset pagination as the HTML views (``?cursor=``,
+  ``?page_size=`` up to MAX_PAGE_SIZE).
+* GET responses carry an ETag. A matching If-None-Match gets an empty 304.
+  The tag is a hash of the serialized payload, so revalidating still runs
+  the queries and the serialization; it saves the transfer and the
+  client's parsing. (Nested representations depend on related rows, so
+  conditional.py's MAX(updated_at)/COUNT validators would miss edits.)
+"""
+import hashlib
+import json
+
+from django.db.models import Prefetch
+from django.http import HttpResponseNotModified
+from django.urls import include, path
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Apartment, Conversation, ConversationParticipant, Message, Notification, Reservation
+from .pagination import InvalidCursor, paginate_queryset
+from .serializers import (
+    ApartmentSerializer, ConversationSerializer, MessageSerializer, NotificationSerializer, ReservationSerializer,
+)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPagination(BasePagination):
+    """DRF adapter for reservations.pagination (cursor links in ``next``/``previous``)"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            page_size = DEFAULT_PAGE_SIZE
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        try:
+            self.page = paginate_queryset(queryset, request.query_params.get('cursor'), page_size)
+        except InvalidCursor:
+            raise NotFound('Invalid cursor.')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+
+class ConditionalGetMixin:
+    """ETag from the serialized payload; a match skips the transfer, not the queries or serialization"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.data is None:
+            return response
+        # The media type is part of the tag: JSON and the browsable API are different representations
+        payload = json.dumps(response.data, cls=JSONEncoder, sort_keys=True)
+        digest = hashlib.sha1(f'{response.accepted_media_type}\n{payload}'.encode()).hexdigest()
+        etag = quote_etag(digest)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            not_modified = HttpResponseNotModified()
+            not_modified['ETag'] = etag
+            not_modified['Cache-Control'] = response['Cache-Control']
+            return not_modified
+        return response
+
+
+class ReadOnlyAPIViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    pagination_class = KeysetPagination
+    # serializer field -> select_related path; joined only when the field is part of the response
+    related_fields = {}
+
+    def requested_fields(self):
+        requested = {name.strip() for name in self.request.query_params.get('fields', '').split(',') if name.strip()}
+        # Same rule as SparseFieldsMixin: no known field name means the full representation
+        return requested & set(self.get_serializer_class().Meta.fields) or set(self.get_serializer_class().Meta.fields)
+
+    def with_related(self, queryset):
+        fields = self.requested_fields()
+        paths = [path for field, path in self.related_fields.items() if field in fields]
+        return queryset.select_related(*paths) if paths else queryset
+
+
+class ApartmentViewSet(ReadOnlyAPIViewSet):
+    serializer_class = ApartmentSerializer
+
+    def get_queryset(self):
+        apartments = Apartment.objects.all()
+        params = self.request.query_params
+        if params.get('status'):
+            apartments = apartments.filter(status=params['status'])
+        if params.get('type'):
+            apartments = apartments.filter(apartment_type=params['type'])
+        return apartments
+
+
+class ReservationViewSet(ReadOnlyAPIViewSet):
+    serializer_class = ReservationSerializer
+    related_fields = {'apartment': 'apartment', 'user': 'user', 'reviewed_by': 'reviewed_by'}
+
+    def get_queryset(self):
+        reservations = Reservation.objects.all()
+        if not self.request.user.is_staff:
+            reservations = reservations.filter(user=self.request.user)
+        if self.request.query_params.get('status'):
+            reservations = reservations.filter(status=self.request.query_params['status'])
+        return self.with_related(reservations)
+
+
+class NotificationViewSet(ReadOnlyAPIViewSet):
+    serializer_class = NotificationSerializer
+
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user)
+
+
+class ConversationViewSet(ReadOnlyAPIViewSet):
+    serializer_class = ConversationSerializer
+    related_fields = {'last_message_sender': 'last_message_sender'}
+
+    def get_queryset(self):
+        user = self.request.user
+        conversations = self.with_related(Conversation.objects.filter(participant_states__user=user))
+        fields = self.requested_fields()
+        if 'participants' in fields:
+            conversations = conversations.prefetch_related('participants')
+        if 'unread_count' in fields:
+            conversations = conversations.prefetch_related(Prefetch(
+                'participant_states', queryset=ConversationParticipant.objects.filter(user=user).with_unread_count(),
+                to_attr='my_state',
+            ))
+        return conversations
+
+    @action(detail=True, serializer_class=MessageSerializer)
+    def messages(self, request, pk=None, version=None):
+        """The conversation's messages, newest first"""
+        # Every participant's read cursor, which also serves as the membership check
+        cursors = dict(
+            ConversationParticipant.objects.filter(conversation_id=pk).values_list('user_id', 'last_read_message_id')
+        )
+        if request.user.pk not in cursors:
+            raise NotFound()
+        messages = Message.objects.filter(conversation_id=pk).order_by('-created_at')
+        if 'sender' in self.requested_fields():
+            messages = messages.select_related('sender')
+        page = self.paginate_queryset(messages)
+        context = dict(self.get_serializer_context(), read_cursors=cursors)
+        return self.get_paginated_response(self.get_serializer(page, many=True, context=context).data)
+
+
+router = DefaultRouter()
+router.register('apartments', ApartmentViewSet, basename='api-apartment')
+router.register('reservations', ReservationViewSet, basename='api-reservation')
+router.register('notifications', NotificationViewSet, basename='api-notification')
+router.register('conversations', ConversationViewSet, basename='api-conversation')
+
+urlpatterns = [
+    path('<str:version>/', include(router.urls)),
+]
@@ -0,0 +1,194 @@
+"""
+Availability engine: which units are free for a date range.
+
+A tenancy is an approved reservation covering [check_in, check_out); a
+blank check_out means open-ended. A unit is booked for a requested range
+when any of its tenancies overlaps that range.
+
+* PostgreSQL: the generated ``tenancy`` daterange column (migration 0012)
+  is queried with ``&&``, which its GiST index answers directly.
+* Other backends: approved tenancies are loaded once into an in-process
+  interval tree, rebuilt only when the version in the shared cache
+  changes. Saves and deletes that add, move or remove a tenancy, and
+  transitions into or out of a blocking status, bump it on commit;
+  other reservation edits (pending requests, notes) leave it alone.
+"""
+import threading
+import time
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from . import replicas
+from .models import Reservation
+
+VERSION_KEY = 'availability:version'
+BLOCKING_STATUSES = ('approved',)
+OPEN_END = date.max.toordinal() + 1
+
+
+class IntervalTree:
+    """
+    Static centered interval tree over half-open integer intervals [start, end).
+
+    Building is O(n log n); ``overlapping()`` is O(log n + k) for k matches.
+    """
+
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, intervals):
+        # intervals: list of (start, end, value)
+        points = sorted(p for start, end, _ in intervals for p in (start, end - 1))
+        self.center = points[len(points) // 2] if points else 0
+        here, left, right = [], [], []
+        for interval in intervals:
+            start, end, _ = interval
+            if end <= self.center:
+                left.append(interval)
+            elif start > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        self.by_start = sorted(here, key=lambda i: i[0])
+        self.by_end = sorted(here, key=lambda i: i[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def overlapping(self, start, end):
+        """Yield the value of every interval overlapping [start, end)"""
+        node = self
+        stack = []
+        while node is not None or stack:
+            if node is None:
+                node = stack.pop()
+            if end <= node.center:
+                # Query lies left of center: node intervals overlap iff they start before `end`
+                for interval in node.by_start:
+                    if interval[0] >= end:
+                        break
+                    yield interval[2]
+                node = node.left
+            elif start > node.center:
+                # Query lies right of center: node intervals overlap iff they end after `start`
+                for interval in node.by_end:
+                    if interval[1] <= start:
+                        break
+                    yield interval[2]
+                node = node.right
+            else:
+                # Query spans center: every node interval overlaps
+                for interval in node.by_start:
+                    yield interval[2]
+                if node.right is not None:
+                    stack.append(node.right)
+                node = node.left
+
+
+_tree = None
+_tree_version = None
+_tree_lock = threading.Lock()
+
+
+def invalidate():
+    """Mark the interval tree stale; called on commit from Reservation signals and transitions"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def version():
+    """Current tenancy data version; changes whenever a tenancy does"""
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        # Not 1: if the key was evicted, a restart from 1 could match a tree built before
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        value = cache.get(VERSION_KEY)
+    return value
+
+
+def _tenancy(fields):
+    status, apartment_id, check_in, check_out = fields
+    return (apartment_id, check_in, check_out) if status in BLOCKING_STATUSES else None
+
+
+def tenancy_changed(reservation, created=False, deleted=False):
+    """Whether saving (or deleting) ``reservation`` can change which units are booked when"""
+    current = reservation.tenancy_fields()
+    loaded = getattr(reservation, '_loaded_tenancy', None)
+    if current is None or (loaded is None and not created and not deleted):
+        # Deferred fields, or an instance that wasn't loaded: can't tell what the row held
+        return True
+    before = None if created else _tenancy(loaded or current)
+    after = None if deleted else _tenancy(current)
+    return before != after
+
+
+def _build_tree():
+    # The tree serves every request until the next version: build it from the primary
+    with replicas.primary_reads():
+        rows = list(Reservation.objects.filter(status__in=BLOCKING_STATUSES).values_list(
+            'pk', 'apartment_id', 'check_in', 'check_out'
+        ))
+    return IntervalTree([
+        (check_in.toordinal(), check_out.toordinal() if check_out else OPEN_END, (pk, apartment_id))
+        for pk, apartment_id, check_in, check_out in rows
+        if check_out is None or check_out > check_in
+    ])
+
+
+def _current_tree():
+    global _tree, _tree_version
+    if connections['default'].in_atomic_block:
+        # The transaction may hold uncommitted tenancy changes (invalidation waits for the
+        # commit), so build a tree just for this call rather than one that outlives it
+        return _build_tree()
+    version_now = version()
+    if _tree is None or _tree_version != version_now:
+        with _tree_lock:
+            if _tree is None or _tree_version != version_now:
+                _tree = _build_tree()
+                _tree_version = version_now
+    return _tree
+
+
+def _overlapping_tenancies(start, end, using):
+    """PostgreSQL: approved reservations whose tenancy range overlaps [start, end), via the GiST index"""
+    table = Reservation._meta.db_table
+    return Reservation.objects.using(using).filter(status__in=BLOCKING_STATUSES).alias(
+        overlaps=RawSQL(
+            f"\"{table}\".\"tenancy\" && daterange(%s, %s, '[)')", [start, end], output_field=BooleanField()
+        ),
+    ).filter(overlaps=True)
+
+
+def booked_apartment_ids(start, end=None, exclude_reservation=None, using='default'):
+    """Ids of apartments with an approved tenancy overlapping [start, end); ``end=None`` is open-ended"""
+    if connections[using].vendor == 'postgresql':
+        tenancies = _overlapping_tenancies(start, end, using)
+        if exclude_reservation is not None:
+            tenancies = tenancies.exclude(pk=exclude_reservation.pk)
+        return set(tenancies.values_list('apartment_id', flat=True))
+
+    end_ordinal = end.toordinal() if end else OPEN_END
+    excluded_pk = exclude_reservation.pk if exclude_reservation is not None else None
+    return {
+        apartment_id
+        for pk, apartment_id in _current_tree().overlapping(start.toordinal(), end_ordinal)
+        if pk != excluded_pk
+    }
+
+
+def is_available(apartment, start, end=None, exclude_reservation=None):
+    return apartment.pk not in booked_apartment_ids(start, end, exclude_reservation)
+
+
+def available_apartments(queryset, start, end=None):
+    """Narrow an Apartment queryset to units with no overlapping tenancy and not under maintenance"""
+    queryset = queryset.exclude(status='maintenance')
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.exclude(pk__in=_overlapping_tenancies(start, end, queryset.db).values('apartment_id'))
+    return queryset.exclude(pk__in=booked_apartment_ids(start, end, using=queryset.db))
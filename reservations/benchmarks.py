@@ -0,0 +1,327 @@
+"""
+Benchmark suite: every URL in reservations/urls.py, driven through the test client.
+
+Each case in CASES names a URL pattern, who views it and how. ``run()``
+requests each one ``warmup + repeat`` times against a seeded dataset (see
+datasets.py) and records:
+
+* ``queries``: the most SQL queries any single request ran. The cache is
+  cleared before each case, so the first request is a cold one and this is
+  the worst case;
+* latency percentiles over the ``repeat`` measured (warm) requests.
+
+Every request runs in a transaction that is rolled back, so mutating views
+(approve, mark read, logout, ...) measure their real work while the dataset
+stays the same. on_commit work (counter updates, live events) is therefore
+not measured.
+
+A run fails when a view runs more queries than its committed budget in
+QUERY_BUDGETS; query counts are the same on every machine, so the budgets
+are the gate. Latency is compared with a baseline kept on the machine that
+runs the benchmark (benchmark_baseline.json, not committed: milliseconds
+from one machine say nothing about another). The first run of a preset
+records it, and later medians that regressed past a threshold are
+reported, failing the run only when asked to. The ``benchmark`` command
+runs the whole thing on a throwaway database; tests.py checks the budgets
+on the tiny preset.
+"""
+import gc
+import json
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import URLPattern, reverse
+
+from . import datasets
+from .models import Conversation, Notification, Reservation
+from .urls import urlpatterns
+
+# url name -> (viewer, method, target). The viewer is 'anonymous', 'tenant'
+# (the dataset's busy tenant) or 'staff'; the target names the object whose
+# pk fills the URL (see _targets()).
+CASES = {
+    'dashboard': ('tenant', 'get', None),
+    'register': ('anonymous', 'get', None),
+    'login': ('anonymous', 'get', None),
+    'logout': ('tenant', 'post', None),
+    'admin_dashboard': ('staff', 'get', None),
+    'sql_profiles': ('staff', 'get', None),
+    'apartment_list': ('tenant', 'get', None),
+    'apartment_detail': ('tenant', 'get', 'apartment'),
+    'apartment_create': ('staff', 'get', None),
+    'apartment_update': ('staff', 'get', 'apartment'),
+    'apartment_delete': ('staff', 'get', 'apartment'),
+    'reservation_list': ('tenant', 'get', None),
+    'reservation_create': ('tenant', 'get', None),
+    'reservation_update': ('tenant', 'get', 'reservation'),
+    'reservation_delete': ('tenant', 'get', 'reservation'),
+    'reservation_approve': ('staff', 'post', 'reservation'),
+    'reservation_deny': ('staff', 'get', 'reservation'),
+    'notifications': ('tenant', 'get', None),
+    'notification_read': ('tenant', 'post', 'notification'),
+    'notification_delete': ('tenant', 'post', 'notification'),
+    'notification_clear_all': ('tenant', 'post', None),
+    'inbox': ('tenant', 'get', None),
+    'send_message': ('tenant', 'get', None),
+    'message_detail': ('tenant', 'get', 'conversation'),
+    'message_read': ('tenant', 'post', 'conversation'),
+    'event_stream': ('tenant', 'get', None),
+    'my_apartment': ('tenant', 'get', None),
+}
+
+# Most queries one request may run, whatever the dataset size. Includes the
+# session and user lookups of an authenticated request, not savepoints.
+QUERY_BUDGETS = {
+    'dashboard': 10,
+    'register': 2,
+    'login': 2,
+    'logout': 6,
+    'admin_dashboard': 10,
+    'sql_profiles': 6,
+    'apartment_list': 9,
+    'apartment_detail': 8,
+    'apartment_create': 6,
+    'apartment_update': 7,
+    'apartment_delete': 7,
+    'reservation_list': 8,
+    'reservation_create': 7,
+    # Editing offers the units free for the reservation's dates (availability tree)
+    'reservation_update': 10,
+    'reservation_delete': 9,
+    # Approval checks the unit's other tenancies for an overlap
+    'reservation_approve': 11,
+    'reservation_deny': 9,
+    'notifications': 7,
+    'notification_read': 6,
+    'notification_delete': 6,
+    # One read and one DELETE per notifications.BATCH_SIZE rows, so constant below that
+    'notification_clear_all': 6,
+    'inbox': 8,
+    'send_message': 7,
+    'message_detail': 11,
+    'message_read': 7,
+    'event_stream': 4,
+    'my_apartment': 8,
+}
+
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 3
+DEFAULT_THRESHOLD = 0.5
+# Median changes smaller than this are noise, whatever the ratio
+MIN_REGRESSION_MS = 2.0
+PERCENTILES = (50, 95, 99)
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class CaseResult:
+    def __init__(self, name, viewer, method):
+        self.name = name
+        self.viewer = viewer
+        self.method = method
+        self.queries = 0
+        self.status_codes = set()
+        self.timings = []
+
+    def percentile(self, p):
+        # Nearest-rank percentile, in milliseconds
+        ordered = sorted(self.timings)
+        rank = max(1, -(-p * len(ordered) // 100))
+        return ordered[rank - 1] * 1000
+
+    def as_dict(self):
+        data = {'queries': self.queries}
+        data.update({f'p{p}_ms': round(self.percentile(p), 3) for p in PERCENTILES})
+        return data
+
+
+def url_names():
+    return [pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern) and pattern.name]
+
+
+def uncovered_urls():
+    """URL names that have no benchmark case or no budget yet"""
+    return [name for name in url_names() if name not in CASES or name not in QUERY_BUDGETS]
+
+
+def _targets(tenant):
+    """The objects the cases operate on, picked from the busy tenant's side of the dataset"""
+    reservation = Reservation.objects.filter(user=tenant, status='pending').order_by('pk').first()
+    conversation = Conversation.objects.filter(participant_states__user=tenant).order_by('-last_message_at').first()
+    return {
+        'reservation': reservation,
+        'apartment': reservation.apartment if reservation else None,
+        'notification': Notification.objects.filter(user=tenant).order_by('pk').first(),
+        'conversation': conversation,
+    }
+
+
+def _client(viewer, users):
+    client = Client()
+    if viewer != 'anonymous':
+        client.force_login(users[viewer])
+    return client
+
+
+def _count(queries):
+    # Savepoints depend on whether the caller already holds a transaction (a TestCase does), not on the view
+    return sum(not query['sql'].startswith(SAVEPOINT_STATEMENTS) for query in queries.captured_queries)
+
+
+def _request(client, method, url):
+    with transaction.atomic():
+        response = getattr(client, method)(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        transaction.set_rollback(True)
+    return response
+
+
+def run(repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, names=None):
+    """Benchmark the cases in ``names`` (all of them by default); returns CaseResults"""
+    users = {'tenant': datasets.busy_tenant(), 'staff': datasets.staff_user()}
+    targets = _targets(users['tenant'])
+    results = []
+    for name, (viewer, method, target) in CASES.items():
+        if names and name not in names:
+            continue
+        url = reverse(name, kwargs={'pk': targets[target].pk} if target else None)
+        client = _client(viewer, users)
+        result = CaseResult(name, viewer, method)
+        cache.clear()
+        gc.collect()
+        for iteration in range(warmup + repeat):
+            session = client.cookies.get(settings.SESSION_COOKIE_NAME)
+            if viewer != 'anonymous' and (session is None or not session.value):
+                client.force_login(users[viewer])  # the logout case ended the session
+            # A collection pause landing in one request is noise, not the view's cost
+            gc.disable()
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = _request(client, method, url)
+                    elapsed = time.perf_counter() - started
+            finally:
+                gc.enable()
+            result.queries = max(result.queries, _count(queries))
+            result.status_codes.add(response.status_code)
+            if iteration >= warmup:
+                result.timings.append(elapsed)
+        results.append(result)
+    return results
+
+
+VIEWERS = ('anonymous', 'tenant', 'staff')
+
+
+def read_trace(path):
+    """``(viewer, method, path)`` per line of a request trace: ``tenant GET /apartments/?q=loft``"""
+    entries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            parts = line.split()
+            if len(parts) != 3 or parts[0] not in VIEWERS:
+                raise ValueError(f'{path}:{number}: expected "<{"|".join(VIEWERS)}> <METHOD> <path>"')
+            entries.append((parts[0], parts[1].lower(), parts[2]))
+    return entries
+
+
+def replay(entries):
+    """Request every ``(viewer, method, path)`` once, rolled back like the benchmark cases; returns the status codes"""
+    users = {'tenant': datasets.busy_tenant(), 'staff': datasets.staff_user()}
+    clients = {viewer: _client(viewer, users) for viewer in VIEWERS}
+    return [_request(clients[viewer], method, path).status_code for viewer, method, path in entries]
+
+
+class DatasetMismatch(Exception):
+    pass
+
+
+@contextmanager
+def seeded_database(preset, keepdb=False, log=None):
+    """
+    A throwaway test database holding the ``preset`` dataset, with a private
+    locmem cache (the default backend; like Redis, its incr() is atomic and
+    it never queries the database, so the counts match either). ``keepdb`` keeps it (for SQLite, in benchmark_<preset>.sqlite3)
+    so the next run skips seeding.
+    """
+    test_settings = connection.settings_dict['TEST']
+    if keepdb and connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        # The default SQLite test database lives in memory and can't be kept
+        test_settings['NAME'] = str(settings.BASE_DIR / f'benchmark_{preset}.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        # A private cache, so clearing it between cases can't touch a shared one
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark',
+        }}):
+            if datasets.is_seeded():
+                # A kept database must hold the same preset, or the numbers aren't comparable
+                seeded_users = User.objects.filter(username__startswith=datasets.USERNAME_PREFIX).count()
+                if seeded_users != datasets.PRESETS[preset]['users']:
+                    raise DatasetMismatch('The kept database holds a different dataset; run once without --keepdb.')
+            else:
+                if log:
+                    log(f"Seeding the '{preset}' dataset...")
+                datasets.seed(preset)
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def budget_failures(results):
+    failures = []
+    for result in results:
+        budget = QUERY_BUDGETS.get(result.name)
+        if budget is not None and result.queries > budget:
+            failures.append(f'{result.name}: {result.queries} queries, budget is {budget}')
+        errors = sorted(code for code in result.status_codes if code >= 400)
+        if errors:
+            failures.append(f'{result.name}: responded with {errors}')
+    return failures
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Cases whose median latency exceeds the baseline's by more than ``threshold`` (a ratio)"""
+    found = []
+    for result in results:
+        before = baseline.get(result.name)
+        if not before:
+            continue
+        now = result.percentile(50)
+        if now > before['p50_ms'] * (1 + threshold) and now - before['p50_ms'] > MIN_REGRESSION_MS:
+            found.append(f"{result.name}: median {now:.2f} ms, baseline {before['p50_ms']:.2f} ms")
+    return found
+
+
+def load_baseline(path, preset):
+    try:
+        with open(path) as f:
+            return json.load(f).get(preset, {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, preset, results):
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        stored = {}
+    # Merge, so benchmarking a few URLs doesn't drop the others' baselines
+    stored.setdefault(preset, {}).update({result.name: result.as_dict() for result in results})
+    with open(path, 'w') as f:
+        json.dump(stored, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,226 @@
+"""
+Startup bootstrap: migrate, create the default superuser and load apartments.json.
+
+This used to run unconditionally on every import of wsgi.py. Now the work is
+fingerprinted instead:
+
+* the migrations fingerprint is a hash of every migration found on disk,
+  names and file contents, so an edited migration counts as a change (plus
+  the default superuser name and the database cache tables), and
+* the fixture hash is a hash of apartments.json.
+
+Both are stored in BootstrapState after a successful run. On a warm start the
+check is a single SELECT and nothing else happens. When something changed, a
+database-level lock (pg_advisory_lock / GET_LOCK, or a lock file next to the
+SQLite database) makes sure only one process does the work; the others wait,
+re-check the fingerprint and skip.
+"""
+import codecs
+import hashlib
+import json
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+
+from .models import BootstrapState
+
+try:
+    import fcntl
+except ImportError:  # Windows: SQLite dev setups run a single process anyway
+    fcntl = None
+
+STATE_NAME = 'default'
+LOCK_KEY = 7305526  # arbitrary, shared by every instance of this project
+MYSQL_LOCK_NAME = 'apartment_reservation_bootstrap'
+SUPERUSER = ('admin', 'admin@gmail.com', 'admin123')
+
+
+class BootstrapReport:
+    """Timing of each bootstrap step, printed to the logs on startup"""
+
+    def __init__(self):
+        self.steps = []
+        self.skipped = False
+        self.started = time.perf_counter()
+        self.total_ms = 0.0
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, (time.perf_counter() - start) * 1000))
+
+    def finish(self, skipped=False):
+        self.skipped = skipped
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    def as_dict(self):
+        return {
+            'skipped': self.skipped,
+            'total_ms': round(self.total_ms, 2),
+            'steps': [{'name': name, 'ms': round(ms, 2)} for name, ms in self.steps],
+        }
+
+    def __str__(self):
+        outcome = 'skipped (fingerprint unchanged)' if self.skipped else 'ran'
+        lines = [f"Bootstrap {outcome} in {self.total_ms:.1f} ms"]
+        lines += [f"  {name:<20} {ms:9.1f} ms" for name, ms in self.steps]
+        return '\n'.join(lines)
+
+
+def fixture_path():
+    return settings.BASE_DIR / 'apartments.json'
+
+
+def migrations_fingerprint():
+    """Hash of every migration on disk; reading files only, no database queries"""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    digest = hashlib.sha256()
+    for key in sorted(loader.disk_migrations):
+        app_label, name = key
+        digest.update(f'{app_label}.{name}\n'.encode())
+        digest.update(hashlib.sha256(_migration_source(loader.disk_migrations[key])).digest())
+    digest.update(SUPERUSER[0].encode())
+    # A newly configured database cache needs its table, so it counts as a schema change
+    for table in sorted(_cache_tables()):
+        digest.update(f'cache:{table}\n'.encode())
+    return digest.hexdigest()
+
+
+def _migration_source(migration):
+    return Path(sys.modules[migration.__module__].__file__).read_bytes()
+
+
+def _cache_tables():
+    return [
+        cache['LOCATION'] for cache in settings.CACHES.values()
+        if cache['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache'
+    ]
+
+
+def fixture_hash():
+    path = fixture_path()
+    if not path.exists():
+        return ''
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def stored_state(using='default'):
+    """Return (migrations_fingerprint, fixture_hash) from the last run, or None"""
+    try:
+        return BootstrapState.objects.using(using).filter(name=STATE_NAME).values_list(
+            'migrations_fingerprint', 'fixture_hash'
+        ).first()
+    except DatabaseError:
+        # Fresh database: the table itself has not been migrated yet
+        return None
+
+
+@contextmanager
+def bootstrap_lock(using='default'):
+    """Hold a database-level lock so only one process bootstraps at a time"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [LOCK_KEY])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [LOCK_KEY])
+    elif connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT GET_LOCK(%s, 600)', [MYSQL_LOCK_NAME])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', [MYSQL_LOCK_NAME])
+    else:
+        name = str(connection.settings_dict['NAME'])
+        if fcntl is None or connection.is_in_memory_db():
+            yield
+            return
+        with open(f'{name}.bootstrap.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_bootstrap(using='default', force=False):
+    """Run whatever startup work is outstanding and return a BootstrapReport"""
+    report = BootstrapReport()
+
+    with report.step('fingerprint'):
+        wanted = (migrations_fingerprint(), fixture_hash())
+    with report.step('check'):
+        current = stored_state(using)
+    if current == wanted and not force:
+        return report.finish(skipped=True)
+
+    with ExitStack() as stack:
+        with report.step('lock wait'):
+            stack.enter_context(bootstrap_lock(using))
+
+        # Another instance may have finished while we were waiting for the lock
+        current = stored_state(using)
+        if current == wanted and not force:
+            return report.finish(skipped=True)
+
+        if force or current is None or current[0] != wanted[0]:
+            with report.step('migrate'):
+                call_command('migrate', interactive=False, database=using, verbosity=0)
+                call_command('createcachetable', database=using, verbosity=0)
+            with report.step('superuser'):
+                ensure_superuser(using)
+
+        if wanted[1] and (force or current is None or current[1] != wanted[1]):
+            with report.step('loaddata'):
+                load_fixture(using)
+
+        report.finish()
+        save_state(using, wanted, report)
+    return report
+
+
+def ensure_superuser(using='default'):
+    User = get_user_model()
+    username, email, password = SUPERUSER
+    if not User.objects.db_manager(using).filter(username=username).exists():
+        User.objects.db_manager(using).create_superuser(username, email, password)
+
+
+def load_fixture(using='default'):
+    """
+    Equivalent of ``loaddata apartments.json``, but tolerant of the UTF-16
+    encoding the fixture was exported with (loaddata only reads UTF-8).
+    """
+    raw = fixture_path().read_bytes()
+    encoding = 'utf-16' if raw[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else 'utf-8-sig'
+    with transaction.atomic(using=using):
+        for obj in serializers.deserialize('json', raw.decode(encoding), using=using):
+            obj.save(using=using)
+
+
+def save_state(using, fingerprint, report):
+    BootstrapState.objects.using(using).update_or_create(
+        name=STATE_NAME,
+        defaults={
+            'migrations_fingerprint': fingerprint[0],
+            'fixture_hash': fingerprint[1],
+            'last_report': json.dumps(report.as_dict()),
+        },
+    )
@@ -0,0 +1,33 @@
+"""System checks for the deployment settings this app relies on."""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+REDIS = 'django.core.cache.backends.redis.RedisCache'
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Counters, stats and their version keys must be shared by every process and
+    shifted atomically: only Redis does both (DatabaseCache.incr is a get then a set).
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.WEB_CONCURRENCY > 1 and backend != REDIS:
+        return [Error(
+            f'WEB_CONCURRENCY is {settings.WEB_CONCURRENCY} but the default cache is {backend}.',
+            hint='Set CACHE_URL to a redis:// URL: the cache must be shared and its incr() atomic.',
+            id='reservations.E001',
+        )]
+    return []
+
+
+@register(deploy=True)
+def single_process_cache_check(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] != LOCMEM:
+        return []
+    return [Warning(
+        'The default cache is per-process (LocMemCache).',
+        hint='Fine for one process; set CACHE_URL to a redis:// URL and WEB_CONCURRENCY when running more.',
+        id='reservations.W001',
+    )]
@@ -0,0 +1,63 @@
+"""
+Conditional GET for the HTML pages.
+
+Each ``*_etag`` function derives a validator for one view from a single
+small query (the object's ``updated_at``, or ``MAX(updated_at)`` and
+``COUNT`` for a list). It is used with Django's ``@condition`` decorator,
+so a matching If-None-Match returns 304 before the view queries or
+renders anything.
+
+The pages are personal (header badges, staff-only controls, CSRF tokens),
+so every tag also covers the viewer: user, role, unread counters (a cache
+read), and the CSRF secret. No tag is produced while flash messages are
+pending, since the page has to render to show them. Only an ETag is sent,
+not Last-Modified: a timestamp can't express the per-viewer parts.
+
+Views whose GET has side effects stay unconditional: opening a message
+thread marks it read, and a 304 would skip that.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import availability
+from .counters import unread_counts
+from .models import Apartment
+
+
+def _etag(request, *parts):
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None
+    user = request.user
+    viewer = (user.pk, user.is_staff, sorted(unread_counts(user).items()), request.META.get('CSRF_COOKIE'))
+    raw = repr((request.get_full_path(), viewer, parts))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def apartment_list_etag(request):
+    # Any edit moves MAX(updated_at); a delete changes the count
+    state = Apartment.objects.aggregate(latest=Max('updated_at'), count=Count('id'))
+    tenancies = availability.version() if request.GET.get('available_from') else None
+    return _etag(request, 'apartments', state['latest'], state['count'], tenancies)
+
+
+def apartment_detail_etag(request, pk):
+    updated_at = Apartment.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return _etag(request, 'apartment', pk, updated_at)
+
+
+def conditional_page(etag_func):
+    """
+    ``@condition`` for a personal page; use below ``@login_required``.
+
+    ``private, no-cache`` lets the browser keep its copy (back navigation
+    included) but revalidate it on every use.
+    """
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(condition(etag_func=etag_func)(view))
+    return decorator
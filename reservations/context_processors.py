@@ -0,0 +1,19 @@
+from .counters import MESSAGES, NOTIFICATIONS, unread_counts
+
+
+def unread_badges(request):
+    """
+    Unread counts for the header badges, read from the cached per-user counters.
+
+    ``live_events`` is set only under ASGI: under WSGI the event stream just
+    answers 204, so opening an EventSource would cost every page a request.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    counts = unread_counts(user)
+    return {
+        'header_unread_notifications': counts[NOTIFICATIONS],
+        'header_unread_messages': counts[MESSAGES],
+        'live_events': hasattr(request, 'scope'),
+    }
@@ -0,0 +1,115 @@
+"""
+Merging duplicate conversation threads (``merge_conversations`` command).
+
+Before Conversation.participant_key, send_message_view looked threads up
+with two chained participant filters and could open a second thread for
+the same pair. Each such set of participants is folded into one thread:
+the one that holds the key, or else the oldest. In one transaction per set:
+
+* messages (and archived messages) move to the kept thread;
+* each participant's read cursor is set just before the earliest message
+  still unread for them in any of the threads, so nothing unread is lost.
+  Messages they had read that come after it (in another thread) show as
+  unread again;
+* the other threads are deleted, the summary is rebuilt from the latest
+  message and the kept thread gets the key.
+
+Threads whose key is missing or stale but that have no duplicate just get
+their key.
+"""
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from . import counters
+from .models import Conversation, ConversationParticipant, Message, MessageArchive
+
+
+class MergeReport:
+    def __init__(self):
+        self.sets = 0
+        self.removed = 0
+        self.messages = 0
+        self.keyed = 0
+
+    def __str__(self):
+        return (f'{self.sets:,} duplicated participant sets merged ({self.removed:,} threads removed, '
+                f'{self.messages:,} messages moved); {self.keyed:,} threads keyed')
+
+
+def participant_keys():
+    """{conversation id: key} computed from the membership table in one pass"""
+    members = {}
+    rows = Conversation.participants.through.objects.order_by().values_list('conversation_id', 'user_id')
+    for conversation_id, user_id in rows.iterator(chunk_size=5000):
+        members.setdefault(conversation_id, []).append(user_id)
+    return {pk: Conversation.participant_key_for(user_ids) for pk, user_ids in members.items()}
+
+
+def _merged_cursors(pks):
+    """user id -> read cursor for the merged thread"""
+    latest = Message.objects.filter(conversation_id__in=pks).aggregate(latest=Max('id'))['latest'] or 0
+    first_unread = Message.objects.filter(
+        conversation=OuterRef('conversation'), id__gt=OuterRef('last_read_message_id'),
+    ).exclude(sender=OuterRef('user')).order_by('id').values('id')[:1]
+    states = ConversationParticipant.objects.filter(conversation_id__in=pks).annotate(first_unread=Subquery(first_unread))
+    cursors = {}
+    for user_id, first in states.values_list('user_id', 'first_unread'):
+        # Read up to just before the earliest message still unread in any of the threads
+        cursor = latest if first is None else first - 1
+        cursors[user_id] = min(cursors.get(user_id, cursor), cursor)
+    return cursors
+
+
+def merge(keep, duplicates, key):
+    """Fold the threads ``duplicates`` into ``keep`` (all ids); returns the number of messages moved"""
+    with transaction.atomic():
+        list(Conversation.objects.select_for_update().filter(pk__in=[keep] + duplicates).values_list('pk'))
+        cursors = _merged_cursors([keep] + duplicates)
+        moved = Message.objects.filter(conversation_id__in=duplicates).update(conversation_id=keep)
+        MessageArchive.objects.filter(conversation_id__in=duplicates).update(conversation_id=keep)
+        for user_id, cursor in cursors.items():
+            ConversationParticipant.objects.filter(conversation_id=keep, user_id=user_id).update(
+                last_read_message_id=cursor
+            )
+            counters.forget(counters.MESSAGES, user_id)
+        Conversation.objects.filter(pk__in=duplicates).delete()
+        conversation = Conversation.objects.get(pk=keep)
+        latest = conversation.messages.order_by('-id').first()
+        if latest is not None:
+            conversation.record_message(latest)
+        # Another thread may still hold the key from before a participant change
+        Conversation.objects.filter(participant_key=key).exclude(pk=keep).update(participant_key=None)
+        Conversation.objects.filter(pk=keep).update(participant_key=key)
+    return moved
+
+
+def merge_duplicates(dry_run=False, progress=None):
+    """Merge every duplicated participant set and key the rest; returns a MergeReport"""
+    report = MergeReport()
+    computed = participant_keys()
+    stored = dict(Conversation.objects.values_list('pk', 'participant_key'))
+    by_key = {}
+    for pk, key in computed.items():
+        if key:
+            by_key.setdefault(key, []).append(pk)
+
+    for key, pks in by_key.items():
+        if len(pks) == 1:
+            if stored.get(pks[0]) != key:
+                report.keyed += 1
+                if not dry_run:
+                    # Clear the key from any thread that still holds it after a participant change
+                    with transaction.atomic():
+                        Conversation.objects.filter(participant_key=key).update(participant_key=None)
+                        Conversation.objects.filter(pk=pks[0]).update(participant_key=key)
+            continue
+        holders = [pk for pk in pks if stored.get(pk) == key]
+        keep = holders[0] if holders else min(pks)
+        duplicates = sorted(pk for pk in pks if pk != keep)
+        report.sets += 1
+        report.removed += len(duplicates)
+        if not dry_run:
+            report.messages += merge(keep, duplicates, key)
+        if progress:
+            progress(report)
+    return report
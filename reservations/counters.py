@@ -0,0 +1,97 @@
+"""
+Per-user unread counters for the header badges.
+
+Each user has two cached integers: unread notifications and unread
+messages. The first read after a miss (or after the counter expires)
+counts from the database. After that, the write paths shift the counters
+with ``cache.incr``/``cache.decr``, so rendering the header runs no COUNT
+queries:
+
+* notifications.deliver(), Notification saves (signals.py) and
+  notifications.delete(), which shifts each user once per bulk delete;
+* new messages via Conversation.record_message (signals.py);
+* the "mark read" views;
+* Message deletes, through ``forget_message_readers()`` before the delete
+  (one query for the whole set; Message has no per-row delete receiver).
+
+Shifts are applied when the surrounding transaction commits. A shift on a
+counter that is not cached is dropped; the next read recounts it. The
+timeout bounds how long any drift from a lost race can survive.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+
+from . import replicas
+from .models import ConversationParticipant, Message, Notification
+
+NOTIFICATIONS = 'notifications'
+MESSAGES = 'messages'
+KINDS = (NOTIFICATIONS, MESSAGES)
+COUNTER_TIMEOUT = 60 * 60
+
+
+def _key(kind, user_id):
+    return f'unread:{kind}:{user_id}'
+
+
+def _count(kind, user_id):
+    # Seeds a counter that later shifts build on, so it must not come from a lagging replica
+    with replicas.primary_reads():
+        if kind == NOTIFICATIONS:
+            return Notification.objects.filter(user_id=user_id, is_read=False).count()
+        return ConversationParticipant.objects.filter(user_id=user_id).with_unread_count().aggregate(
+            total=Sum('unread_count')
+        )['total'] or 0
+
+
+def unread_counts(user):
+    """{'notifications': n, 'messages': m} for ``user``; one cache round trip when warm"""
+    keys = {kind: _key(kind, user.pk) for kind in KINDS}
+    cached = cache.get_many(keys.values())
+    counts = {}
+    for kind, key in keys.items():
+        value = cached.get(key)
+        if value is None:
+            value = _count(kind, user.pk)
+            cache.add(key, value, timeout=COUNTER_TIMEOUT)
+        # A decrement can overtake the recount that seeded the counter
+        counts[kind] = max(value, 0)
+    return counts
+
+
+def _shift(kind, user_ids, delta):
+    for user_id in user_ids:
+        try:
+            if delta > 0:
+                cache.incr(_key(kind, user_id), delta)
+            else:
+                cache.decr(_key(kind, user_id), -delta)
+        except ValueError:
+            # Not cached; the next read counts from the database
+            pass
+
+
+def adjust(kind, user_ids, delta):
+    """Shift the ``kind`` counter of every user in ``user_ids`` by ``delta`` after commit"""
+    user_ids = list(user_ids)
+    if user_ids and delta:
+        transaction.on_commit(lambda: _shift(kind, user_ids, delta))
+
+
+def forget(kind, user_id):
+    """Drop a counter whose delta is unknown; the next read recounts it"""
+    transaction.on_commit(lambda: cache.delete(_key(kind, user_id)))
+
+
+def forget_message_readers(messages):
+    """
+    Forget the message counter of everyone an unread message in ``messages``
+    (a queryset about to be deleted) still counts for; one query for the set.
+    """
+    unread = messages.filter(
+        conversation=OuterRef('conversation'), id__gt=OuterRef('last_read_message_id'),
+    ).exclude(sender=OuterRef('user'))
+    user_ids = ConversationParticipant.objects.filter(Exists(unread)).values_list('user_id', flat=True).distinct()
+    for user_id in user_ids:
+        forget(MESSAGES, user_id)
@@ -0,0 +1,319 @@
+"""
+Deterministic, sized datasets for benchmarking (``seed_dataset`` command).
+
+A preset fixes how many rows of each kind are generated; the seed fixes
+their content, so the same preset and seed always produce the same users,
+units, tenancies, threads and notifications (timestamps aside, which are
+the insert time). Rows are written with bulk_create in
+batches. No model signals fire, so the denormalized state the signals
+normally maintain (conversation summaries, participant rows and read
+cursors, the SQLite search index, cached versions) is written here
+directly.
+
+Seeded rows are recognisable by their prefixes: users are ``seed-user<n>``,
+units ``SD-<n>``. User 0 is staff (as is every STAFF_EVERY-th user) and
+user 1 is the "busy tenant" who gets a larger share of every relation;
+the benchmark suite views the site as these two.
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import availability, facets, fragments, stats
+from .models import Apartment, Conversation, ConversationParticipant, Message, Notification, Reservation
+from .search import reindex_apartments
+
+PRESETS = {
+    'tiny': {
+        'users': 40, 'apartments': 60, 'reservations': 200,
+        'conversations': 40, 'messages': 400, 'notifications': 300,
+    },
+    'small': {
+        'users': 500, 'apartments': 1_000, 'reservations': 5_000,
+        'conversations': 1_000, 'messages': 20_000, 'notifications': 10_000,
+    },
+    'medium': {
+        'users': 5_000, 'apartments': 5_000, 'reservations': 50_000,
+        'conversations': 10_000, 'messages': 200_000, 'notifications': 100_000,
+    },
+    'large': {
+        'users': 20_000, 'apartments': 10_000, 'reservations': 100_000,
+        'conversations': 50_000, 'messages': 1_000_000, 'notifications': 500_000,
+    },
+}
+
+USERNAME_PREFIX = 'seed-user'
+UNIT_PREFIX = 'SD-'
+PASSWORD = 'seed-password'
+STAFF_EVERY = 25
+# Every BUSY_EVERY-th row of each relation goes to the busy tenant
+BUSY_EVERY = 50
+BATCH_SIZE = 2_000
+BASE_DATE = date(2025, 1, 1)
+OCCUPIED_SHARE = 0.3
+UNREAD_TAIL = 3  # the last few messages of a thread are unread for the recipient
+
+COMPOUNDS = ['Palm Court', 'Riverside', 'Cedar Heights', 'Harbor View', 'Maple Gardens', 'Sunset Towers']
+AMENITIES = ['Wifi', 'Aircon', 'Parking', 'Gym', 'Pool', 'Balcony', 'Laundry', 'Security', 'Elevator']
+WORDS = [
+    'bright', 'quiet', 'spacious', 'corner', 'renovated', 'furnished', 'garden', 'view', 'modern',
+    'cozy', 'sunny', 'family', 'near', 'transit', 'market', 'school', 'park', 'storage',
+]
+# apartment_type -> (bedrooms, bathrooms, size range, price range)
+LAYOUTS = {
+    'studio': (0, 1, (20, 35), (6_000, 12_000)),
+    '1br': (1, 1, (35, 60), (10_000, 20_000)),
+    '2br': (2, 1, (55, 90), (16_000, 32_000)),
+    '3br': (3, 2, (80, 130), (25_000, 48_000)),
+    'penthouse': (3, 3, (120, 250), (60_000, 150_000)),
+}
+TYPE_WEIGHTS = [3, 4, 3, 2, 1]
+CLOSED_STATUSES = ['pending', 'denied', 'cancelled', 'completed']
+CLOSED_WEIGHTS = [3, 2, 2, 3]
+
+
+class DatasetExists(Exception):
+    pass
+
+
+def busy_tenant():
+    return User.objects.get(username=f'{USERNAME_PREFIX}1')
+
+
+def staff_user():
+    return User.objects.get(username=f'{USERNAME_PREFIX}0')
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_batches(model, rows, progress=None):
+    """bulk_create ``rows`` batch by batch, yielding each created batch (with pks)"""
+    total = 0
+    for batch in _batches(rows):
+        created = model.objects.bulk_create(batch)
+        total += len(created)
+        if progress:
+            progress(model._meta.verbose_name_plural, total)
+        yield created
+
+
+def _insert(model, rows, progress=None):
+    return [obj for batch in _insert_batches(model, rows, progress) for obj in batch]
+
+
+def _pick(rng, tenant_ids, index):
+    # The busy tenant (user 1, the first tenant) takes every BUSY_EVERY-th row, the rest are uniform
+    return tenant_ids[0] if index % BUSY_EVERY == 0 else rng.choice(tenant_ids)
+
+
+def _users(rng, count):
+    password = make_password(PASSWORD)
+    for i in range(count):
+        yield User(
+            username=f'{USERNAME_PREFIX}{i}',
+            first_name=rng.choice(['Ana', 'Ben', 'Carla', 'Dan', 'Eve', 'Femi', 'Gus', 'Hana']),
+            last_name=rng.choice(['Reyes', 'Santos', 'Cruz', 'Garcia', 'Lim', 'Tan', 'Bautista']),
+            email=f'{USERNAME_PREFIX}{i}@example.com',
+            password=password,
+            is_staff=i % STAFF_EVERY == 0,
+        )
+
+
+def _apartments(rng, count):
+    types = list(LAYOUTS)
+    for i in range(count):
+        apartment_type = rng.choices(types, TYPE_WEIGHTS)[0]
+        bedrooms, bathrooms, size, price = LAYOUTS[apartment_type]
+        yield Apartment(
+            name=rng.choice(COMPOUNDS),
+            apartment_type=apartment_type,
+            floor=rng.randint(1, 50),
+            unit_number=f'{UNIT_PREFIX}{i:05d}',
+            price_per_month=rng.randrange(price[0], price[1], 500),
+            size_sqm=rng.randint(*size),
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            status='available',
+            description=' '.join(rng.choices(WORDS, k=12)),
+            amenities=', '.join(rng.sample(AMENITIES, rng.randint(2, 6))),
+        )
+
+
+def apartment_rows(count, seed=1):
+    """Unsaved apartments as the generator makes them, for other benchmarks"""
+    return _apartments(random.Random(seed), count)
+
+
+def _reservations(rng, count, tenant_ids, staff_ids, apartments):
+    """Pick occupied units first (one approved, open-ended tenancy each), then fill with history"""
+    occupied = rng.sample(apartments, min(len(apartments), int(len(apartments) * OCCUPIED_SHARE), count))
+    for index, apartment in enumerate(occupied):
+        apartment.status = 'occupied'
+        yield Reservation(
+            user_id=_pick(rng, tenant_ids, index), apartment=apartment,
+            check_in=BASE_DATE + timedelta(days=rng.randint(0, 365)),
+            total_price=apartment.price_per_month, status='approved', reviewed_by_id=rng.choice(staff_ids),
+        )
+    for index in range(len(occupied), count):
+        apartment = rng.choice(apartments)
+        status = rng.choices(CLOSED_STATUSES, CLOSED_WEIGHTS)[0]
+        check_in = BASE_DATE + timedelta(days=rng.randint(-730, 365))
+        yield Reservation(
+            user_id=_pick(rng, tenant_ids, index), apartment=apartment, check_in=check_in,
+            check_out=check_in + timedelta(days=30 * rng.randint(1, 12)) if status == 'completed' else None,
+            total_price=apartment.price_per_month, status=status,
+            special_requests=' '.join(rng.choices(WORDS, k=rng.randint(0, 8))),
+            reviewed_by_id=rng.choice(staff_ids) if status in ('denied', 'completed') else None,
+            admin_notes='Unit not available for the requested date.' if status == 'denied' else '',
+        )
+
+
+def _threads(rng, count, tenant_ids, staff_ids):
+    """(conversation, tenant id, staff id) for each thread"""
+    keys = set()
+    for index in range(count):
+        tenant_id, staff_id = _pick(rng, tenant_ids, index), rng.choice(staff_ids)
+        # A pair drawn twice gets a second thread without a key, like the duplicates
+        # merge_conversations cleans up
+        key = Conversation.participant_key_for([tenant_id, staff_id])
+        conversation = Conversation(
+            subject=f'Seed: {" ".join(rng.choices(WORDS, k=4))}', participant_key=None if key in keys else key,
+        )
+        keys.add(key)
+        yield conversation, tenant_id, staff_id
+
+
+def _seed_messages(rng, count, threads, progress=None):
+    """
+    Spread ``count`` messages over the threads and write what record_message()
+    and the participants signal keep normally: the per-thread summary, the
+    participant rows and their read cursors.
+    """
+    # Every thread gets one message, the rest land at random
+    per_thread = [1 if i < count else 0 for i in range(len(threads))]
+    for _ in range(count - sum(per_thread)):
+        per_thread[rng.randrange(len(threads))] += 1
+    totals = {conversation.pk: total for (conversation, _, _), total in zip(threads, per_thread)}
+    others = {conversation.pk: (tenant_id, staff_id) for conversation, tenant_id, staff_id in threads}
+
+    def rows():
+        for (conversation, tenant_id, staff_id), total in zip(threads, per_thread):
+            for n in range(total):
+                # The tenant opens the thread and the two take turns
+                yield Message(
+                    conversation=conversation, sender_id=tenant_id if n % 2 == 0 else staff_id,
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                )
+
+    last = {}
+    seen = {}
+    cursors = {}  # (conversation id, user id) -> id of the message before the first one they haven't read
+    # Only the last message of each thread is kept in memory, not all of them
+    for batch in _insert_batches(Message, rows(), progress):
+        for message in batch:
+            conversation_id = message.conversation_id
+            position = seen[conversation_id] = seen.get(conversation_id, 0) + 1
+            tenant_id, staff_id = others[conversation_id]
+            recipient = staff_id if message.sender_id == tenant_id else tenant_id
+            # The tail of each thread is still unread for whoever it was sent to
+            if position > totals[conversation_id] - UNREAD_TAIL and (conversation_id, recipient) not in cursors:
+                previous = last.get(conversation_id)
+                cursors[conversation_id, recipient] = previous.pk if previous else 0
+            last[conversation_id] = message
+
+    summaries = []
+    members = []
+    states = []
+    Membership = Conversation.participants.through
+    for conversation, tenant_id, staff_id in threads:
+        message = last.get(conversation.pk)
+        if message is not None:
+            conversation.last_message = message
+            conversation.last_message_preview = message.content[:255]
+            conversation.last_message_sender_id = message.sender_id
+            conversation.last_message_at = message.created_at
+            conversation.updated_at = message.created_at
+            summaries.append(conversation)
+        for user_id in (tenant_id, staff_id):
+            members.append(Membership(conversation_id=conversation.pk, user_id=user_id))
+            cursor = cursors.get((conversation.pk, user_id), message.pk if message is not None else 0)
+            states.append(ConversationParticipant(
+                conversation=conversation, user_id=user_id, last_read_message_id=cursor,
+            ))
+    # bulk_update writes the attributes as set, so updated_at keeps the last message's time
+    for batch in _batches(summaries):
+        Conversation.objects.bulk_update(batch, [
+            'last_message', 'last_message_preview', 'last_message_sender', 'last_message_at', 'updated_at',
+        ])
+    _insert(Membership, members)
+    _insert(ConversationParticipant, states)
+
+
+def _notifications(rng, count, tenant_ids, reservations):
+    types = [choice for choice, _ in Notification.NOTIFICATION_TYPES if choice != 'new_reservation']
+    for index in range(count):
+        reservation = rng.choice(reservations)
+        yield Notification(
+            user_id=_pick(rng, tenant_ids, index), notification_type=rng.choice(types), reservation=reservation,
+            message=f'Update on your reservation for Unit {reservation.apartment.unit_number}.',
+            is_read=rng.random() < 0.7,
+        )
+
+
+def is_seeded(using='default'):
+    return User.objects.using(using).filter(username__startswith=USERNAME_PREFIX).exists()
+
+
+def seed(preset, seed=1, progress=None):
+    """
+    Generate the ``preset`` dataset into the default database.
+
+    Raises DatasetExists when seeded rows are already present, since the
+    result would no longer be deterministic. ``progress(kind, rows_so_far)``
+    is called after every batch.
+    """
+    sizes = PRESETS[preset]
+    if is_seeded():
+        raise DatasetExists('This database already contains a seeded dataset; use a fresh one.')
+    rng = random.Random(seed)
+
+    with transaction.atomic():
+        users = _insert(User, _users(rng, sizes['users']), progress)
+        staff_ids = [user.pk for user in users if user.is_staff]
+        tenant_ids = [user.pk for user in users if not user.is_staff]
+
+        apartments = _insert(Apartment, _apartments(rng, sizes['apartments']), progress)
+        reservations = _insert(
+            Reservation, _reservations(rng, sizes['reservations'], tenant_ids, staff_ids, apartments), progress,
+        )
+        occupied = [apartment.pk for apartment in apartments if apartment.status == 'occupied']
+        for batch in _batches(occupied):
+            Apartment.objects.filter(pk__in=batch).update(status='occupied')
+
+        threads = list(_threads(rng, sizes['conversations'], tenant_ids, staff_ids))
+        # bulk_create sets the pks on the very objects the threads refer to
+        _insert(Conversation, [conversation for conversation, _, _ in threads], progress)
+        _seed_messages(rng, sizes['messages'], threads, progress)
+
+        notifications = _notifications(rng, sizes['notifications'], tenant_ids, reservations)
+        for _ in _insert_batches(Notification, notifications, progress):
+            pass  # nothing to keep
+
+    reindex_apartments()
+    availability.invalidate()
+    facets.invalidate()
+    stats.invalidate()
+    fragments.invalidate()
+    return sizes
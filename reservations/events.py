@@ -0,0 +1,147 @@
+"""
+Live events (new messages and notifications) for the SSE endpoint.
+
+Write paths call ``publish()``. Once the transaction commits, the event
+goes to the broker channel of every recipient (``user:<id>``). Each open
+``/events/`` stream subscribes to its user's channel and waits on an
+asyncio queue, so idle connections cost no database queries.
+
+The broker is pluggable through settings.EVENTS_BROKER (a dotted path).
+The default InMemoryBroker only reaches streams served by the same
+process. Running several ASGI workers needs a broker backed by a shared
+bus (e.g. Redis pub/sub) with the same subscribe()/unsubscribe()/publish()
+methods.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = 'reservations.events.InMemoryBroker'
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One stream's queue; events are handed over on the stream's own event loop"""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def push(self, event):
+        # Runs on self.loop. A client that stopped reading loses its oldest events, not the newest
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Next event, or None after ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Process-local pub/sub; publish() may be called from any thread"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Open a Subscription; must be called from inside the stream's event loop"""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # The stream's loop is gone; drop the subscription
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+_event_ids = itertools.count(1)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENTS_BROKER', DEFAULT_BROKER))()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def _send(user_ids, event):
+    broker = get_broker()
+    for user_id in user_ids:
+        try:
+            broker.publish(user_channel(user_id), event)
+        except Exception:
+            logger.exception('Publishing %s event failed', event['type'])
+
+
+def message_payload(message):
+    return {
+        'conversation': message.conversation_id,
+        'message': message.pk,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def notification_payload(notification):
+    return {
+        'notification_type': notification.notification_type,
+        'message': notification.message,
+        'reservation': notification.reservation_id,
+    }
+
+
+def publish(user_ids, event_type, data):
+    """Send ``data`` as an ``event_type`` event to each user in ``user_ids`` after commit"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    event = {'id': next(_event_ids), 'type': event_type, 'data': data}
+    transaction.on_commit(lambda: _send(user_ids, event))
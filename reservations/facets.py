@@ -0,0 +1,150 @@
+"""
+Facet counts for the apartment list's filter bar.
+
+The list has two kinds of filters:
+
+* narrowing filters (search, price range, availability dates), applied in
+  SQL to a base queryset;
+* facets (type, status, bedrooms, price bucket), which the filter bar
+  offers as options. A price bucket chip is a facet selection (``price``),
+  not the min/max price inputs, so the other buckets keep their counts.
+
+``cells()`` runs one grouped query over the base queryset:
+
+    SELECT apartment_type, status, bedrooms, <price bucket>, COUNT(*) ... GROUP BY 1, 2, 3, 4
+
+That result is small (one row per combination that exists) and is cached
+under a signature of the narrowing filters. It does not depend on the facet
+selection, so every type/status/bedrooms combination is answered from the
+same cache entry. ``facet_counts()`` then sums the cells in Python. Each
+facet is counted with every *other* selection applied but not its own, so
+the options show what picking them would give instead of collapsing to
+the current choice.
+
+Apartment saves and deletes, and status changes in transitions.py, bump
+the cache version.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from . import availability, replicas
+from .models import Apartment
+from .search import normalize_query
+
+VERSION_KEY = 'facets:version'
+CELLS_TIMEOUT = 60 * 10
+# [low, high) monthly price ranges; None is open-ended
+PRICE_BUCKETS = [(None, 10_000), (10_000, 20_000), (20_000, 35_000), (35_000, 60_000), (60_000, None)]
+FACETS = ('apartment_type', 'status', 'bedrooms', 'price_bucket')
+
+
+def version():
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        value = cache.get(VERSION_KEY, 1)
+    return value
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def _price_bucket():
+    whens = [
+        When(price_per_month__lt=high, then=Value(index))
+        for index, (_, high) in enumerate(PRICE_BUCKETS) if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def signature(search='', min_price=None, max_price=None, available_from=None, available_to=None):
+    """Cache key part for a set of narrowing filters, identical for equivalent requests"""
+    parts = [normalize_query(search), min_price, max_price, available_from, available_to]
+    if available_from:
+        # Availability also depends on the tenancies, which apartment saves don't cover
+        parts.append(availability.version())
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def cells(queryset, key):
+    """[(apartment_type, status, bedrooms, price_bucket, count)] for ``queryset``, cached under ``key``"""
+    cache_key = f'facets:{version()}:{key}'
+    rows = cache.get(cache_key)
+    if rows is None:
+        # Cached for everyone: counted on the primary (see replicas.primary_reads)
+        with replicas.primary_reads():
+            rows = list(
+                queryset.order_by().annotate(price_bucket=_price_bucket())
+                .values_list(*FACETS).annotate(count=Count('pk')).order_by()
+            )
+        cache.set(cache_key, rows, CELLS_TIMEOUT)
+    return rows
+
+
+def facet_counts(rows, selected):
+    """
+    ``({facet: {value: count}}, total)`` for the facet values in ``selected``
+    (facet name -> value, or None when not filtered).
+
+    ``total`` is the number of units matching every selection.
+    """
+    counts = {facet: {} for facet in FACETS}
+    total = 0
+    for *values, count in rows:
+        values = dict(zip(FACETS, values))
+        misses = [facet for facet in FACETS if selected.get(facet) is not None and values[facet] != selected[facet]]
+        if not misses:
+            total += count
+        for facet in FACETS:
+            # A facet ignores its own selection: only a miss on another facet excludes the cell
+            if not misses or misses == [facet]:
+                counts[facet][values[facet]] = counts[facet].get(values[facet], 0) + count
+    return counts, total
+
+
+def bucket_filter(index):
+    """Q for the apartments in price bucket ``index``"""
+    low, high = PRICE_BUCKETS[index]
+    q = Q()
+    if low is not None:
+        q &= Q(price_per_month__gte=low)
+    if high is not None:
+        q &= Q(price_per_month__lt=high)
+    return q
+
+
+def options(counts, selected):
+    """Filter bar options per facet: [{'value', 'label', 'count', 'selected'}], in display order"""
+    def option(facet, value, label):
+        return {
+            'value': value, 'label': label, 'count': counts[facet].get(value, 0),
+            'selected': selected.get(facet) == value,
+        }
+
+    bedrooms = sorted(set(counts['bedrooms']) | ({selected['bedrooms']} if selected.get('bedrooms') is not None else set()))
+    return {
+        'apartment_type': [option('apartment_type', value, label) for value, label in Apartment.APARTMENT_TYPES],
+        'status': [option('status', value, label) for value, label in Apartment.STATUS_CHOICES],
+        'bedrooms': [
+            option('bedrooms', value, 'Studio' if value == 0 else f"{value} bedroom{'s' if value != 1 else ''}")
+            for value in bedrooms
+        ],
+        'price_bucket': [
+            dict(option('price_bucket', index, _bucket_label(low, high)), low=low, high=high)
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def _bucket_label(low, high):
+    if low is None:
+        return f'Under ₱{high:,}'
+    if high is None:
+        return f'₱{low:,}+'
+    return f'₱{low:,} – ₱{high:,}'
@@ -1,8 +1,16 @@
+import logging
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from . import jobs
+from .availability import available_apartments, is_available
+from .images import refresh_variants
 from .models import Apartment, Reservation, Tenant
 
+logger = logging.getLogger(__name__)
+
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(required=True)
     first_name = forms.CharField(required=True)
@@ -35,32 +43,96 @@ class ApartmentForm(forms.ModelForm):
             'price_per_month': forms.NumberInput(attrs={'class': 'form-input'}),
             'description': forms.Textarea(attrs={'class': 'form-input', 'rows': 4}),
         }
+    
+    def save(self, commit=True):
+        apartment = super().save(commit=commit)
+        # New or cleared upload: render the thumbnail/WebP variants now (with commit=False the caller must)
+        if commit and 'image' in self.changed_data:
+            if settings.BACKGROUND_JOBS:
+                # Pages show the original image until the worker has built them
+                jobs.enqueue('images.refresh_variants', apartment_id=apartment.pk)
+                return apartment
+            try:
+                refresh_variants(apartment)
+            except Exception:
+                # Pages fall back to the original image until `manage.py backfill_image_variants` runs
+                logger.exception('Could not build image variants for apartment %s', apartment.pk)
+        return apartment
 
 class ReservationForm(forms.ModelForm):
     class Meta:
         model = Reservation
-        fields = ['apartment', 'check_in', 'special_requests']
+        fields = ['apartment', 'check_in', 'check_out', 'special_requests']
         widgets = {
             'apartment': forms.Select(attrs={'class': 'form-select searchable-select'}),
             'check_in': forms.DateInput(attrs={'class': 'form-input', 'type': 'date'}),
+            'check_out': forms.DateInput(attrs={'class': 'form-input', 'type': 'date'}),
             'special_requests': forms.Textarea(attrs={'class': 'form-input', 'rows': 3, 'placeholder': 'Any specific requests?'}),
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Show ALL available apartments
-        self.fields['apartment'].queryset = Apartment.objects.filter(status='available')
+        # Units free for the requested stay, whatever their current status (an occupied unit can
+        # be booked from when its tenancy ends); every bookable unit until the dates are known
+        check_in, check_out = self._requested_stay()
+        if check_in:
+            apartments = available_apartments(Apartment.objects.all(), check_in, check_out)
+            if self.instance.apartment_id:
+                # Its own tenancy doesn't block an edit; clean() checks the others
+                apartments = apartments | Apartment.objects.filter(pk=self.instance.apartment_id)
+        else:
+            apartments = Apartment.objects.exclude(status='maintenance')
+        self.fields['apartment'].queryset = apartments
+        self.fields['apartment'].error_messages['invalid_choice'] = (
+            'That unit is already booked for part of those dates or is under maintenance.'
+        )
         # Custom label for the dropdown
         self.fields['apartment'].label_from_instance = lambda obj: f"Unit {obj.unit_number} - {obj.name} (₱{obj.price_per_month}/mo)"
+        self.fields['check_out'].help_text = 'Leave blank if you have no move-out date yet.'
+    
+    def _requested_stay(self):
+        """(check_in, check_out) from the submitted or initial data; None where missing or malformed"""
+        dates = []
+        for name in ('check_in', 'check_out'):
+            value = self.data.get(self.add_prefix(name)) if self.is_bound else self.initial.get(name)
+            try:
+                dates.append(self.fields[name].to_python(value))
+            except forms.ValidationError:
+                dates.append(None)
+        check_in, check_out = dates
+        if check_out and check_in and check_out <= check_in:
+            check_out = None
+        return check_in, check_out
     
     def clean_apartment(self):
         apartment = self.cleaned_data.get('apartment')
         
-        # Check if apartment is still available
-        if apartment and apartment.status != 'available':
+        # Booked dates are checked in clean(); only maintenance takes a unit off the market
+        if apartment and apartment.status == 'maintenance':
             raise forms.ValidationError(
                 f"Unit {apartment.unit_number} is no longer available. "
                 f"Current status: {apartment.get_status_display()}"
             )
         
-        return apartment
\ No newline at end of file
+        return apartment
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        apartment = cleaned_data.get('apartment')
+        check_in = cleaned_data.get('check_in')
+        check_out = cleaned_data.get('check_out')
+        
+        if check_in and check_out and check_out <= check_in:
+            self.add_error('check_out', 'Move-out date must be after the move-in date.')
+            return cleaned_data
+        
+        # Reject stays that overlap an approved tenancy of the same unit
+        if apartment and check_in:
+            current = self.instance if self.instance.pk else None
+            if not is_available(apartment, check_in, check_out, exclude_reservation=current):
+                self.add_error(
+                    'check_in',
+                    f"Unit {apartment.unit_number} is already booked for part of those dates."
+                )
+        
+        return cleaned_data
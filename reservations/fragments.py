@@ -0,0 +1,42 @@
+"""
+Rendered-fragment cache for the list cards.
+
+apartment_list.html and reservation_card.html wrap each card in Django's
+``{% cache %}`` tag. The key is the object's pk and ``updated_at``, the
+viewer's role (``user.is_staff``) and ``cards_version``:
+
+* saving the object changes ``updated_at``. Queryset updates in
+  transitions.py and images.py set it explicitly;
+* ``cards_version`` covers what a card shows from *other* rows (the
+  apartment on a reservation card, tenant/reviewer names). Apartment and
+  user saves bump it (signals.py).
+
+Per-user parts (CSRF tokens, action buttons) stay outside the cached block.
+The views load the card rows under ``replicas.primary_reads()``: a card
+rendered from a lagging replica would be cached under the new version.
+"""
+from django.core.cache import cache
+
+VERSION_KEY = 'cards:version'
+# Keys change on every edit, so stale fragments are never read; this only bounds their lifetime
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def version():
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        value = cache.get(VERSION_KEY, 1)
+    return value
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def context():
+    """Template context the cached cards need"""
+    return {'cards_version': version(), 'card_cache_timeout': FRAGMENT_TIMEOUT}
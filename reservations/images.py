@@ -0,0 +1,121 @@
+"""
+Responsive variants for Apartment.image.
+
+When an image is uploaded (ApartmentForm.save, or the
+``backfill_image_variants`` command for existing rows), ``refresh_variants()``
+renders it with Pillow at each of VARIANT_WIDTHS, in WebP plus a JPEG
+fallback. It also makes a tiny blurred placeholder, inlined as a data URI.
+Variants are written through the same storage backend as the original
+(Cloudinary in production, the filesystem locally). Their names are
+recorded in Apartment.image_variants:
+
+    {'source': 'apartments/a.jpg', 'width': 2400, 'placeholder': 'data:image/webp;base64,...',
+     'variants': [{'width': 320, 'webp': 'apartments/variants/...', 'jpeg': '...'}, ...]}
+
+Templates render them with the ``{% apartment_image %}`` tag
+(templatetags/images.py), which emits srcset/sizes markup.
+"""
+import base64
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from .models import Apartment
+
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+VARIANT_DIR = 'apartments/variants'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+PLACEHOLDER_WIDTH = 16
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    data = base64.b64encode(_encode(tiny, 'WEBP', quality=40)).decode('ascii')
+    return f'data:image/webp;base64,{data}'
+
+
+def _open(field):
+    field.open('rb')
+    try:
+        image = Image.open(field)
+        image.load()
+    finally:
+        field.close()
+    # Honour camera rotation, and flatten transparency/palettes for JPEG
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def delete_variants(variants, storage):
+    for variant in (variants or {}).get('variants', ()):
+        for fmt in ('webp', 'jpeg'):
+            if variant.get(fmt):
+                storage.delete(variant[fmt])
+
+
+def build_variants(field):
+    """Render every variant of an image field and return the image_variants dict"""
+    storage = field.storage
+    image = _open(field)
+    stem = os.path.splitext(os.path.basename(field.name))[0]
+    # The source name is part of the file name, so a re-upload never reuses cached URLs
+    digest = hashlib.sha1(field.name.encode()).hexdigest()[:8]
+
+    # Never upscale: widths beyond the original collapse into one full-width variant
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    variants = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        base = f'{VARIANT_DIR}/{stem}-{digest}-{width}w'
+        variants.append({
+            'width': width,
+            'webp': storage.save(f'{base}.webp', ContentFile(_encode(resized, 'WEBP', quality=WEBP_QUALITY, method=4))),
+            'jpeg': storage.save(f'{base}.jpg', ContentFile(
+                _encode(resized, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            )),
+        })
+
+    return {
+        'source': field.name,
+        'width': image.width,
+        'placeholder': _placeholder(image),
+        'variants': variants,
+    }
+
+
+def variants_are_current(apartment):
+    return bool(apartment.image) and apartment.image_variants.get('source') == apartment.image.name
+
+
+def refresh_variants(apartment):
+    """
+    (Re)generate the variants for the apartment's current image, replacing old ones.
+
+    Saved with a queryset update so the save signals (search index, stats) don't fire again.
+    """
+    storage = apartment.image.storage
+    old = apartment.image_variants
+    variants = build_variants(apartment.image) if apartment.image else {}
+    # Touch updated_at too: it keys the cached apartment cards (fragments.py)
+    now = timezone.now()
+    Apartment.objects.filter(pk=apartment.pk).update(image_variants=variants, updated_at=now)
+    apartment.image_variants = variants
+    apartment.updated_at = now
+    if old and old != variants:
+        delete_variants(old, storage)
+    return variants
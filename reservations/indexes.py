@@ -0,0 +1,363 @@
+"""
+Index advisor (``advise_indexes`` command), driven by a real workload.
+
+1. Capture. While a workload runs (the benchmark suite, a replayed request
+   trace or both, see benchmarks.py) every SELECT, UPDATE and DELETE is
+   recorded: grouped by fingerprint (profiling.fingerprint), with one
+   sample of its SQL and parameters and how often it ran.
+2. Explain. Each distinct statement is EXPLAINed (``EXPLAIN QUERY PLAN`` on
+   SQLite, ``EXPLAIN (FORMAT JSON)`` on PostgreSQL) to find the tables it
+   reads in full and whether it needs a separate sort, and which indexes
+   it uses.
+3. Candidates. For every table a statement reads, its own predicates on
+   it suggest indexes: the columns compared with ``=``/``IN`` and boolean
+   flags, then a range column or the ORDER BY columns. Candidates that an
+   existing index already starts with are dropped. A statement that
+   already uses an index can still gain from a wider one (``user_id`` then
+   ``is_read``, or one that also returns the rows in ORDER BY order), so
+   this doesn't only look at full scans; step 4 decides.
+4. Benefit. Each candidate is created inside a transaction that is rolled
+   back. Every statement it was suggested for is EXPLAINed and timed again
+   (inside a rolled-back savepoint, so UPDATE and DELETE can run too). The
+   benefit is the time saved per execution, times the executions in the
+   workload, counting only statements whose plan picked the index up. The
+   extra cost an index adds to writes is not measured; ``min_benefit``
+   keeps marginal ones out.
+
+The best candidates become an AddIndex migration, once the models declare
+them in Meta.indexes (makemigrations would otherwise remove them again;
+the report prints the lines to add). Existing plain indexes
+(not primary keys or unique constraints) that no plan used are reported
+as unused: candidates for removal, if the workload is representative.
+"""
+import hashlib
+import json
+import re
+import statistics
+import time
+
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.db.migrations import AddIndex, Migration
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from .profiling import fingerprint
+
+APP_LABEL = 'reservations'
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+MAX_COLUMNS = 3
+TIMING_REPEAT = 5
+DEFAULT_MIN_BENEFIT_MS = 1.0
+CANDIDATE_INDEX = 'index_advisor_candidate'
+
+_KEYWORDS = {'INNER', 'LEFT', 'RIGHT', 'OUTER', 'CROSS', 'JOIN', 'ON', 'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'SET'}
+_TABLE_RE = re.compile(r'(?:FROM|JOIN|UPDATE)\s+"(\w+)"(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_REF = r'(?:"(\w+)"|\b([A-Z]\d+))\."(\w+)"'
+_PREDICATE_RE = re.compile(_REF + r'\)?\s*(=|IN\s*\(|<=|>=|<|>|BETWEEN)', re.IGNORECASE)
+# A boolean field filtered on its own: ``NOT "t"."is_read"`` or ``"t"."is_read" AND ...``
+_FLAG_RE = re.compile(r'(?:\bNOT\s+|\(\s*|\bAND\s+)' + _REF + r'(?=\s*\)|\s+AND\b|\s+OR\b)', re.IGNORECASE)
+_ORDER_BY_RE = re.compile(r'ORDER BY (.+?)(?:\s+LIMIT\b|\)|$)', re.IGNORECASE)
+_SQLITE_SCAN_RE = re.compile(r'^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+_SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+class UndeclaredIndexes(Exception):
+    pass
+
+
+class Statement:
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.fingerprint = fingerprint(sql)
+        self.count = 0
+        self.plan = None
+        self.ms = None  # median time without new indexes
+
+    @property
+    def aliases(self):
+        """alias -> table for every table the statement reads"""
+        found = {}
+        for table, alias in _TABLE_RE.findall(self.sql):
+            found[table] = table
+            if alias and alias.upper() not in _KEYWORDS:
+                found[alias] = table
+        return found
+
+
+class WorkloadRecorder:
+    """execute_wrapper that collects the distinct statements a workload runs"""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED):
+            key = fingerprint(sql)
+            statement = self.statements.get(key)
+            if statement is None:
+                statement = self.statements[key] = Statement(sql, params)
+            statement.count += 1
+        return execute(sql, params, many, context)
+
+
+class Plan:
+    def __init__(self):
+        self.scanned = set()  # aliases read in full
+        self.sorted = False
+        self.indexes = set()
+
+
+def explain(statement):
+    plan = Plan()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement.sql, statement.params)
+            for row in cursor.fetchall():
+                _read_sqlite_step(row[-1], plan)
+        else:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + statement.sql, statement.params)
+            document = cursor.fetchone()[0]
+            document = json.loads(document) if isinstance(document, str) else document
+            _read_postgres_node(document[0]['Plan'], plan)
+    return plan
+
+
+def _read_sqlite_step(detail, plan):
+    if detail.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in detail:
+        plan.sorted = True
+        return
+    match = _SQLITE_SCAN_RE.match(detail)
+    if not match:
+        return
+    kind, table, alias, rest = match.groups()
+    index = _SQLITE_INDEX_RE.search(rest)
+    if 'AUTOMATIC' in rest or (kind == 'SCAN' and not index):
+        # A full scan, or SQLite building a throwaway index for this one query
+        plan.scanned.add(alias or table)
+    elif index:
+        plan.indexes.add(index.group(1))
+
+
+def _read_postgres_node(node, plan):
+    if node['Node Type'] == 'Seq Scan':
+        plan.scanned.add(node.get('Alias') or node['Relation Name'])
+    elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+        plan.sorted = True
+    if 'Index Name' in node:
+        plan.indexes.add(node['Index Name'])
+    for child in node.get('Plans', []):
+        _read_postgres_node(child, plan)
+
+
+def _time(statement):
+    """Median milliseconds over TIMING_REPEAT runs, each rolled back"""
+    timings = []
+    with connection.cursor() as cursor:
+        for _ in range(TIMING_REPEAT + 1):
+            with transaction.atomic():
+                started = time.perf_counter()
+                cursor.execute(statement.sql, statement.params)
+                if cursor.description:
+                    cursor.fetchall()
+                timings.append(time.perf_counter() - started)
+                transaction.set_rollback(True)
+    return statistics.median(timings[1:]) * 1000
+
+
+def existing_indexes():
+    """table -> {index name: (columns, plain)}; plain means not a primary key or unique constraint"""
+    indexes = {}
+    with connection.cursor() as cursor:
+        for model in apps.get_models(include_auto_created=True):
+            table = model._meta.db_table
+            constraints = connection.introspection.get_constraints(cursor, table)
+            indexes[table] = {
+                name: (tuple(info['columns']), not (info['primary_key'] or info['unique']))
+                for name, info in constraints.items()
+                if info['index'] or info['primary_key'] or info['unique']
+            }
+    return indexes
+
+
+def _predicates(sql, alias):
+    """(equality columns, range columns, order by columns) the statement applies to ``alias``"""
+    equal, ranged = [], []
+    for quoted, bare, column, operator in _PREDICATE_RE.findall(sql):
+        if (quoted or bare) != alias:
+            continue
+        target = equal if operator == '=' or operator.upper().startswith('IN') else ranged
+        if column not in equal and column not in ranged:
+            target.append(column)
+    # Flags go after the real comparisons: they split the rows only in two
+    for quoted, bare, column in _FLAG_RE.findall(sql):
+        if (quoted or bare) == alias and column not in equal and column not in ranged:
+            equal.append(column)
+    order = []
+    for clause in _ORDER_BY_RE.findall(sql):
+        refs = re.findall(_REF, clause)
+        # Only an ORDER BY entirely on this table can be served by one of its indexes
+        if refs and all((quoted or bare) == alias for quoted, bare, _ in refs):
+            order = [column for _, _, column in refs]
+    return equal, ranged, order
+
+
+def _candidate_columns(statement, alias, table, existing):
+    equal, ranged, order = _predicates(statement.sql, alias)
+    options = [equal + ranged[:1], equal]
+    if order:
+        options.append(equal + order)
+    found = []
+    for columns in options:
+        columns = tuple(dict.fromkeys(columns))[:MAX_COLUMNS]
+        if connection.vendor == 'sqlite' and columns[-1:] == ('id',):
+            # Every SQLite index already ends with the rowid
+            columns = columns[:-1]
+        if not columns or columns[0] == 'id' or columns in found:
+            continue
+        # Already served by an index that starts with these columns
+        if any(indexed[:len(columns)] == columns for indexed, _ in existing.get(table, {}).values()):
+            continue
+        found.append(columns)
+    return found
+
+
+class Candidate:
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.statements = []
+        self.helped = []  # (statement, ms before, ms after)
+
+    @property
+    def saved_ms(self):
+        """Time saved over the whole workload"""
+        return sum((before - after) * statement.count for statement, before, after in self.helped)
+
+    @property
+    def model(self):
+        for model in apps.get_models(include_auto_created=True):
+            if model._meta.db_table == self.table:
+                return model
+        return None
+
+    @property
+    def writable(self):
+        """Whether write_migration can add it: a model of this app, not an auto-created m2m table"""
+        return self.model._meta.app_label == APP_LABEL and not self.model._meta.auto_created
+
+    def fields(self):
+        by_column = {field.column: field.name for field in self.model._meta.concrete_fields}
+        return [by_column[column] for column in self.columns]
+
+    def index(self):
+        fields = self.fields()
+        digest = hashlib.sha1(f'{self.table}:{",".join(self.columns)}'.encode()).hexdigest()[:6]
+        # Django index names are at most 30 characters
+        name = f"{self.model._meta.model_name[:8]}_{'_'.join(fields)}"[:19].rstrip('_')
+        return models.Index(fields=fields, name=f'{name}_{digest}_idx')
+
+    def declaration(self):
+        """The line to add to the model's Meta.indexes"""
+        index = self.index()
+        return f'{self.model.__name__}: models.Index(fields={index.fields!r}, name={index.name!r})'
+
+
+def _measure(candidate):
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX {quote(CANDIDATE_INDEX)} ON {quote(candidate.table)} '
+                f'({", ".join(quote(column) for column in candidate.columns)})'
+            )
+            if connection.vendor == 'sqlite':
+                # Give the planner statistics for the new index too
+                cursor.execute(f'ANALYZE {quote(CANDIDATE_INDEX)}')
+        for statement in candidate.statements:
+            if CANDIDATE_INDEX in explain(statement).indexes:
+                after = _time(statement)
+                if after < statement.ms:
+                    candidate.helped.append((statement, statement.ms, after))
+        transaction.set_rollback(True)
+
+
+class Advice:
+    def __init__(self, statements):
+        self.statements = statements
+        self.candidates = []
+        self.recommended = []
+        self.unused = []  # (table, index name, columns)
+
+
+def advise(statements, min_benefit=DEFAULT_MIN_BENEFIT_MS, progress=None):
+    """Explain and measure the captured ``statements`` (WorkloadRecorder.statements.values()); returns Advice"""
+    statements = list(statements)
+    advice = Advice(statements)
+    with connection.cursor() as cursor:
+        # Fresh planner statistics, as a production database would have
+        cursor.execute('ANALYZE')
+    existing = existing_indexes()
+    used = set()
+    candidates = {}
+    for statement in statements:
+        statement.plan = explain(statement)
+        used |= statement.plan.indexes
+        for alias, table in statement.aliases.items():
+            for columns in _candidate_columns(statement, alias, table, existing):
+                candidate = candidates.setdefault((table, columns), Candidate(table, columns))
+                if statement not in candidate.statements:
+                    candidate.statements.append(statement)
+
+    for number, candidate in enumerate(candidates.values(), 1):
+        for statement in candidate.statements:
+            if statement.ms is None:
+                statement.ms = _time(statement)
+        _measure(candidate)
+        if progress:
+            progress(number, len(candidates), candidate)
+    advice.candidates = sorted(candidates.values(), key=lambda candidate: -candidate.saved_ms)
+
+    for candidate in advice.candidates:
+        if candidate.saved_ms < min_benefit or candidate.model is None:
+            continue
+        # One of two indexes where one is a prefix of the other covers both
+        overlaps = [
+            chosen for chosen in advice.recommended if chosen.table == candidate.table
+            and (chosen.columns[:len(candidate.columns)] == candidate.columns
+                 or candidate.columns[:len(chosen.columns)] == chosen.columns)
+        ]
+        if not overlaps:
+            advice.recommended.append(candidate)
+
+    for table, indexes in existing.items():
+        for name, (columns, plain) in indexes.items():
+            if plain and name not in used:
+                advice.unused.append((table, name, columns))
+    return advice
+
+
+def write_migration(candidates, name='index_advisor'):
+    """An AddIndex migration for ``candidates`` in this app; returns its path"""
+    candidates = [candidate for candidate in candidates if candidate.writable]
+    # makemigrations compares the migrations with the models, so an index they don't declare would be removed
+    undeclared = [candidate for candidate in candidates if candidate.index() not in candidate.model._meta.indexes]
+    if undeclared:
+        raise UndeclaredIndexes(
+            "Add these to the models' Meta.indexes first, or makemigrations will remove them:\n"
+            + '\n'.join(f'  {candidate.declaration()}' for candidate in undeclared)
+        )
+    operations = [
+        AddIndex(model_name=candidate.model._meta.model_name, index=candidate.index()) for candidate in candidates
+    ]
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    leaves = loader.graph.leaf_nodes(APP_LABEL)
+    number = max(int(leaf[1].split('_')[0]) for leaf in leaves) + 1 if leaves else 1
+    migration = Migration(f'{number:04d}_{name}', APP_LABEL)
+    migration.dependencies = leaves
+    migration.operations = operations
+    writer = MigrationWriter(migration)
+    with open(writer.path, 'w') as f:
+        f.write(writer.as_string())
+    return writer.path
@@ -0,0 +1,265 @@
+"""
+A durable background job queue in the main database (``runworker`` command).
+
+Code enqueues work by name::
+
+    @jobs.register('images.refresh_variants', max_attempts=3)
+    def refresh_apartment_variants(apartment_id): ...
+
+    jobs.enqueue('images.refresh_variants', apartment_id=apartment.pk)
+
+The Job row is written in the caller's transaction, so work queued by a
+request that rolls back never runs. Keyword arguments must be JSON.
+``run_at`` or ``delay`` schedules a job for later, and a ``key`` keeps a
+second copy out while one is queued or running.
+
+Workers claim due jobs oldest first:
+
+* PostgreSQL: ``SELECT ... FOR UPDATE SKIP LOCKED`` in a short transaction,
+  then mark them running; workers never wait on each other's rows;
+* SQLite (no row locks): a compare-and-swap ``UPDATE ... WHERE status =
+  'queued'`` per candidate; whichever worker's update matches owns the job.
+  SQLite serializes the writes, so two workers can't both match.
+
+A failed job is retried after a backoff of JOB_RETRY_BASE_SECONDS * 2 **
+(attempts - 1), capped at JOB_RETRY_MAX_SECONDS and jittered, until
+``max_attempts``; then it stays ``failed`` with its traceback. While a job
+runs, a heartbeat thread renews its lease (JOB_LEASE_SECONDS) every third
+of it, so a long job isn't handed to a second worker. A job whose worker
+died stops being renewed and stays ``running`` until the lease expires;
+maintenance() then queues it again (claiming counts as an attempt, so that
+ends too). maintenance() also enqueues JOB_SCHEDULE's periodic jobs and
+deletes finished jobs after JOB_KEEP_DAYS.
+"""
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_worker_numbers = itertools.count(1)
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def register(name, max_attempts=5, queue='default'):
+    """Decorator registering a function as the job ``name``"""
+    def decorator(func):
+        _registry[name] = (func, max_attempts, queue)
+        return func
+    return decorator
+
+
+def enqueue(name, run_at=None, delay=None, key=None, **kwargs):
+    """Queue the job ``name`` with ``kwargs``; returns the Job (the existing one if ``key`` is taken)"""
+    if name not in _registry:
+        raise UnknownJob(f'No job is registered as {name!r}.')
+    _, max_attempts, queue = _registry[name]
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    job = Job(name=name, kwargs=kwargs, queue=queue, key=key, run_at=run_at, max_attempts=max_attempts)
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.get(key=key, status__in=Job.ACTIVE)
+    return job
+
+
+def _due(queues, now):
+    return Job.objects.filter(status='queued', queue__in=queues, run_at__lte=now).order_by('run_at', 'pk')
+
+
+def claim(worker, queues=('default',), limit=1, now=None):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return them"""
+    now = now or timezone.now()
+    claimed = {
+        'status': 'running', 'locked_by': worker, 'locked_at': now, 'started_at': now, 'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(_due(queues, now).select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**claimed)
+    else:
+        pks = []
+        # A few spares, in case another worker wins some of them
+        for pk in _due(queues, now).values_list('pk', flat=True)[:limit * 4]:
+            # Still due: the job may have been requeued for later since the candidates were read
+            if Job.objects.filter(pk=pk, status='queued', run_at__lte=now).update(**claimed):
+                pks.append(pk)
+                if len(pks) == limit:
+                    break
+    return list(Job.objects.filter(pk__in=pks, locked_by=worker).order_by('run_at', 'pk'))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times"""
+    seconds = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+    # Jitter, so jobs that failed together don't all retry together
+    return seconds * random.uniform(0.5, 1.0)
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's lease every third of JOB_LEASE_SECONDS until stopped"""
+
+    def __init__(self, job):
+        super().__init__(name=f'job-{job.pk}-heartbeat', daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_LEASE_SECONDS / 3):
+                try:
+                    Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by, status='running').update(
+                        locked_at=timezone.now()
+                    )
+                except DatabaseError:
+                    # e.g. a locked database; the next beat tries again before the lease runs out
+                    logger.warning('Could not renew the lease of job %s #%s', self.job.name, self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def execute(job, now=None):
+    """Run a claimed job and record the outcome; returns True if it succeeded"""
+    # Updates only apply while the job is still ours (its lease may have expired meanwhile)
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status='running')
+    if job.name not in _registry:
+        mine.update(status='failed', last_error=f'No job is registered as {job.name!r}.', finished_at=now or timezone.now())
+        return False
+    heartbeat = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        try:
+            _registry[job.name][0](**job.kwargs)
+        finally:
+            heartbeat.stop()
+    except Exception:
+        logger.warning('Job %s #%s failed (attempt %s of %s)', job.name, job.pk, job.attempts, job.max_attempts)
+        now = now or timezone.now()
+        if job.attempts < job.max_attempts:
+            mine.update(status='queued', last_error=traceback.format_exc(), locked_by='', locked_at=None,
+                        run_at=now + timedelta(seconds=backoff(job.attempts)))
+        else:
+            mine.update(status='failed', last_error=traceback.format_exc(), finished_at=now)
+        return False
+    mine.update(status='done', finished_at=now or timezone.now())
+    return True
+
+
+def maintenance(now=None):
+    """Requeue jobs whose worker died, enqueue due periodic jobs and purge old finished ones"""
+    now = now or timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - timedelta(seconds=settings.JOB_LEASE_SECONDS))
+    # Claiming counted the attempt, so a job that keeps killing its worker runs out of attempts too
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', last_error='The worker running it stopped.', finished_at=now,
+    )
+    requeued = stale.update(status='queued', locked_by='', locked_at=None)
+    for name, seconds in settings.JOB_SCHEDULE.items():
+        key = f'schedule:{name}'
+        last = Job.objects.filter(key=key).exclude(status__in=Job.ACTIVE).order_by('-finished_at').first()
+        enqueue(name, key=key, run_at=last.finished_at + timedelta(seconds=seconds) if last else now)
+    purged, _ = Job.objects.filter(
+        status__in=('done', 'failed'), finished_at__lt=now - timedelta(days=settings.JOB_KEEP_DAYS),
+    ).delete()
+    return requeued, purged
+
+
+class Worker:
+    """Claims and runs jobs one at a time until ``stop`` is set"""
+
+    def __init__(self, queues=('default',), poll=1.0, stop=None, name=None):
+        self.queues = tuple(queues)
+        self.poll = poll
+        self.stop = stop or threading.Event()
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{next(_worker_numbers)}'
+        self.done = self.failed = 0
+
+    def run_once(self, now=None):
+        """Run the jobs due now; returns how many ran"""
+        ran = 0
+        while not self.stop.is_set():
+            claimed = claim(self.name, self.queues, now=now)
+            if not claimed:
+                break
+            for job in claimed:
+                if execute(job, now=now):
+                    self.done += 1
+                else:
+                    self.failed += 1
+                ran += 1
+        return ran
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                try:
+                    ran = self.run_once()
+                except Exception:
+                    # e.g. the database is away or locked; try again after the poll interval
+                    logger.exception('Worker %s could not claim jobs', self.name)
+                    ran = 0
+                close_old_connections()
+                if not ran:
+                    self.stop.wait(self.poll)
+        finally:
+            connection.close()
+
+
+def metrics(now=None):
+    """Queue depth and latency, for monitoring"""
+    now = now or timezone.now()
+    depth = {
+        (row['queue'], row['status']): row['count']
+        for row in Job.objects.values('queue', 'status').annotate(count=Count('pk')).order_by()
+    }
+    due = Job.objects.filter(status='queued', run_at__lte=now)
+    oldest = due.aggregate(oldest=Min('run_at'))['oldest']
+    recent = Job.objects.filter(started_at__gte=now - timedelta(hours=1), started_at__isnull=False)
+    waits, runs = [], []
+    for run_at, started_at, finished_at in recent.values_list('run_at', 'started_at', 'finished_at').iterator():
+        waits.append((started_at - run_at).total_seconds())
+        if finished_at:
+            runs.append((finished_at - started_at).total_seconds())
+    return {
+        'depth': depth,
+        'due': due.count(),
+        'oldest_due_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+        'wait_seconds': _summary(waits),
+        'run_seconds': _summary(runs),
+    }
+
+
+def _summary(values):
+    """p50/p95/max of a list of seconds (nearest rank)"""
+    if not values:
+        return {'count': 0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[max(1, -(-p * len(ordered) // 100)) - 1]
+    return {'count': len(ordered), 'p50': rank(50), 'p95': rank(95), 'max': ordered[-1]}
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from reservations import benchmarks, indexes
+from reservations.datasets import PRESETS
+
+
+class Command(BaseCommand):
+    help = 'Capture a workload on a seeded throwaway database, EXPLAIN it and recommend (or write) missing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=list(PRESETS), default='small', help='Dataset size (default: small)')
+        parser.add_argument(
+            '--keepdb', action='store_true', help='Keep the seeded database between runs (shared with benchmark)',
+        )
+        parser.add_argument(
+            '--trace', action='append', default=[],
+            help='Replay this request trace ("<viewer> <METHOD> <path>" per line); repeatable',
+        )
+        parser.add_argument('--no-suite', action='store_true', help="Don't run the benchmark suite, only the traces")
+        parser.add_argument(
+            '--min-benefit', type=float, default=indexes.DEFAULT_MIN_BENEFIT_MS,
+            help='Milliseconds an index must save over the workload to be recommended (default: 1)',
+        )
+        parser.add_argument('--write', action='store_true', help='Write the recommendations as a migration')
+        parser.add_argument('--name', default='index_advisor', help='Name of the written migration')
+
+    def handle(self, *args, **options):
+        try:
+            traces = [entry for path in options['trace'] for entry in benchmarks.read_trace(path)]
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if options['no_suite'] and not traces:
+            raise CommandError('Nothing to run: pass --trace or drop --no-suite.')
+
+        def progress(number, total, candidate):
+            self.stdout.write(f'  [{number}/{total}] {candidate.table} ({", ".join(candidate.columns)})')
+
+        recorder = indexes.WorkloadRecorder()
+        try:
+            with benchmarks.seeded_database(options['preset'], options['keepdb'], log=self.stdout.write):
+                self.stdout.write('Capturing the workload...')
+                with connection.execute_wrapper(recorder):
+                    if not options['no_suite']:
+                        benchmarks.run(repeat=1, warmup=0)
+                    benchmarks.replay(traces)
+                self.stdout.write(f'Explaining {len(recorder.statements)} distinct statements...')
+                advice = indexes.advise(
+                    recorder.statements.values(), options['min_benefit'],
+                    progress=progress if options['verbosity'] > 1 else None,
+                )
+        except benchmarks.DatasetMismatch as e:
+            raise CommandError(str(e))
+
+        self.report(advice)
+        if options['write'] and advice.recommended:
+            try:
+                path = indexes.write_migration(advice.recommended, options['name'])
+            except indexes.UndeclaredIndexes as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
+
+    def report(self, advice):
+        self.stdout.write(f"\n{'saved ms':>10}{'runs':>7}  index")
+        for candidate in advice.candidates:
+            if not candidate.helped:
+                continue
+            marker = '*' if candidate in advice.recommended else ' '
+            runs = sum(statement.count for statement, _, _ in candidate.helped)
+            self.stdout.write(f'{candidate.saved_ms:>10.1f}{runs:>7} {marker}{candidate.table} ({", ".join(candidate.columns)})')
+            slowest = max(candidate.helped, key=lambda helped: (helped[1] - helped[2]) * helped[0].count)
+            self.stdout.write(f'{"":>19}{slowest[1]:.2f} -> {slowest[2]:.2f} ms: {slowest[0].fingerprint[:150]}')
+        if not advice.recommended:
+            self.stdout.write('No index is worth adding for this workload.')
+        else:
+            self.stdout.write("* recommended; declare them in the models' Meta.indexes:")
+            for candidate in advice.recommended:
+                if candidate.writable:
+                    self.stdout.write(f'  {candidate.declaration()}')
+                else:
+                    self.stdout.write(f'  {candidate.table} is not a model of {indexes.APP_LABEL}; not written.')
+
+        self.stdout.write('\nIndexes no plan used:')
+        for table, name, columns in advice.unused:
+            self.stdout.write(f'  {table}.{name} ({", ".join(columns)})')
+        if not advice.unused:
+            self.stdout.write('  none')
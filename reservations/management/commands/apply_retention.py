@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reservations.retention import TABLES, apply
+
+
+class Command(BaseCommand):
+    help = 'Archive or delete read notifications and messages older than RETENTION_POLICIES allows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', action='append', choices=list(TABLES), help='Apply only this policy (repeatable)',
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.RETENTION_BATCH_SIZE, help='Rows per transaction')
+        parser.add_argument(
+            '--pause', type=float, default=0.0, help='Seconds to sleep between batches, to let other writers in',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows the policies apply to')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f'  {report.name}: {report.rows:,} rows, {report.rows_per_second:,.0f} rows/s, '
+                              f'slowest batch {report.lock_ms():.1f} ms')
+
+        for name in options['only'] or TABLES:
+            report = apply(
+                name, batch_size=options['batch_size'], pause=options['pause'], dry_run=options['dry_run'],
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+            if options['dry_run']:
+                self.stdout.write(f'{name}: {report.rows:,} rows would be {report.action}d'
+                                  if report.action != 'keep' else str(report))
+            else:
+                self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from reservations.images import refresh_variants, variants_are_current
+from reservations.models import Apartment
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive image variants for apartments uploaded before the pipeline existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are already current')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the apartments that need variants')
+
+    def handle(self, *args, **options):
+        apartments = Apartment.objects.exclude(image='').exclude(image__isnull=True).order_by('pk')
+        done = skipped = failed = 0
+        for apartment in apartments.iterator(chunk_size=100):
+            if variants_are_current(apartment) and not options['force']:
+                skipped += 1
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'Unit {apartment.unit_number}: {apartment.image.name}')
+                done += 1
+                continue
+            try:
+                variants = refresh_variants(apartment)
+            except Exception as e:
+                # A missing or corrupt original shouldn't stop the rest of the backfill
+                self.stderr.write(self.style.ERROR(f'Unit {apartment.unit_number}: {e}'))
+                failed += 1
+                continue
+            done += 1
+            self.stdout.write(f"Unit {apartment.unit_number}: {len(variants['variants'])} variants")
+
+        verb = 'Would generate' if options['dry_run'] else 'Generated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} variants for {done} apartment(s); {skipped} already current, {failed} failed.'
+        ))
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations import benchmarks
+from reservations.datasets import PRESETS
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every URL on a seeded throwaway database; fails on query budget regressions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=list(PRESETS), default='small', help='Dataset size (default: small)')
+        parser.add_argument('--repeat', type=int, default=benchmarks.DEFAULT_REPEAT, help='Measured requests per URL')
+        parser.add_argument('--warmup', type=int, default=benchmarks.DEFAULT_WARMUP, help='Unmeasured requests per URL')
+        parser.add_argument(
+            '--threshold', type=float, default=benchmarks.DEFAULT_THRESHOLD,
+            help='Allowed median slowdown against the baseline, as a ratio (default: 0.5)',
+        )
+        parser.add_argument(
+            '--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'),
+            help='Latency baseline of this machine (created by the first run)',
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument(
+            '--fail-on-latency', action='store_true',
+            help='Fail on latency regressions too, not just report them (same machine runs only)',
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true', help='Keep the seeded database between runs (seeding large takes a while)',
+        )
+        parser.add_argument('names', nargs='*', help='Only these URL names')
+
+    def handle(self, *args, **options):
+        missing = benchmarks.uncovered_urls()
+        if missing:
+            raise CommandError(f"No benchmark case or query budget for: {', '.join(missing)}")
+
+        preset = options['preset']
+        try:
+            with benchmarks.seeded_database(preset, options['keepdb'], log=self.stdout.write):
+                results = benchmarks.run(options['repeat'], options['warmup'], options['names'])
+        except benchmarks.DatasetMismatch as e:
+            raise CommandError(str(e))
+
+        baseline = benchmarks.load_baseline(options['baseline'], preset)
+        self.report(results, baseline)
+        failures = benchmarks.budget_failures(results)
+        slower = benchmarks.regressions(results, baseline, options['threshold'])
+        if options['fail_on_latency']:
+            failures += slower
+        elif slower:
+            self.stdout.write(self.style.WARNING('Slower than the baseline (not a failure):\n  ' + '\n  '.join(slower)))
+
+        if options['save_baseline'] or not baseline:
+            benchmarks.save_baseline(options['baseline'], preset, results)
+            self.stdout.write(f"Saved the '{preset}' baseline to {options['baseline']}")
+        if failures:
+            raise CommandError('Benchmark failed:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} URL(s) within budget.'))
+
+    def report(self, results, baseline):
+        header = f"{'url':<24}{'viewer':<10}{'queries':>8}{'budget':>8}" + ''.join(
+            f"{f'p{p} ms':>10}" for p in benchmarks.PERCENTILES
+        ) + f"{'baseline p50':>14}"
+        self.stdout.write(header)
+        for result in results:
+            before = baseline.get(result.name, {}).get('p50_ms')
+            self.stdout.write(
+                f"{result.name:<24}{result.viewer:<10}{result.queries:>8}{benchmarks.QUERY_BUDGETS[result.name]:>8}"
+                + ''.join(f'{result.percentile(p):>10.2f}' for p in benchmarks.PERCENTILES)
+                + (f'{before:>14.2f}' if before is not None else f"{'-':>14}")
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reservations.bootstrap import run_bootstrap
+
+
+class Command(BaseCommand):
+    help = 'Run migrate, superuser creation and fixture loading only if something changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to bootstrap')
+        parser.add_argument('--force', action='store_true', help='Run every step even if the fingerprint matches')
+
+    def handle(self, *args, **options):
+        report = run_bootstrap(using=options['database'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(str(report)))
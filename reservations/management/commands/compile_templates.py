@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reservations.template_compiler import compile_templates
+
+
+class Command(BaseCommand):
+    help = 'Inline static {% include %}s into their parent templates and verify the output is unchanged'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help=f'Output directory (default {settings.COMPILED_TEMPLATES_DIR})')
+        parser.add_argument('--no-verify', action='store_true', help='Skip the render comparison')
+        parser.add_argument('--benchmark', type=int, default=50, metavar='N',
+                            help='Renders per template for the before/after timing (0 to skip)')
+
+    def handle(self, *args, **options):
+        report = compile_templates(
+            output_dir=options['output'],
+            verify=not options['no_verify'],
+            benchmark_iterations=options['benchmark'],
+            log=self.stdout.write,
+        )
+        for name in report['flattened']:
+            line = f"  {name}: {report['inlined'][name]} include(s) inlined"
+            if name in report['timings']:
+                before, after = report['timings'][name]
+                line += f'; render {before:.2f} ms -> {after:.2f} ms ({(after - before) / before:+.0%})'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f"Flattened {len(report['flattened'])} template(s); {len(report['rejected'])} kept as-is after verification."
+        ))
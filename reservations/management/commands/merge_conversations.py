@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from reservations.conversations import merge_duplicates
+
+
+class Command(BaseCommand):
+    help = 'Merge conversation threads that have the same participants, and set missing participant keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be merged')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            if report.sets % 100 == 0:
+                self.stdout.write(f'  {report.sets:,} sets merged')
+
+        report = merge_duplicates(
+            dry_run=options['dry_run'], progress=progress if options['verbosity'] > 1 else None,
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Dry run: {report}')
+        else:
+            self.stdout.write(self.style.SUCCESS(str(report)))
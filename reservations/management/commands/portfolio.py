@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from reservations import datasets
+from reservations.models import Apartment
+from reservations.portfolio import (
+    DEFAULT_BATCH_SIZE, DEFAULT_MAX_ERRORS, FIELDS, FORMATS, ImportStopped, PortfolioError, export_apartments,
+    import_apartments, write_rows,
+)
+
+BENCHMARK_ROWS = 100_000
+
+
+class Command(BaseCommand):
+    help = 'Stream apartments in or out as JSON Lines or CSV, or measure import/export throughput'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        importer = subcommands.add_parser('import', help='Upsert apartments keyed on unit_number')
+        importer.add_argument('path')
+        importer.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        importer.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        importer.add_argument(
+            '--max-errors', type=int, default=DEFAULT_MAX_ERRORS, help='Stop after this many invalid rows',
+        )
+        importer.add_argument('--resume', action='store_true', help='Continue an import that stopped')
+        importer.add_argument('--restart', action='store_true', help='Ignore the checkpoint of an earlier run')
+        importer.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+
+        exporter = subcommands.add_parser('export', help="Write every apartment; '-' for stdout")
+        exporter.add_argument('path')
+        exporter.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+
+        benchmark = subcommands.add_parser('benchmark', help='Rows per second on a throwaway database')
+        benchmark.add_argument('--rows', type=int, default=BENCHMARK_ROWS)
+        benchmark.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, f"handle_{options['action']}")(options)
+        except PortfolioError as e:
+            raise CommandError(str(e))
+
+    def handle_import(self, options):
+        def progress(report):
+            self.stdout.write(f'  line {report.line:,}: {report.imported:,} imported, {report.rejected:,} rejected '
+                              f'({report.rows_per_second:,.0f} rows/s)')
+
+        try:
+            report = import_apartments(
+                options['path'], options['format'], options['batch_size'], options['max_errors'],
+                resume=options['resume'], restart=options['restart'], checkpoint_path=options['checkpoint'],
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+        except ImportStopped as e:
+            hint = 'Committed batches are kept; fix the input and rerun with --resume.' if e.checkpointed else (
+                'Nothing was imported; fix the input and rerun.'
+            )
+            raise CommandError(f'{e}\n{hint}')
+        for line, error in report.errors:
+            self.stderr.write(f'  line {line}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {options["path"]}: {report}'))
+
+    def handle_export(self, options):
+        count = export_apartments(options['path'], options['format'])
+        if options['path'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"Exported {count:,} apartments to {options['path']}"))
+
+    def handle_benchmark(self, options):
+        """Import a generated portfolio (inserts, then the same rows again as updates) and export it"""
+        rows = options['rows']
+        units = [
+            tuple(apartment.image.name or '' if name == 'image' else getattr(apartment, name) for name in FIELDS)
+            for apartment in datasets.apartment_rows(rows)
+        ]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for fmt in FORMATS:
+                    path = os.path.join(directory, f'units.{fmt}')
+                    with open(path, 'w', encoding='utf-8', newline='') as out:
+                        write_rows(out, fmt, units)
+                    for phase in ('insert', 'update'):
+                        report = import_apartments(path, batch_size=options['batch_size'])
+                        self.stdout.write(f'{fmt:<6}import ({phase}) {report.rows_per_second:>10,.0f} rows/s')
+                    started = time.perf_counter()
+                    export_apartments(os.path.join(directory, f'export.{fmt}'))
+                    self.stdout.write(f'{fmt:<6}export          {rows / (time.perf_counter() - started):>10,.0f} rows/s')
+                    Apartment.objects.all().delete()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
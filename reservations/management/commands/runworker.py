@@ -0,0 +1,93 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from reservations import jobs
+
+MAINTENANCE_INTERVAL = 60
+
+
+def _work_in_process(queues, poll, stop):
+    # Ctrl-C reaches the whole process group; let the parent decide when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.Worker(queues, poll, stop=stop).run()
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues', help='Work this queue (repeatable; default: default)',
+        )
+        parser.add_argument('--concurrency', type=int, default=1, help='Jobs run at the same time (default: 1)')
+        parser.add_argument(
+            '--processes', action='store_true', help='Run each worker in its own process instead of a thread',
+        )
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and latency, then exit')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or ['default']
+        if options['stats']:
+            self.print_stats()
+            return
+        if options['once']:
+            jobs.maintenance()
+            worker = jobs.Worker(queues)
+            worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f'{worker.done} job(s) done, {worker.failed} failed'))
+            return
+
+        if options['processes']:
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            workers = [
+                context.Process(target=_work_in_process, args=(queues, options['poll'], stop), daemon=True)
+                for _ in range(options['concurrency'])
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(target=jobs.Worker(queues, options['poll'], stop=stop).run, daemon=True)
+                for _ in range(options['concurrency'])
+            ]
+        # The handler runs in this thread, which only ever waits on a thread Event: a wait on a
+        # process Event can't be interrupted, so the signal would sit there until it timed out
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        for worker in workers:
+            worker.start()
+        kind = 'process' if options['processes'] else 'thread'
+        self.stdout.write(f"Working {', '.join(queues)} with {len(workers)} {kind}(s); Ctrl-C stops after the current jobs")
+
+        try:
+            while not stopping.is_set():
+                jobs.maintenance()
+                close_old_connections()
+                if options['verbosity'] > 1:
+                    self.print_stats()
+                stopping.wait(MAINTENANCE_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        stop.set()
+        self.stdout.write('Stopping...')
+        for worker in workers:
+            worker.join()
+
+    def print_stats(self):
+        stats = jobs.metrics()
+        for (queue, status), count in sorted(stats['depth'].items()):
+            self.stdout.write(f'{queue:>12} {status:<8} {count:>8,}')
+        wait, run = stats['wait_seconds'], stats['run_seconds']
+        self.stdout.write(
+            f"{stats['due']:,} due, oldest waiting {stats['oldest_due_seconds']:.1f} s; last hour: "
+            f"{wait['count']:,} started, wait p50 {wait['p50']:.2f} s / p95 {wait['p95']:.2f} s, "
+            f"run p50 {run['p50']:.2f} s / p95 {run['p95']:.2f} s"
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.replicas import sync_sqlite
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary into the SQLite replicas, to try read replicas locally'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep syncing every this many seconds (replication lag to test against); default is once',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas: set DATABASE_REPLICA_URLS.')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                try:
+                    sync_sqlite(alias)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                self.stdout.write(f'Synced {alias}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
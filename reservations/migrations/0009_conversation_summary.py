@@ -0,0 +1,73 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversation_summaries(apps, schema_editor):
+    Conversation = apps.get_model('reservations', 'Conversation')
+    ConversationParticipant = apps.get_model('reservations', 'ConversationParticipant')
+    Message = apps.get_model('reservations', 'Message')
+
+    for conversation in Conversation.objects.prefetch_related('participants').iterator(chunk_size=500):
+        last = Message.objects.filter(conversation=conversation).order_by('-created_at', '-id').first()
+        if last is not None:
+            Conversation.objects.filter(pk=conversation.pk).update(
+                last_message=last,
+                last_message_preview=last.content[:255],
+                last_message_sender_id=last.sender_id,
+                last_message_at=last.created_at,
+            )
+
+        states = []
+        for user in conversation.participants.all():
+            unread = Message.objects.filter(
+                conversation=conversation, is_read=False
+            ).exclude(sender=user).count()
+            states.append(ConversationParticipant(conversation=conversation, user=user, unread_count=unread))
+        ConversationParticipant.objects.bulk_create(states, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0008_alter_notification_notification_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='reservations.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participant_states', to='reservations.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'conversation'), name='unique_conversation_participant')],
+            },
+        ),
+        migrations.RunPython(backfill_conversation_summaries, migrations.RunPython.noop),
+    ]
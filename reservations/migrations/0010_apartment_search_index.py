@@ -0,0 +1,55 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'reservations_apartment_fts'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        # Generated column: PostgreSQL keeps it in sync on every insert/update
+        schema_editor.execute(
+            "ALTER TABLE reservations_apartment ADD COLUMN search_document tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(unit_number, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+            ") STORED"
+        )
+        schema_editor.execute(
+            "CREATE INDEX reservations_apartment_search_gin "
+            "ON reservations_apartment USING GIN (search_document)"
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "unit_number, name, description, tokenize='unicode61', prefix='1 2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, unit_number, name, description) "
+            "SELECT id, unit_number, name, description FROM reservations_apartment"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS reservations_apartment_search_gin")
+        schema_editor.execute("ALTER TABLE reservations_apartment DROP COLUMN IF EXISTS search_document")
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0009_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
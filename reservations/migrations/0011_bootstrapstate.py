@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0010_apartment_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BootstrapState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('migrations_fingerprint', models.CharField(max_length=64)),
+                ('fixture_hash', models.CharField(blank=True, max_length=64)),
+                ('last_report', models.TextField(blank=True)),
+                ('completed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
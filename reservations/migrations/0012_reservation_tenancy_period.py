@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:08
+
+from django.db import migrations, models
+
+
+def create_tenancy_range(apps, schema_editor):
+    # PostgreSQL only: a generated daterange column with a GiST index for overlap (&&) queries.
+    # Other backends use the in-process interval tree in reservations.availability.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE reservations_reservation ADD COLUMN tenancy daterange "
+        "GENERATED ALWAYS AS (daterange(check_in, check_out, '[)')) STORED"
+    )
+    schema_editor.execute(
+        "CREATE INDEX reservations_reservation_tenancy_gist "
+        "ON reservations_reservation USING GIST (tenancy)"
+    )
+
+
+def drop_tenancy_range(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS reservations_reservation_tenancy_gist")
+    schema_editor.execute("ALTER TABLE reservations_reservation DROP COLUMN IF EXISTS tenancy")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0011_bootstrapstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='check_out',
+            field=models.DateField(blank=True, null=True, verbose_name='Move-out Date'),
+        ),
+        migrations.RunPython(create_tenancy_range, drop_tenancy_range),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0012_reservation_tenancy_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apartment',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0013_apartment_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('conversation_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('notification_type', models.CharField(choices=[('reservation_approved', 'Reservation Approved'), ('reservation_denied', 'Reservation Denied'), ('reservation_cancelled', 'Reservation Cancelled'), ('new_message', 'New Message Received'), ('new_reservation', 'New Reservation Request')], max_length=30)),
+                ('reservation_id', models.BigIntegerField(blank=True, null=True)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def cursors_from_read_flags(apps, schema_editor):
+    """Each participant has read up to just before the first unread message someone else sent"""
+    ConversationParticipant = apps.get_model('reservations', 'ConversationParticipant')
+    Message = apps.get_model('reservations', 'Message')
+
+    first_unread = Message.objects.filter(
+        conversation=OuterRef('conversation'), is_read=False
+    ).exclude(sender=OuterRef('user')).order_by('id').values('id')[:1]
+    latest = Message.objects.filter(conversation=OuterRef('conversation')).order_by('-id').values('id')[:1]
+    ConversationParticipant.objects.update(last_read_message_id=Coalesce(
+        Subquery(first_unread) - 1, Subquery(latest), Value(0), output_field=models.BigIntegerField(),
+    ))
+
+
+def read_flags_from_cursors(apps, schema_editor):
+    ConversationParticipant = apps.get_model('reservations', 'ConversationParticipant')
+    Message = apps.get_model('reservations', 'Message')
+
+    behind = ConversationParticipant.objects.filter(
+        conversation=OuterRef('conversation'), last_read_message_id__lt=OuterRef('id'),
+    ).exclude(user=OuterRef('sender'))
+    Message.objects.update(is_read=~Exists(behind))
+    unread = Message.objects.filter(
+        conversation=OuterRef('conversation'), id__gt=OuterRef('last_read_message_id'),
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(count=Count('id')).values('count')
+    ConversationParticipant.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0014_retention_archives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='message_conversation_id_idx'),
+        ),
+        migrations.RunPython(cursors_from_read_flags, read_flags_from_cursors),
+        migrations.RemoveField(
+            model_name='conversationparticipant',
+            name='unread_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
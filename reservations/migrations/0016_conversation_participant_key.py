@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+def backfill_participant_keys(apps, schema_editor):
+    """Key the oldest thread of each participant set; duplicates stay unkeyed for merge_conversations"""
+    Conversation = apps.get_model('reservations', 'Conversation')
+    Membership = Conversation.participants.through
+
+    members = {}
+    rows = Membership.objects.order_by().values_list('conversation_id', 'user_id')
+    for conversation_id, user_id in rows.iterator(chunk_size=5000):
+        members.setdefault(conversation_id, set()).add(user_id)
+    keys = {}
+    for pk in sorted(members):
+        key = '-'.join(str(user_id) for user_id in sorted(members[pk]))
+        if len(key) <= 255:
+            keys.setdefault(key, pk)
+    # One prepared UPDATE run per row; bulk_update's CASE over every id is far slower here
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Conversation._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {table} SET participant_key = %s WHERE id = %s', list(keys.items()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0015_message_read_cursors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_participant_keys, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -31,6 +32,8 @@ class Apartment(models.Model):
     description = models.TextField()
     amenities = models.TextField(help_text='Comma-separated amenities')
     image = models.ImageField(upload_to='apartments/', blank=True, null=True)
+    # Resized WebP/JPEG renditions and a blur placeholder, see reservations/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -52,10 +55,20 @@ class Reservation(models.Model):
         ('completed', 'Completed'),
     ]
     
+    # status -> statuses it may move to (enforced by reservations.transitions)
+    TRANSITIONS = {
+        'pending': ('approved', 'denied', 'cancelled'),
+        'approved': ('completed', 'cancelled'),
+        'denied': (),
+        'cancelled': (),
+        'completed': (),
+    }
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
     apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='reservations')
     check_in = models.DateField()
-    # REMOVED: check_out = models.DateField()
+    # Optional end of the tenancy (exclusive); open-ended when blank. See reservations.availability
+    check_out = models.DateField(null=True, blank=True, verbose_name="Move-out Date")
     # REMOVED: months = models.IntegerField(validators=[MinValueValidator(1)], default=1)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)  # Make nullable since no months to calculate
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -72,16 +85,32 @@ class Reservation(models.Model):
     def __str__(self):
         return f"{self.user.username} - Unit {self.apartment.unit_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tenancy = instance.tenancy_fields()
+        return instance
+
+    def tenancy_fields(self):
+        """(status, apartment_id, check_in, check_out), or None if some are deferred"""
+        names = ('status', 'apartment_id', 'check_in', 'check_out')
+        if not all(name in self.__dict__ for name in names):
+            return None
+        return tuple(self.__dict__[name] for name in names)
+
     def save(self, *args, **kwargs):
         # REMOVED: self.total_price = self.apartment.price_per_month * self.months
         # Set monthly price as default
         if not self.total_price:
             self.total_price = self.apartment.price_per_month
         
-        if self.status == 'approved':
-            self.apartment.status = 'occupied'
-            self.apartment.save()
+        # Status changes (and the apartment's occupancy) are handled by reservations.transitions
         super().save(*args, **kwargs)
+        # post_save has compared against the previous values (reservations.availability)
+        self._loaded_tenancy = self.tenancy_fields()
+    
+    def can_transition_to(self, status):
+        return status in self.TRANSITIONS.get(self.status, ())
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
@@ -122,6 +151,14 @@ class Tenant(models.Model):
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
     subject = models.CharField(max_length=200)
+    # Denormalized summary of the latest message, kept up to date by record_message()
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_preview = models.CharField(max_length=255, blank=True)
+    last_message_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # The sorted participant ids ("3-17"), one thread per set of participants. Null for a thread
+    # whose set already has another one, until merge_conversations folds them together
+    participant_key = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -131,17 +168,130 @@ class Conversation(models.Model):
     def __str__(self):
         return f"{self.subject[:50]}"
     
+    @staticmethod
+    def participant_key_for(user_ids):
+        key = '-'.join(str(pk) for pk in sorted(set(user_ids)))
+        # A set too large for the column simply has no canonical thread
+        return key if 0 < len(key) <= 255 else None
+    
+    @classmethod
+    def get_or_create_between(cls, users, subject):
+        """
+        The thread between ``users``, created with ``subject`` if there is none.
+        
+        One lookup on the unique key. Two concurrent first messages can't both
+        create a thread: the loser's insert fails on the key and it fetches
+        the winner's. Returns ``(conversation, created)``.
+        """
+        with transaction.atomic():
+            conversation, created = cls.objects.get_or_create(
+                participant_key=cls.participant_key_for(user.pk for user in users), defaults={'subject': subject},
+            )
+            if created:
+                conversation.participants.add(*users)
+        return conversation, created
+    
+    def refresh_participant_key(self):
+        """Recompute the key after the participants changed"""
+        key = self.participant_key_for(self.participants.values_list('pk', flat=True))
+        if key == self.participant_key:
+            return
+        if key and Conversation.objects.filter(participant_key=key).exclude(pk=self.pk).exists():
+            key = None
+        self.participant_key = key
+        Conversation.objects.filter(pk=self.pk).update(participant_key=key)
+    
     def get_other_participant(self, user):
-        """Get the other participant in the conversation"""
-        return self.participants.exclude(id=user.id).first()
+        """Get the other participant in the conversation (uses prefetched participants when available)"""
+        for participant in self.participants.all():
+            if participant.id != user.id:
+                return participant
+        return None
     
     def get_last_message(self):
         """Get the most recent message in this conversation"""
-        return self.messages.order_by('-created_at').first()
+        return self.last_message
     
     def unread_count_for_user(self, user):
-        """Count unread messages for a specific user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        """Count unread messages for a specific user (a range count past their read cursor)"""
+        cursor = self.participant_states.filter(user=user).values('last_read_message_id')
+        return self.messages.filter(id__gt=models.Subquery(cursor)).exclude(sender=user).count()
+    
+    def record_message(self, message):
+        """
+        Update the summary after a new message is created.
+        
+        Returns the ids of the participants the message is unread for.
+        """
+        self.last_message = message
+        self.last_message_preview = message.content[:255]
+        self.last_message_sender_id = message.sender_id
+        self.last_message_at = message.created_at
+        self.updated_at = message.created_at
+        # Write through a queryset update so a stale in-memory copy elsewhere can't clobber it
+        Conversation.objects.filter(pk=self.pk).update(
+            last_message=message,
+            last_message_preview=self.last_message_preview,
+            last_message_sender_id=message.sender_id,
+            last_message_at=message.created_at,
+            updated_at=message.created_at,
+        )
+        return list(
+            self.participant_states.exclude(user_id=message.sender_id).values_list('user_id', flat=True)
+        )
+    
+    def mark_read(self, user):
+        """
+        Move the user's read cursor up to the latest message.
+        
+        Returns how many messages from the other participants were unread.
+        """
+        cursor = self.participant_states.filter(user=user).values('last_read_message_id')
+        unread = self.messages.filter(id__gt=models.Subquery(cursor)).aggregate(
+            latest=models.Max('id'), count=models.Count('id', filter=~models.Q(sender=user)),
+        )
+        if unread['latest'] is None:
+            return 0
+        # Only ever forward. Stop at the latest message we counted, so one arriving meanwhile
+        # stays unread; if a concurrent call already moved further, its count is the one that stands
+        moved = self.participant_states.filter(user=user, last_read_message_id__lt=unread['latest']).update(
+            last_read_message_id=unread['latest']
+        )
+        return unread['count'] if moved else 0
+
+
+class ConversationParticipantQuerySet(models.QuerySet):
+    def with_unread_count(self):
+        """Annotate ``unread_count``: messages from others past the read cursor, an index range count"""
+        unread = Message.objects.filter(
+            conversation=models.OuterRef('conversation'), id__gt=models.OuterRef('last_read_message_id'),
+        ).exclude(sender=models.OuterRef('user')).order_by().values('conversation').annotate(
+            count=models.Count('id')
+        ).values('count')
+        return self.annotate(unread_count=Coalesce(models.Subquery(unread), 0))
+
+
+class ConversationParticipant(models.Model):
+    """
+    Per-participant state for a conversation: the read cursor.
+    
+    Messages with an id above ``last_read_message_id`` that someone else sent
+    are unread for this participant. It is a plain id rather than a foreign
+    key, so archiving or deleting that message doesn't move the cursor.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='participant_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_states')
+    last_read_message_id = models.BigIntegerField(default=0)
+    
+    objects = ConversationParticipantQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='unique_conversation_participant'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.conversation}"
 
 # UPDATED: Message model now links to Conversation
 class Message(models.Model):
@@ -149,10 +299,94 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Unread counts are ranges of a thread's ids past a read cursor
+            models.Index(fields=['conversation', 'id'], name='message_conversation_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender.username}: {self.content[:30]}..."
+
+
+# Compact copies of old, read rows moved out by reservations/retention.py. The
+# foreign keys to reservations and conversations are kept as plain ids, so
+# those can still be deleted without touching the archive.
+class NotificationArchive(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    reservation_id = models.BigIntegerField(null=True, blank=True)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} - {self.notification_type} (archived)"
+
+
+class MessageArchive(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    conversation_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.sender_id}: {self.content[:30]}... (archived)"
+
+
+class BootstrapState(models.Model):
+    """Fingerprint of the last successful startup bootstrap (see reservations/bootstrap.py)"""
+    name = models.CharField(max_length=50, unique=True)
+    migrations_fingerprint = models.CharField(max_length=64)
+    fixture_hash = models.CharField(max_length=64, blank=True)
+    last_report = models.TextField(blank=True)
+    completed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.completed_at:%Y-%m-%d %H:%M})"
+
+
+class Job(models.Model):
+    """A unit of background work (see reservations/jobs.py), run by `manage.py runworker`"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE = ('queued', 'running')
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Set for jobs that must not be queued twice, e.g. 'schedule:<name>'
+    key = models.CharField(max_length=150, null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The workers' claim query: due jobs of a queue, oldest first
+            models.Index(fields=['status', 'queue', 'run_at'], name='job_claim_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(status__in=['queued', 'running']), name='job_active_key_unique',
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.sender.username}: {self.content[:30]}..."
\ No newline at end of file
+        return f"{self.name} #{self.pk} ({self.status})"
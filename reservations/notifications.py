@@ -0,0 +1,152 @@
+"""
+Central notification dispatcher.
+
+Views call ``notify()`` / ``notify_staff()`` instead of creating Notification
+rows one at a time. Recipients are de-duplicated and written with a single
+``bulk_create`` inside a transaction.
+
+With ``defer=True`` the write is scheduled for after the surrounding
+transaction commits. If settings.NOTIFICATIONS_IN_BACKGROUND is on, it then
+runs on a small background thread pool, outside the request path. That
+setting is off by default because serverless hosts may freeze the process
+as soon as the response is sent. With settings.BACKGROUND_JOBS on it is
+queued as a job for ``manage.py runworker`` instead (the recipients are
+looked up in the request).
+
+Deletes go through ``delete()``: Notification has no delete receivers, so
+it deletes in batches by primary key with plain DELETEs and shifts the
+header counters once per user instead of once per row.
+"""
+import collections
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+
+from . import counters, events, jobs
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='notifications')
+    return _executor
+
+
+def _recipient_ids(recipients):
+    """Accept users, user ids or a User queryset and return unique ids in a stable order"""
+    if hasattr(recipients, 'values_list'):
+        recipients = recipients.values_list('pk', flat=True)
+    seen = {}
+    for recipient in recipients:
+        if recipient is None:
+            continue
+        seen[getattr(recipient, 'pk', recipient)] = None
+    return list(seen)
+
+
+def deliver(recipients, notification_type, message, reservation_id=None):
+    """Write one notification per recipient in a single transaction"""
+    user_ids = _recipient_ids(recipients)
+    if not user_ids:
+        return []
+    notifications = [
+        Notification(
+            user_id=user_id,
+            notification_type=notification_type,
+            reservation_id=reservation_id,
+            message=message,
+        )
+        for user_id in user_ids
+    ]
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+        # bulk_create sends no post_save, so bump the header counters here
+        counters.adjust(counters.NOTIFICATIONS, user_ids, 1)
+        # Every recipient got the same text, so one payload serves them all
+        events.publish(user_ids, 'notification', events.notification_payload(created[0]))
+    return created
+
+
+def _deliver_in_background(*args):
+    try:
+        deliver(*args)
+    except Exception:
+        logger.exception('Deferred notification delivery failed')
+    finally:
+        close_old_connections()
+
+
+def notify(recipients, notification_type, message, reservation=None, defer=False):
+    """
+    Notify every user in ``recipients`` (users, ids or a queryset).
+
+    Returns the created notifications, or an empty list when delivery was deferred.
+    """
+    # Querysets stay lazy, so a deferred delivery also moves the recipient lookup out of the request
+    args = (recipients, notification_type, message, reservation.pk if reservation is not None else None)
+    if not defer:
+        return deliver(*args)
+
+    if settings.BACKGROUND_JOBS:
+        # Queued with the caller's transaction, so it only runs if that commits
+        jobs.enqueue('notifications.deliver', recipients=_recipient_ids(recipients),
+                     notification_type=notification_type, message=message, reservation_id=args[-1])
+    elif getattr(settings, 'NOTIFICATIONS_IN_BACKGROUND', False):
+        transaction.on_commit(lambda: _get_executor().submit(_deliver_in_background, *args))
+    else:
+        transaction.on_commit(lambda: deliver(*args))
+    return []
+
+
+def notify_staff(notification_type, message, reservation=None, exclude=None, defer=True):
+    """Notify every staff account; deferred by default since the list grows with the team"""
+    staff = User.objects.filter(is_staff=True)
+    if exclude is not None:
+        staff = staff.exclude(pk=exclude.pk)
+    return notify(staff, notification_type, message, reservation=reservation, defer=defer)
+
+
+def discount_unread(queryset):
+    """Take the unread notifications in ``queryset`` off their users' header counters (after commit)"""
+    unread = queryset.filter(is_read=False).order_by().values_list('user_id').annotate(count=Count('pk'))
+    for user_id, count in unread:
+        counters.adjust(counters.NOTIFICATIONS, [user_id], -count)
+
+
+def delete(queryset, batch_size=BATCH_SIZE):
+    """
+    Delete the notifications in ``queryset``, ``batch_size`` at a time; returns how many went.
+
+    Each batch is its own transaction: read the next primary keys with their
+    unread flags, then delete exactly those rows (one DELETE; Notification has
+    no delete receivers), so write locks last one batch. The unread rows are
+    taken off each user's counter once, at the end.
+    """
+    unread = collections.Counter()
+    deleted = last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'user_id', 'is_read')[:batch_size]
+            )
+            if rows:
+                Notification.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        unread.update(user_id for _, user_id, is_read in rows if not is_read)
+        deleted += len(rows)
+        if len(rows) < batch_size:
+            break
+        last_pk = rows[-1][0]
+    for user_id, count in unread.items():
+        counters.adjust(counters.NOTIFICATIONS, [user_id], -count)
+    return deleted
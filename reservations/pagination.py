@@ -0,0 +1,195 @@
+"""
+Keyset (cursor) pagination for the list views.
+
+Pages are selected with a WHERE clause on the queryset's ordering columns
+(the model's Meta ordering unless the queryset overrides it) instead of
+OFFSET. The cost of a page therefore does not grow with how deep the user
+has scrolled. The primary key is always added as a final tie-breaker so
+cursors are stable even when ordering values repeat.
+
+Cursors are opaque, url-safe base64 strings. Ordering must use plain
+model fields or annotations (no ``related__field`` lookups) whose values
+are never NULL.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    """One page of results plus the cursors needed to move from it"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None, count=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _ordering(queryset):
+    """Return the queryset's ordering as [(name, descending), ...] ending with the pk"""
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    pk_name = queryset.model._meta.pk.name
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str) or '__' in item or item == '?':
+            raise ValueError(f"Cannot keyset-paginate on ordering {item!r}")
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        keys.append(('pk' if name == pk_name else name, descending))
+    if not any(name == 'pk' for name, _ in keys):
+        keys.append(('pk', keys[-1][1] if keys else False))
+    return keys
+
+
+def _output_field(queryset, name):
+    if name == 'pk':
+        return queryset.model._meta.pk
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _dump(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(keys, obj, direction):
+    payload = {'d': direction, 'v': [_dump(getattr(obj, name)) for name, _ in keys]}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(queryset, keys, cursor):
+    """Return (direction, values) for a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction, values = payload['d'], payload['v']
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            raise InvalidCursor(cursor)
+        return direction, [
+            _output_field(queryset, name).to_python(value)
+            for (name, _), value in zip(keys, values)
+        ]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _seek(keys, values, forward):
+    """
+    Build the WHERE clause for rows strictly after (or before) the cursor row:
+    (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND pk > z) ...
+    """
+    condition = Q()
+    for i, (name, descending) in enumerate(keys):
+        lookup = 'lt' if descending == forward else 'gt'
+        branch = Q(**{f'{name}__{lookup}': values[i]})
+        for j in range(i):
+            branch &= Q(**{keys[j][0]: values[j]})
+        condition |= branch
+    return condition
+
+
+def paginate_queryset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, backwards=False, with_count=False):
+    """
+    Return a CursorPage of ``queryset`` starting at ``cursor``.
+
+    ``backwards=True`` starts from the end of the ordering and walks towards
+    the start (e.g. a chat thread that opens on the newest messages and
+    offers "load older"); items in each page keep their natural order.
+    ``with_count=True`` adds one COUNT query for the total number of rows.
+    """
+    keys = _ordering(queryset)
+    if backwards:
+        keys = [(name, not descending) for name, descending in keys]
+
+    direction, values = 'next', None
+    if cursor:
+        direction, values = decode_cursor(queryset, keys, cursor)
+
+    forward = direction == 'next'
+    walk_keys = keys if forward else [(name, not descending) for name, descending in keys]
+    page_qs = queryset.order_by(*[f"{'-' if descending else ''}{name}" for name, descending in walk_keys])
+    if values is not None:
+        page_qs = page_qs.filter(_seek(keys, values, forward))
+
+    rows = list(page_qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if (forward and has_more) or (not forward and values is not None):
+            next_cursor = encode_cursor(keys, rows[-1], 'next')
+        if (not forward and has_more) or (forward and values is not None):
+            previous_cursor = encode_cursor(keys, rows[0], 'prev')
+
+    if backwards:
+        rows.reverse()
+
+    count = queryset.count() if with_count else None
+    return CursorPage(rows, next_cursor, previous_cursor, count)
+
+
+def paginate(request, queryset, page_size=DEFAULT_PAGE_SIZE, backwards=False, with_count=False):
+    """
+    Paginate ``queryset`` from the ``cursor`` GET parameter.
+
+    The returned page carries ``next_query``/``previous_query`` strings (the
+    current query string with the cursor swapped) for building links. An
+    invalid cursor falls back to the first page.
+    """
+    cursor = request.GET.get('cursor')
+    try:
+        page = paginate_queryset(queryset, cursor, page_size, backwards, with_count)
+    except InvalidCursor:
+        page = paginate_queryset(queryset, None, page_size, backwards, with_count)
+
+    params = request.GET.copy()
+    if page.next_cursor:
+        params['cursor'] = page.next_cursor
+        page.next_query = params.urlencode()
+    if page.previous_cursor:
+        params['cursor'] = page.previous_cursor
+        page.previous_query = params.urlencode()
+    return page
@@ -0,0 +1,358 @@
+"""
+Streaming import and export of apartments (``portfolio`` command).
+
+Formats are JSON Lines (one object per line) and CSV with a header row,
+both with the fields in FIELDS. Exported files import back unchanged.
+JSON Lines also accepts fixture-style ``{"model": ..., "fields": {...}}``
+lines.
+
+Import reads the input one line at a time and works in batches, so
+memory use does not grow with the file. For each batch it:
+
+* validates every row with the Apartment field validators (``clean_fields``
+  and ``clean``); invalid rows are reported with their line number and
+  skipped;
+* upserts the valid rows in one ``bulk_create(update_conflicts=True)``
+  keyed on ``unit_number``;
+* refreshes the SQLite search index for those rows;
+* commits and writes a checkpoint file: the file line the batch ended on,
+  and a hash of that line.
+
+If an import stops (an error, too many invalid rows, a killed process), the
+checkpoint marks the last committed batch and ``--resume`` continues from
+there: it skips that many lines and checks the last one still matches, so
+rows fixed in place anywhere in the file are fine, while lines added or
+removed before the checkpoint are caught instead of misaligning the rest.
+Rows rejected before the checkpoint are not read again; ``--restart``
+imports everything again (rows are upserted, so that is safe). A finished
+import deletes its checkpoint.
+
+bulk_create sends no signals, so the caches that the Apartment signals
+normally invalidate are invalidated here instead.
+"""
+import codecs
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import facets, fragments, stats
+from .models import Apartment
+from .search import reindex_apartments
+
+FIELDS = [
+    'unit_number', 'name', 'apartment_type', 'floor', 'price_per_month', 'size_sqm',
+    'bedrooms', 'bathrooms', 'status', 'description', 'amenities', 'image',
+]
+FORMATS = ('jsonl', 'csv')
+EXTENSIONS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ERRORS = 100
+# Ignored on import: exports don't carry them and the key is unit_number
+IGNORED_FIELDS = {'id', 'pk', 'created_at', 'updated_at', 'image_variants'}
+
+
+class PortfolioError(Exception):
+    pass
+
+
+class ImportStopped(PortfolioError):
+    """Too many invalid rows; ``checkpointed`` says whether earlier batches were committed"""
+
+    def __init__(self, message, checkpointed):
+        super().__init__(message)
+        self.checkpointed = checkpointed
+
+
+class ImportReport:
+    """Counts and timing of one import run, also what the checkpoint stores"""
+
+    def __init__(self):
+        self.line = 0
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+    @property
+    def rows_per_second(self):
+        return (self.imported + self.rejected) / self.seconds if self.seconds else 0.0
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def __str__(self):
+        return (
+            f'{self.imported:,} rows imported ({self.created:,} new, {self.updated:,} updated), '
+            f'{self.rejected:,} rejected, in {self.seconds:.1f} s ({self.rows_per_second:,.0f} rows/s)'
+        )
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise PortfolioError(f'Cannot tell the format of {path}; pass --format ({" or ".join(FORMATS)}).')
+    return EXTENSIONS[extension]
+
+
+def _open_input(path):
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    # Same tolerance as the bootstrap fixture loader: UTF-16 exports (with a BOM) or UTF-8
+    encoding = 'utf-16' if bom in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else 'utf-8-sig'
+    return open(path, encoding=encoding, newline='')
+
+
+def _digest(line):
+    # Without the line ending, so re-saving the file with other line endings doesn't count as a change
+    return hashlib.sha1(line.rstrip('\r\n').encode()).hexdigest()
+
+
+class _LineReader:
+    """Lines of the input, remembering the last one read (the checkpoint stores its hash)"""
+
+    def __init__(self, f):
+        self.f = f
+        self.last = ''
+
+    def __iter__(self):
+        while True:
+            line = self.f.readline()
+            if not line:
+                return
+            self.last = line
+            yield line
+
+    def skip(self, count):
+        for _ in range(count):
+            if not self.f.readline():
+                return False
+        return True
+
+
+def _jsonl_records(lines):
+    """(line number, record or None, error) for every non-blank line"""
+    number = 0
+    for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'invalid JSON ({e})'
+            continue
+        if not isinstance(record, dict):
+            yield number, None, 'not a JSON object'
+            continue
+        yield number, record.get('fields', record) if 'model' in record else record, None
+
+
+def _csv_records(lines, header):
+    reader = csv.reader(lines)
+    for row in reader:
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            yield reader.line_num, None, f'expected {len(header)} columns, found {len(row)}'
+            continue
+        yield reader.line_num, dict(zip(header, row)), None
+
+
+def _apartment(record):
+    """A validated, unsaved Apartment from an import record; raises ValidationError"""
+    unknown = set(record) - set(FIELDS) - IGNORED_FIELDS
+    if unknown:
+        raise ValidationError(f"unknown field(s): {', '.join(sorted(unknown))}")
+    values = {}
+    for name in FIELDS:
+        value = record.get(name)
+        # Missing or empty: leave the model default (status) or let validation complain
+        if value is None or value == '':
+            continue
+        values[name] = value.strip() if isinstance(value, str) else value
+    apartment = Apartment(**values)
+    # clean_fields() converts the strings and runs each field's validators. Uniqueness is
+    # not checked here: an existing unit_number is an update
+    apartment.clean_fields()
+    apartment.clean()
+    return apartment
+
+
+def _error_text(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+class Checkpoint:
+    """The input line of the last committed batch, stored next to the input"""
+
+    def __init__(self, path, source, fmt):
+        self.path = path
+        self.identity = {'source': os.path.abspath(source), 'format': fmt}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        if {key: state.get(key) for key in self.identity} != self.identity:
+            raise PortfolioError(f'{self.path} belongs to a different input file; remove it or pass --restart.')
+        return state
+
+    def save(self, report, last_line, header=None):
+        state = dict(self.identity, line=report.line, line_sha1=_digest(last_line), header=header,
+                     created=report.created, updated=report.updated, rejected=report.rejected)
+        # Write and rename, so a crash mid-write can't leave a truncated checkpoint
+        with open(f'{self.path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{self.path}.tmp', self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _upsert(batch, report, using):
+    apartments = {}
+    for apartment in batch:
+        apartments[apartment.unit_number] = apartment  # a unit repeated within a batch: last row wins
+    existing = set(Apartment.objects.using(using).filter(unit_number__in=apartments).values_list('unit_number', flat=True))
+    with transaction.atomic(using=using):
+        Apartment.objects.using(using).bulk_create(
+            apartments.values(),
+            update_conflicts=True,
+            unique_fields=['unit_number'],
+            update_fields=[name for name in FIELDS if name != 'unit_number'] + ['updated_at'],
+        )
+        pks = Apartment.objects.using(using).filter(unit_number__in=apartments).values_list('pk', flat=True)
+        reindex_apartments(using, pks)
+    report.created += len(apartments.keys() - existing)
+    report.updated += len(existing)
+
+
+def _invalidate_caches():
+    stats.invalidate()
+    facets.invalidate()
+    fragments.invalidate()
+
+
+def import_apartments(path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, max_errors=DEFAULT_MAX_ERRORS,
+                      resume=False, restart=False, checkpoint_path=None, progress=None, using='default'):
+    """
+    Upsert the apartments in ``path`` and return an ImportReport.
+
+    ``progress(report)`` is called after every committed batch. Raises
+    PortfolioError when the input can't be read, when more than
+    ``max_errors`` rows are invalid, or when a checkpoint from an earlier
+    run exists and neither ``resume`` nor ``restart`` is set.
+    """
+    fmt = detect_format(path, fmt)
+    report = ImportReport()
+    f = _open_input(path)
+    lines = _LineReader(f)
+    checkpoint = Checkpoint(checkpoint_path or f'{path}.checkpoint', path, fmt)
+    try:
+        state = None if restart else checkpoint.load()
+        if state and not resume:
+            raise PortfolioError(
+                f"An earlier import stopped after line {state['line']}; pass --resume to continue or --restart."
+            )
+
+        header = None
+        if fmt == 'csv':
+            header = next(csv.reader([f.readline()]), None)
+            if not header:
+                raise PortfolioError(f'{path} is empty.')
+            header = [name.strip() for name in header]
+        if state:
+            if state.get('header') != header:
+                raise PortfolioError('The CSV header changed since the checkpoint; pass --restart.')
+            # Up to the checkpoint's last line (the CSV header is line 1 and already read)
+            skipped = lines.skip(state['line'] - (1 if fmt == 'csv' else 0) - 1)
+            if not skipped or _digest(f.readline()) != state.get('line_sha1'):
+                raise PortfolioError(
+                    f"{path} changed before line {state['line']}, where the earlier import stopped "
+                    "(lines added or removed); pass --restart."
+                )
+            report.line = state['line']
+            report.created, report.updated, report.rejected = state['created'], state['updated'], state['rejected']
+        records = _csv_records(lines, header) if fmt == 'csv' else _jsonl_records(lines)
+        # Record numbers restart after the skipped lines (and exclude the CSV header); report file line numbers
+        line_offset = state['line'] if state else (1 if fmt == 'csv' else 0)
+
+        batch = []
+        for number, record, error in records:
+            number += line_offset
+            if record is not None:
+                try:
+                    batch.append(_apartment(record))
+                except ValidationError as e:
+                    error = _error_text(e)
+            if error:
+                report.rejected += 1
+                report.errors.append((number, error))
+                if report.rejected > max_errors:
+                    raise ImportStopped(
+                        f'Stopped at line {number}, more than {max_errors} invalid rows. The last: {error}',
+                        checkpointed=bool(state) or report.imported > 0,
+                    )
+            report.line = number
+            if len(batch) >= batch_size:
+                _upsert(batch, report, using)
+                checkpoint.save(report, lines.last, header)
+                batch = []
+                if progress:
+                    progress(report.finish())
+        if batch:
+            _upsert(batch, report, using)
+        checkpoint.clear()
+        return report.finish()
+    finally:
+        f.close()
+        if report.imported:
+            _invalidate_caches()
+
+
+def write_rows(out, fmt, rows):
+    """Write (FIELDS-ordered) ``rows`` to the open text file ``out``; returns the row count"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            out.write(encoder.encode(dict(zip(FIELDS, row))) + '\n')
+            count += 1
+    return count
+
+
+def export_apartments(path, fmt=None, queryset=None, chunk_size=2000):
+    """Write every apartment (or ``queryset``) to ``path`` ('-' for stdout); returns the row count"""
+    fmt = detect_format(path, fmt) if path != '-' else (fmt or 'jsonl')
+    rows = (queryset if queryset is not None else Apartment.objects.all()).order_by('pk').values_list(*FIELDS)
+    if path == '-':
+        return write_rows(sys.stdout, fmt, rows.iterator(chunk_size=chunk_size))
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        return write_rows(out, fmt, rows.iterator(chunk_size=chunk_size))
@@ -0,0 +1,190 @@
+"""
+Per-request SQL instrumentation and N+1 detection (opt-in, SQL_PROFILER=True).
+
+SQLProfilerMiddleware installs a ``connection.execute_wrapper`` on every
+database connection for the duration of a request and records, per
+statement, its duration, a normalized fingerprint and the call site (the
+innermost frames from this project's code). When the response is ready
+it builds a RequestProfile with:
+
+* the query count and total database time;
+* the slowest statements (SQL_PROFILER_SLOWEST);
+* every fingerprint that ran at least SQL_PROFILER_REPEAT_THRESHOLD times,
+  with the call sites that issued it. Those are the N+1 suspects: the same
+  shape of query run once per row.
+
+The summary goes out in a ``Server-Timing`` header (visible in the
+browser's network panel) and the whole profile into an in-process ring
+buffer of the last SQL_PROFILER_BUFFER_SIZE requests, which staff browse
+at /admin-panel/sql/. The buffer is per worker process.
+
+When the setting is off the middleware raises MiddlewareNotUsed, so it is
+not part of the request chain at all. It is async-capable: under ASGI the
+wrappers go on the connections of the request's sync thread, where
+sync_to_async runs the ORM, since the event loop thread has its own.
+"""
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+STACK_DEPTH = 4
+SQL_PREVIEW = 2000
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+_buffer = deque(maxlen=settings.SQL_PROFILER_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """The statement's shape: literals replaced by ``?`` and IN lists collapsed, so one query per row looks alike"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _call_site():
+    """The innermost frames from this project's own code (not Django, not this module)"""
+    base = str(settings.BASE_DIR)
+    frames = []
+    # Walk the frames directly: traceback.extract_stack() would also read every source line
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and filename.startswith(base) and 'site-packages' not in filename:
+            frames.append(f'{filename[len(base) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return tuple(frames)
+
+
+class QueryRecorder:
+    """execute_wrapper that times and records every statement"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'ms': (time.perf_counter() - started) * 1000,
+                'fingerprint': fingerprint(sql),
+                'call_site': _call_site(),
+            })
+
+
+class RequestProfile:
+    def __init__(self, request, response, queries, total_ms):
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.status = response.status_code
+        self.user = getattr(getattr(request, 'user', None), 'username', '') or ''
+        self.recorded_at = timezone.now()
+        self.total_ms = total_ms
+        self.query_count = len(queries)
+        self.db_ms = sum(query['ms'] for query in queries)
+        slowest = sorted(queries, key=lambda query: query['ms'], reverse=True)[:settings.SQL_PROFILER_SLOWEST]
+        self.slowest = [dict(query, sql=query['sql'][:SQL_PREVIEW]) for query in slowest]
+        self.repeated = self._repeated(queries)
+
+    @staticmethod
+    def _repeated(queries):
+        groups = {}
+        for query in queries:
+            group = groups.setdefault(query['fingerprint'], {
+                'fingerprint': query['fingerprint'][:SQL_PREVIEW], 'count': 0, 'ms': 0.0, 'call_sites': {},
+            })
+            group['count'] += 1
+            group['ms'] += query['ms']
+            group['call_sites'][query['call_site']] = group['call_sites'].get(query['call_site'], 0) + 1
+        repeated = [group for group in groups.values() if group['count'] >= settings.SQL_PROFILER_REPEAT_THRESHOLD]
+        for group in repeated:
+            group['call_sites'] = sorted(group['call_sites'].items(), key=lambda item: -item[1])
+        return sorted(repeated, key=lambda group: -group['count'])
+
+    def server_timing(self):
+        metrics = [
+            f'db;dur={self.db_ms:.1f};desc="{self.query_count} queries"',
+            f'app;dur={self.total_ms - self.db_ms:.1f}',
+        ]
+        if self.repeated:
+            worst = self.repeated[0]['count']
+            metrics.append(f'nplus1;desc="{len(self.repeated)} repeated, worst x{worst}"')
+        return ', '.join(metrics)
+
+
+def recent_profiles():
+    """Newest first"""
+    with _buffer_lock:
+        return list(reversed(_buffer))
+
+
+def clear_profiles():
+    with _buffer_lock:
+        _buffer.clear()
+
+
+def _record_queries(recorder):
+    """An ExitStack holding ``recorder`` on every database connection of the calling thread"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class SQLProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with _record_queries(recorder):
+            response = self.get_response(request)
+        return self._finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        # Installed and removed in the thread the request's queries run in
+        stack = await sync_to_async(_record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        # request.user may still have to be loaded, which can't happen on the event loop
+        return await sync_to_async(self._finish)(request, response, recorder, started)
+
+    def _finish(self, request, response, recorder, started):
+        profile = RequestProfile(request, response, recorder.queries, (time.perf_counter() - started) * 1000)
+        response['Server-Timing'] = profile.server_timing()
+        with _buffer_lock:
+            _buffer.append(profile)
+        return response
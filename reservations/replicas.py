@@ -0,0 +1,238 @@
+"""
+Read replicas: a database router with read-your-writes pinning.
+
+DATABASE_REPLICA_URLS (settings.py) adds each replica as an alias
+(``replica_1``, ...). ReplicaRouter sends reads to one of them only while
+ReplicaMiddleware says the request may use them:
+
+* the request is a GET, HEAD or OPTIONS and its view isn't marked with
+  ``@use_primary``;
+* the client has not written recently: after a request that wrote, the
+  response sets a cookie that pins the client to the primary for
+  REPLICA_PIN_SECONDS, so they see their own writes;
+* the request itself has not written yet. The first write pins the rest of
+  the request;
+* no transaction is open on the primary (a read inside one must see it);
+* the read doesn't fill a shared cache (``primary_reads()``: availability
+  tree, unread counters, stats, facets, card fragments). A replica is
+  only behind by REPLICA_MAX_LAG, but what is cached from it stays.
+
+Everything else (writes, management commands, background threads, tests)
+uses the primary. A request sticks to one replica, chosen among those
+whose lag is within REPLICA_MAX_LAG; if none is, it reads from the
+primary. LagMonitor measures lag at most every REPLICA_LAG_CHECK_INTERVAL
+seconds per process:
+
+* PostgreSQL: how far WAL replay is behind (0 when it has caught up);
+* SQLite (for local testing; ``manage.py sync_replica`` copies the primary
+  file into the replica files): how much older the replica file is than
+  the primary's last write.
+
+A replica that can't be reached counts as lagging. REPLICA_PIN_SECONDS
+should exceed REPLICA_MAX_LAG plus the check interval, or a client could
+leave the pin before a replica has their write.
+"""
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None  # chosen on the first read
+
+
+_state = contextvars.ContextVar('replica_request_state', default=None)
+
+
+@contextmanager
+def routing(state):
+    """Route the reads made inside the block by ``state``"""
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, for results that are cached and
+    shared: one built from a lagging replica would outlive the lag.
+    """
+    state = _state.get()
+    if state is None or state.pinned:
+        yield
+        return
+    state.pinned = True
+    try:
+        yield
+    finally:
+        # A write inside the block pins the rest of the request anyway
+        state.pinned = state.wrote
+
+
+def use_primary(view):
+    """Mark a view whose reads must always come from the primary"""
+    view.use_primary = True
+    return view
+
+
+class LagMonitor:
+    """Replica lag in seconds (None when unreachable), measured at most every REPLICA_LAG_CHECK_INTERVAL"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._measured = {}  # alias -> (monotonic time, lag)
+
+    def lag(self, alias):
+        with self._lock:
+            measured = self._measured.get(alias)
+        if measured and time.monotonic() - measured[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return measured[1]
+        return self.record(alias, measure_lag(alias))
+
+    def record(self, alias, lag):
+        with self._lock:
+            self._measured[alias] = (time.monotonic(), lag)
+        return lag
+
+    def forget(self):
+        with self._lock:
+            self._measured.clear()
+
+    def healthy(self, aliases):
+        lags = {alias: self.lag(alias) for alias in aliases}
+        return [alias for alias, lag in lags.items() if lag is not None and lag <= settings.REPLICA_MAX_LAG]
+
+
+monitor = LagMonitor()
+
+_POSTGRES_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def measure_lag(alias):
+    connection = connections[alias]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(_POSTGRES_LAG)
+                return float(cursor.fetchone()[0] or 0)
+        if connection.vendor == 'sqlite':
+            primary = os.path.getmtime(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+            return max(0.0, primary - os.path.getmtime(connection.settings_dict['NAME']))
+    except (DatabaseError, OSError, TypeError):
+        return None
+    # No way to tell on other backends
+    return 0.0
+
+
+def sync_sqlite(alias):
+    """Copy the SQLite primary into the SQLite replica ``alias`` (local stand-in for replication)"""
+    source, target = connections[DEFAULT_DB_ALIAS].settings_dict, connections[alias].settings_dict
+    if not (source['ENGINE'] == target['ENGINE'] == 'django.db.backends.sqlite3'):
+        raise ValueError(f'{alias}: only SQLite replicas of an SQLite primary can be synced.')
+    with sqlite3.connect(source['NAME']) as primary, sqlite3.connect(target['NAME']) as replica:
+        primary.backup(replica)
+    monitor.forget()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'django_cache':
+            # A DatabaseCache table: a replica's copy would serve old versions, and
+            # filling it isn't a write of the client's that the pin needs to cover (db_for_write)
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            healthy = monitor.healthy(settings.DATABASE_REPLICAS)
+            state.replica = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label != 'django_cache':
+            # Read the rest of the request, and the client's next requests, from the primary
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Lets safe requests read from replicas and pins clients that wrote to the primary.
+
+    Async-capable: under ASGI it stays on the event loop (no thread hop per
+    request, which matters for the long-lived event stream). The routing
+    state is a context variable, so sync views run in a thread still see it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # A sync process_view would be wrapped in sync_to_async by the handler
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing(self._state(request)) as state:
+            response = self.get_response(request)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        with routing(self._state(request)) as state:
+            response = await self.get_response(request)
+        return self._pin(state, response)
+
+    def _state(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        request.replica_state = RequestState(pinned)
+        return request.replica_state
+
+    def _pin(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'use_primary', False):
+            request.replica_state.pinned = True
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        ReplicaMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
@@ -0,0 +1,203 @@
+"""
+Retention for notifications and messages (``apply_retention`` command).
+
+Every message also creates a ``new_message`` notification, and neither
+table was ever pruned. RETENTION_POLICIES (settings.py) gives each table an
+age in days and an action for the rows that are read and older than that:
+
+* ``archive``: copy them into NotificationArchive / MessageArchive, compact
+  tables that nothing in the request path reads, and delete the originals;
+* ``delete``: just delete them;
+* ``keep``: leave the table alone.
+
+Unread rows are never touched, and neither is a conversation's latest
+message (its inbox summary points at it).
+
+The work runs in small batches, one transaction each: lock the next
+``batch_size`` eligible rows (skipping rows another transaction holds,
+where the database supports it), copy them with one INSERT ... SELECT and
+delete them by primary key. Write locks are therefore held for one batch at
+a time, and ``pause`` leaves a gap between batches for other writers (on
+SQLite a write locks the whole database). The report records how long each
+batch's transaction was open.
+
+The copy and delete are plain SQL. The rows are all read, so there are no
+unread counters to adjust (see counters.py).
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Conversation, ConversationParticipant, Message, MessageArchive, Notification, NotificationArchive
+
+ACTIONS = ('archive', 'delete', 'keep')
+
+
+def _old_notifications(cutoff):
+    return Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+
+
+def _old_messages(cutoff):
+    latest = Conversation.objects.filter(last_message__isnull=False).values('last_message')
+    # Read means every participant it was sent to has their read cursor at or past it
+    unread = ConversationParticipant.objects.filter(
+        conversation=OuterRef('conversation'), last_read_message_id__lt=OuterRef('pk'),
+    ).exclude(user=OuterRef('sender'))
+    return Message.objects.filter(created_at__lt=cutoff).exclude(pk__in=latest).exclude(Exists(unread))
+
+
+# name -> (model, archive model, eligible rows for a cutoff, archive field -> source field)
+TABLES = {
+    'notifications': (Notification, NotificationArchive, _old_notifications, {
+        'original_id': 'id',
+        'user': 'user',
+        'notification_type': 'notification_type',
+        'reservation_id': 'reservation',
+        'message': 'message',
+        'created_at': 'created_at',
+    }),
+    'messages': (Message, MessageArchive, _old_messages, {
+        'original_id': 'id',
+        'conversation_id': 'conversation',
+        'sender': 'sender',
+        'content': 'content',
+        'created_at': 'created_at',
+    }),
+}
+
+
+def policy(name):
+    """``(days, action)`` for a table in TABLES, checked"""
+    try:
+        config = settings.RETENTION_POLICIES[name]
+        days, action = int(config['days']), config['action']
+    except (KeyError, TypeError, ValueError):
+        raise ImproperlyConfigured(f"RETENTION_POLICIES['{name}'] needs an integer 'days' and an 'action'.")
+    if action not in ACTIONS:
+        raise ImproperlyConfigured(f"RETENTION_POLICIES['{name}']['action'] must be one of {', '.join(ACTIONS)}.")
+    if days < 1 and action != 'keep':
+        raise ImproperlyConfigured(f"RETENTION_POLICIES['{name}']['days'] must be at least 1.")
+    return days, action
+
+
+class RetentionReport:
+    def __init__(self, name, action, cutoff):
+        self.name = name
+        self.action = action
+        self.cutoff = cutoff
+        self.rows = 0
+        self.lock_times = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def batches(self):
+        return len(self.lock_times)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def lock_ms(self, p=100):
+        """Nearest-rank percentile of the per-batch transaction times, in milliseconds"""
+        if not self.lock_times:
+            return 0.0
+        ordered = sorted(self.lock_times)
+        return ordered[max(1, -(-p * len(ordered) // 100)) - 1] * 1000
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def __str__(self):
+        if self.action == 'keep':
+            return f'{self.name}: kept (policy is keep)'
+        verb = 'archived' if self.action == 'archive' else 'deleted'
+        text = (f'{self.name}: {verb} {self.rows:,} rows read before {self.cutoff:%Y-%m-%d}, '
+                f'{self.batches:,} batches in {self.seconds:.1f} s ({self.rows_per_second:,.0f} rows/s)')
+        if self.batches:
+            text += (f'; lock held p50 {self.lock_ms(50):.1f} ms, p95 {self.lock_ms(95):.1f} ms, '
+                     f'max {self.lock_ms():.1f} ms, total {sum(self.lock_times):.2f} s')
+        return text
+
+
+def _column(model, name):
+    return model._meta.get_field(name).column
+
+
+def _archive_sql(model, archive, columns, pks, connection):
+    quote = connection.ops.quote_name
+    targets = [quote(_column(archive, name)) for name in columns] + [quote(_column(archive, 'archived_at'))]
+    sources = [quote(_column(model, name)) for name in columns.values()] + ['%s']
+    placeholders = ', '.join(['%s'] * len(pks))
+    return (
+        f"INSERT INTO {quote(archive._meta.db_table)} ({', '.join(targets)}) "
+        f"SELECT {', '.join(sources)} FROM {quote(model._meta.db_table)} "
+        f"WHERE {quote(model._meta.pk.column)} IN ({placeholders})"
+    )
+
+
+def _delete_sql(model, pks, connection):
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(pks))
+    return f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({placeholders})"
+
+
+def eligible(name, now=None):
+    """The rows of ``name`` that its policy applies to, and the cutoff"""
+    model, archive, rows, columns = TABLES[name]
+    days, action = policy(name)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return rows(cutoff), cutoff
+
+
+def apply(name, batch_size=None, pause=0.0, dry_run=False, now=None, progress=None, using='default'):
+    """
+    Apply the policy for ``name`` ('notifications' or 'messages') and return
+    a RetentionReport. With ``dry_run`` only count the eligible rows.
+
+    ``progress(report)`` is called after every batch.
+    """
+    model, archive, _, columns = TABLES[name]
+    days, action = policy(name)
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    queryset, cutoff = eligible(name, now)
+    report = RetentionReport(name, action, cutoff)
+    if action == 'keep':
+        return report.finish()
+    queryset = queryset.using(using)
+    if dry_run:
+        report.rows = queryset.count()
+        return report.finish()
+
+    connection = connections[using]
+    lock = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    last_pk = 0
+    while True:
+        started = time.perf_counter()
+        with transaction.atomic(using=using):
+            # Walk up the primary key, so rows skipped as locked aren't retried in this run
+            pks = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk').select_for_update(**lock)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if pks:
+                with connection.cursor() as cursor:
+                    if action == 'archive':
+                        cursor.execute(_archive_sql(model, archive, columns, pks, connection), [timezone.now()] + pks)
+                    cursor.execute(_delete_sql(model, pks, connection), pks)
+        if not pks:
+            break
+        report.lock_times.append(time.perf_counter() - started)
+        report.rows += len(pks)
+        last_pk = pks[-1]
+        if progress:
+            progress(report.finish())
+        if pause:
+            time.sleep(pause)
+    return report.finish()
@@ -0,0 +1,133 @@
+"""
+Full-text search for apartments.
+
+PostgreSQL uses a generated ``search_document`` tsvector column with a GIN
+index, so it never goes stale. SQLite uses an FTS5 shadow table that is
+refreshed from the Apartment post_save/post_delete signals. Any other
+backend (or a SQLite build without FTS5) falls back to the old icontains
+filter. Both indexes are created by migration 0010.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q, BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Apartment
+
+FTS_TABLE = 'reservations_apartment_fts'
+MAX_TERMS = 10
+TOKEN_RE = re.compile(r'\w+')
+
+# (db alias, database name) for which the FTS5 table is known to exist. Only found
+# tables are remembered, so one created by a later migrate is picked up.
+_fts_tables = set()
+
+
+def _terms(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def normalize_query(query):
+    """The terms a search actually uses, so equivalent queries compare equal"""
+    return ' '.join(_terms(query))
+
+
+def _has_fts_table(alias):
+    connection = connections[alias]
+    key = (alias, connection.settings_dict['NAME'])
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            if FTS_TABLE not in connection.introspection.table_names(cursor):
+                return False
+        _fts_tables.add(key)
+    return True
+
+
+def search_apartments(queryset, query):
+    """
+    Filter ``queryset`` to apartments matching ``query`` and order them by rank.
+
+    Every term is matched as a prefix, so "A1" finds units A101, A102, ...
+    Unit number matches rank above name matches, which rank above description matches.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset.none()
+
+    alias = queryset.db
+    vendor = connections[alias].vendor
+    table = Apartment._meta.db_table
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        document = f'"{table}"."search_document"'
+        return queryset.alias(
+            search_match=RawSQL(f"{document} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField()),
+        ).filter(search_match=True).annotate(
+            search_rank=RawSQL(f"ts_rank({document}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()),
+        ).order_by('-search_rank', 'floor', 'unit_number')
+
+    if vendor == 'sqlite' and _has_fts_table(alias):
+        # Quote each term so words like AND/OR/NOT are not read as FTS operators
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # Join the FTS table once: MATCH runs a single time and bm25() reads the joined row
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE} MATCH %s", f"{FTS_TABLE}.rowid = \"{table}\".\"id\""],
+            params=[match],
+        ).annotate(
+            # bm25() is "lower is better"; column weights: unit_number, name, description
+            search_rank=RawSQL(f"-bm25({FTS_TABLE}, 10.0, 5.0, 1.0)", [], output_field=FloatField()),
+        ).order_by('-search_rank', 'floor', 'unit_number')
+
+    # Fallback: unindexed substring search
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(unit_number__icontains=query) |
+        Q(description__icontains=query)
+    )
+
+
+def index_apartment(apartment, using='default'):
+    """Refresh the SQLite FTS row for one apartment (PostgreSQL maintains itself)"""
+    if connections[using].vendor != 'sqlite' or not _has_fts_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [apartment.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, unit_number, name, description) VALUES (%s, %s, %s, %s)",
+            [apartment.pk, apartment.unit_number, apartment.name, apartment.description],
+        )
+
+
+def unindex_apartment(pk, using='default'):
+    """Drop the SQLite FTS row for a deleted apartment"""
+    if connections[using].vendor != 'sqlite' or not _has_fts_table(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def reindex_apartments(using='default', pks=None):
+    """
+    Rebuild the SQLite FTS rows for ``pks`` (all apartments by default), e.g.
+    after bulk_create, which sends no signals
+    """
+    if connections[using].vendor != 'sqlite' or not _has_fts_table(using):
+        return
+    table = Apartment._meta.db_table
+    where, params = '', []
+    if pks is not None:
+        pks = list(pks)
+        if not pks:
+            return
+        where = f" WHERE id IN ({', '.join(['%s'] * len(pks))})"
+        params = pks
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}" + where.replace('id IN', 'rowid IN'), params)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, unit_number, name, description) "
+            f"SELECT id, unit_number, name, description FROM {table}" + where,
+            params,
+        )
@@ -0,0 +1,119 @@
+"""
+Serializers for the read-only JSON API (see api.py).
+
+Related objects are rendered from what the API viewsets already loaded
+with select_related/prefetch_related; no serializer method queries on its own.
+"""
+from django.contrib.auth.models import User
+from rest_framework import serializers
+
+from .images import variants_are_current
+from .models import Apartment, Conversation, Message, Notification, Reservation
+
+
+class SparseFieldsMixin:
+    """
+    ``?fields=a,b`` keeps only the listed top-level fields.
+
+    Unknown names are ignored; with no valid name the full representation is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nested serializers are built without context, so only the top-level one reacts
+        request = self.context.get('request')
+        if request is None:
+            return
+        requested = {name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()}
+        if requested & set(self.fields):
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class UserBriefSerializer(serializers.ModelSerializer):
+    full_name = serializers.CharField(source='get_full_name')
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'full_name']
+
+
+class ApartmentBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Apartment
+        fields = ['id', 'name', 'unit_number']
+
+
+class ApartmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Apartment
+        fields = [
+            'id', 'name', 'apartment_type', 'floor', 'unit_number', 'price_per_month', 'size_sqm',
+            'bedrooms', 'bathrooms', 'status', 'description', 'amenities', 'image', 'created_at', 'updated_at',
+        ]
+
+    def get_image(self, apartment):
+        if not apartment.image:
+            return None
+        storage = apartment.image.storage
+        variants = apartment.image_variants['variants'] if variants_are_current(apartment) else []
+        return {
+            'url': apartment.image.url,
+            'variants': [
+                {'width': v['width'], 'webp': storage.url(v['webp']), 'jpeg': storage.url(v['jpeg'])} for v in variants
+            ],
+        }
+
+
+class ReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    apartment = ApartmentBriefSerializer()
+    user = UserBriefSerializer()
+    reviewed_by = UserBriefSerializer(allow_null=True)
+
+    class Meta:
+        model = Reservation
+        fields = [
+            'id', 'apartment', 'user', 'check_in', 'check_out', 'status', 'total_price', 'special_requests',
+            'admin_notes', 'reviewed_by', 'reviewed_at', 'created_at', 'updated_at',
+        ]
+
+
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'notification_type', 'message', 'reservation', 'is_read', 'created_at']
+
+
+class ConversationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    participants = UserBriefSerializer(many=True)
+    last_message_sender = UserBriefSerializer(allow_null=True)
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = [
+            'id', 'subject', 'participants', 'last_message_preview', 'last_message_sender', 'last_message_at',
+            'unread_count', 'created_at', 'updated_at',
+        ]
+
+    def get_unread_count(self, conversation):
+        # Filled by a Prefetch of the requesting user's participant row (ConversationViewSet)
+        states = getattr(conversation, 'my_state', None)
+        return states[0].unread_count if states else 0
+
+
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sender = UserBriefSerializer()
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'conversation', 'sender', 'content', 'is_read', 'created_at']
+
+    def get_is_read(self, message):
+        # Read once every other participant's cursor has reached it (cursors from ConversationViewSet.messages)
+        cursors = self.context.get('read_cursors', {})
+        others = [cursor for user_id, cursor in cursors.items() if user_id != message.sender_id]
+        return bool(others) and min(others) >= message.pk
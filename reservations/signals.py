@@ -0,0 +1,165 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Apartment, Conversation, ConversationParticipant, Message, Notification, Reservation
+from .search import index_apartment, unindex_apartment
+from . import availability, counters, events, facets, fragments, notifications, stats
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_dashboard_stats(sender, **kwargs):
+    """
+    Any change to the counted models makes the cached dashboard stats stale.
+
+    The bump waits for the commit: a reader recomputing before it would cache
+    the old rows under the new version.
+    """
+    transaction.on_commit(stats.invalidate, robust=True)
+
+
+@receiver(post_save, sender=Reservation)
+def invalidate_availability(sender, instance, created, **kwargs):
+    """Rebuild the interval tree on next use if a tenancy was added, moved or ended"""
+    if availability.tenancy_changed(instance, created=created):
+        transaction.on_commit(availability.invalidate)
+
+
+@receiver(post_delete, sender=Reservation)
+def invalidate_availability_on_delete(sender, instance, **kwargs):
+    if availability.tenancy_changed(instance, deleted=True):
+        transaction.on_commit(availability.invalidate)
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+def invalidate_reservation_cards(sender, **kwargs):
+    """
+    Reservation cards show apartment details, which their own updated_at doesn't cover.
+
+    On commit: a card rendered meanwhile from the old row would be cached under
+    the new version for the whole FRAGMENT_TIMEOUT.
+    """
+    transaction.on_commit(fragments.invalidate, robust=True)
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+def invalidate_facet_counts(sender, **kwargs):
+    # After the commit, so counts read meanwhile aren't cached under the new version
+    transaction.on_commit(facets.invalidate, robust=True)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cards_for_user(sender, update_fields=None, **kwargs):
+    # Names appear on reservation cards; a login only touches last_login
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        transaction.on_commit(fragments.invalidate, robust=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_dashboard_user_count(sender, created=True, update_fields=None, **kwargs):
+    # The user count excludes staff, so a full save may have changed it (is_staff);
+    # partial saves that don't touch is_staff, such as last_login on every sign-in, can't
+    if created or update_fields is None or 'is_staff' in update_fields:
+        transaction.on_commit(stats.invalidate, robust=True)
+
+
+@receiver(post_save, sender=Apartment)
+def update_apartment_search_index(sender, instance, using, **kwargs):
+    """Keep the full-text search index in sync with apartment saves"""
+    index_apartment(instance, using=using)
+
+
+@receiver(post_delete, sender=Apartment)
+def remove_apartment_search_index(sender, instance, using, **kwargs):
+    unindex_apartment(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Message)
+def update_conversation_summary(sender, instance, created, **kwargs):
+    """Keep the conversation's last-message summary and unread counters in sync"""
+    if created and instance.conversation_id and not kwargs.get('raw'):
+        recipients = instance.conversation.record_message(instance)
+        counters.adjust(counters.MESSAGES, recipients, 1)
+        events.publish(recipients, 'message', events.message_payload(instance))
+
+
+@receiver(pre_delete, sender=User)
+def forget_readers_of_deleted_sender(sender, instance, **kwargs):
+    """The user's messages go with them in one DELETE (no per-row receiver)"""
+    counters.forget_message_readers(Message.objects.filter(sender=instance))
+
+
+@receiver(post_delete, sender=ConversationParticipant)
+def forget_unread_messages(sender, instance, **kwargs):
+    # Leaving or deleting a conversation drops its whole unread count at once
+    counters.forget(counters.MESSAGES, instance.user_id)
+
+
+@receiver(post_save, sender=Notification)
+def announce_new_notification(sender, instance, created, **kwargs):
+    # bulk_create (notifications.deliver) sends no signal and adjusts the counter itself
+    if created and not instance.is_read and not kwargs.get('raw'):
+        counters.adjust(counters.NOTIFICATIONS, [instance.user_id], 1)
+        events.publish([instance.user_id], 'notification', events.notification_payload(instance))
+
+
+@receiver(pre_delete, sender=Reservation)
+def discount_cascaded_notifications(sender, instance, **kwargs):
+    """The reservation's notifications go with it in one DELETE (no per-row receiver); count them first"""
+    notifications.discount_unread(Notification.objects.filter(reservation=instance))
+
+
+def _latest_message_ids(conversation_ids):
+    return dict(
+        Message.objects.filter(conversation_id__in=conversation_ids).order_by().values_list('conversation_id')
+        .annotate(latest=Max('pk'))
+    )
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_conversation_participants(sender, instance, action, pk_set, **kwargs):
+    """
+    Create or remove per-participant state rows and refresh the participant key when participants change.
+
+    Someone added to a thread starts with their read cursor at its latest message: the history
+    before they joined isn't news to them.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if kwargs.get('reverse'):
+        # Changed from the User side: instance is a user, pk_set holds conversation ids
+        if action == 'post_add':
+            latest = _latest_message_ids(pk_set)
+            ConversationParticipant.objects.bulk_create(
+                [ConversationParticipant(conversation_id=pk, user=instance, last_read_message_id=latest.get(pk, 0))
+                 for pk in pk_set],
+                ignore_conflicts=True,
+            )
+        elif action == 'post_remove':
+            ConversationParticipant.objects.filter(user=instance, conversation_id__in=pk_set).delete()
+        elif action == 'post_clear':
+            states = ConversationParticipant.objects.filter(user=instance)
+            pk_set = set(states.values_list('conversation_id', flat=True))
+            states.delete()
+        for conversation in Conversation.objects.filter(pk__in=pk_set):
+            conversation.refresh_participant_key()
+        return
+
+    if action == 'post_add':
+        latest = _latest_message_ids([instance.pk]).get(instance.pk, 0)
+        ConversationParticipant.objects.bulk_create(
+            [ConversationParticipant(conversation=instance, user_id=pk, last_read_message_id=latest) for pk in pk_set],
+            ignore_conflicts=True,
+        )
+    elif action == 'post_remove':
+        ConversationParticipant.objects.filter(conversation=instance, user_id__in=pk_set).delete()
+    elif action == 'post_clear':
+        ConversationParticipant.objects.filter(conversation=instance).delete()
+    instance.refresh_participant_key()
@@ -0,0 +1,127 @@
+"""
+Dashboard statistics.
+
+All counters for a model come from a single conditional-aggregation query
+(``Count(..., filter=Q(...))``). Results are cached as a snapshot under a
+version number. Apartment/Reservation save and delete signals bump the
+version (see signals.py), so the next read recomputes.
+
+Recomputation is coalesced: the first request to miss takes a short lock
+and recomputes. Concurrent requests serve the previous snapshot if there
+is one, or wait briefly for the winner, instead of all hitting the
+database at once.
+"""
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import replicas
+from .models import Apartment, Reservation
+
+VERSION_KEY = 'dashboard_stats:version'
+SNAPSHOT_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+
+# Striped per-process locks, so the set of locks stays bounded however many scopes exist
+_local_locks = [threading.Lock() for _ in range(32)]
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """Make every cached snapshot stale; called from model signals"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def _local_lock(scope):
+    return _local_locks[hash(scope) % len(_local_locks)]
+
+
+def _cached(scope, compute):
+    """Return the current snapshot for ``scope``, recomputing it at most once at a time"""
+    key = f'dashboard_stats:{_version()}:{scope}'
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    stale_key = f'dashboard_stats:last:{scope}'
+    lock_key = f'{key}:lock'
+    # The thread lock coalesces within this process; cache.add coalesces across processes only
+    # under Redis (settings.CACHE_URL); under locmem there is only the one process
+    with _local_lock(scope):
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            try:
+                with replicas.primary_reads():
+                    snapshot = compute()
+                cache.set(key, snapshot, timeout=SNAPSHOT_TIMEOUT)
+                cache.set(stale_key, snapshot, timeout=None)
+            finally:
+                cache.delete(lock_key)
+            return snapshot
+
+    # Someone else is recomputing: serve the last snapshot, or wait for theirs
+    stale = cache.get(stale_key)
+    if stale is not None:
+        return stale
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot
+    return compute()
+
+
+def _apartment_counts():
+    return Apartment.objects.aggregate(
+        total_apartments=Count('id'),
+        available_apartments=Count('id', filter=Q(status='available')),
+    )
+
+
+def _reservation_counts(queryset):
+    return queryset.aggregate(
+        total_reservations=Count('id'),
+        pending_reservations=Count('id', filter=Q(status='pending')),
+        approved_reservations=Count('id', filter=Q(status='approved')),
+        approved_today=Count('id', filter=Q(status='approved', reviewed_at__date=timezone.localdate())),
+    )
+
+
+def global_stats():
+    """Counters for the whole site (admin dashboards)"""
+    def compute():
+        stats = _apartment_counts()
+        stats.update(_reservation_counts(Reservation.objects.all()))
+        stats['total_users'] = User.objects.filter(is_staff=False).count()
+        return stats
+    # The date is part of the scope so approved_today rolls over at midnight
+    return _cached(f'global:{timezone.localdate()}', compute)
+
+
+def user_stats(user):
+    """Site-wide apartment counters plus the user's own reservation counters"""
+    def compute():
+        stats = _apartment_counts()
+        stats.update(_reservation_counts(Reservation.objects.filter(user=user)))
+        return stats
+    return _cached(f'user:{user.pk}:{timezone.localdate()}', compute)
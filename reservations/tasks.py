@@ -0,0 +1,38 @@
+"""
+The background jobs this app queues (jobs.py), registered on startup by apps.py.
+
+With settings.BACKGROUND_JOBS on, deferred notification deliveries and
+image variant builds are queued here instead of running in the request.
+"""
+import logging
+
+from . import conversations, images, jobs, notifications, retention
+from .models import Apartment
+
+logger = logging.getLogger(__name__)
+
+
+@jobs.register('notifications.deliver')
+def deliver_notifications(recipients, notification_type, message, reservation_id=None):
+    notifications.deliver(recipients, notification_type, message, reservation_id)
+
+
+@jobs.register('images.refresh_variants', max_attempts=3)
+def refresh_image_variants(apartment_id):
+    apartment = Apartment.objects.filter(pk=apartment_id).first()
+    # Deleted, or a newer upload's job got there first
+    if apartment is None or not apartment.image or images.variants_are_current(apartment):
+        return
+    images.refresh_variants(apartment)
+
+
+@jobs.register('retention.apply', max_attempts=1)
+def apply_retention():
+    """For JOB_SCHEDULE: the same as `manage.py apply_retention`"""
+    for name in retention.TABLES:
+        logger.info('%s', retention.apply(name))
+
+
+@jobs.register('conversations.merge_duplicates', max_attempts=1)
+def merge_duplicate_conversations():
+    logger.info('%s', conversations.merge_duplicates())
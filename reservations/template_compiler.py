@@ -0,0 +1,231 @@
+"""
+Build-time flattening of the atomic template library.
+
+Pages are assembled from many small ``{% include 'atomic/...' %}``
+components. At runtime Django resolves and renders each include as a
+separate template, per row inside loops. ``compile_templates()`` copies
+every project template to COMPILED_TEMPLATES_DIR, with static includes
+spliced into their parents:
+
+* ``{% include 'name' %}`` becomes the included source;
+* ``{% include 'name' with a=b %}`` becomes ``{% with a=b %}...{% endwith %}``;
+* ``only``, variable template names, and components that use
+  ``{% extends %}``/``{% block %}`` are left as real includes.
+
+Each flattened template is then rendered next to its original against
+sample contexts (staff, tenant, anonymous; with rows and without). A
+template whose output differs is written back unflattened. settings.py
+puts COMPILED_TEMPLATES_DIR first, under the cached loader, when
+USE_COMPILED_TEMPLATES is on.
+"""
+import gc
+import re
+import shutil
+import statistics
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.template import Context
+from django.template.backends.django import DjangoTemplates
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .models import Apartment, Notification, Reservation
+
+INCLUDE_RE = re.compile(r"""{%\s*include\s+(["'])(?P<name>[^"']+)\1(?P<args>[^%]*?)\s*%}""")
+NOT_INLINABLE_RE = re.compile(r'{%\s*(extends|block)\b')
+TEMPLATE_SUFFIXES = ('.html', '.txt')
+SAMPLE_ROWS = 50
+
+# Fragment caching would make the second render a cache hit and hide differences
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def source_roots():
+    """Template directories that belong to this project (settings DIRS and local apps)"""
+    base = Path(settings.BASE_DIR).resolve()
+    compiled = Path(settings.COMPILED_TEMPLATES_DIR).resolve()
+    roots = [Path(d).resolve() for d in settings.TEMPLATES[0]['DIRS']]
+    roots += [Path(config.path).resolve() / 'templates' for config in apps.get_app_configs()]
+    return [
+        root for root in dict.fromkeys(roots)
+        if root != compiled and root.is_dir() and root.is_relative_to(base)
+    ]
+
+
+def _find(name, roots):
+    for root in roots:
+        path = root / name
+        if path.is_file():
+            return path
+    return None
+
+
+def flatten(source, roots, stack=()):
+    """Return ``source`` with static includes inlined, and how many were inlined"""
+    inlined = 0
+
+    def replace(match):
+        nonlocal inlined
+        name, args = match.group('name'), match.group('args').strip()
+        if name in stack or (args and not args.startswith('with ')) or 'only' in args.split():
+            return match.group(0)
+        path = _find(name, roots)
+        if path is None:
+            return match.group(0)
+        child = path.read_text(encoding='utf-8')
+        if NOT_INLINABLE_RE.search(child):
+            return match.group(0)
+        child, nested = flatten(child, roots, stack + (name,))
+        inlined += 1 + nested
+        if args:
+            return f'{{% {args} %}}{child}{{% endwith %}}'
+        return child
+
+    return INCLUDE_RE.sub(replace, source), inlined
+
+
+def make_engine(dirs):
+    """A standalone engine with the project's template libraries under the cached loader"""
+    options = settings.TEMPLATES[0].get('OPTIONS', {})
+    return DjangoTemplates({
+        'NAME': 'compile_templates',
+        'DIRS': [str(d) for d in dirs],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+            'builtins': options.get('builtins', []),
+            'libraries': options.get('libraries', {}),
+        },
+    }).engine
+
+
+def sample_contexts(rows=SAMPLE_ROWS):
+    """Unsaved model instances shaped like the list views' context; rendering them needs no database"""
+    staff = User(pk=1, username='staff', first_name='Sam', is_staff=True)
+    tenant = User(pk=2, username='tenant', first_name='Tess')
+    now = timezone.now()
+    apartments = [
+        Apartment(
+            pk=i, name=f'Compound {i % 3}', unit_number=str(100 + i), apartment_type='studio', floor=1 + i % 5,
+            price_per_month=Decimal(9000 + i), size_sqm=30, bedrooms=1, bathrooms=1,
+            status='occupied' if i % 4 == 0 else 'available', description='Sample unit', amenities='Wifi',
+            updated_at=now,
+        )
+        for i in range(1, rows + 1)
+    ]
+    reservations = [
+        Reservation(
+            pk=i, user=tenant, apartment=apartments[i - 1], check_in=date(2030, 1, 1 + i % 28),
+            status=('pending', 'approved', 'denied', 'cancelled')[i % 4], total_price=Decimal(9000 + i),
+            reviewed_by=staff if i % 4 in (1, 2) else None, admin_notes='Note' if i % 2 else '',
+            created_at=now, updated_at=now,
+        )
+        for i in range(1, rows + 1)
+    ]
+    notifications = [
+        Notification(pk=i, user=tenant, notification_type='new_message', message=f'Sample {i}', created_at=now)
+        for i in range(1, rows + 1)
+    ]
+    populated = {
+        'apartments': apartments, 'featured_apartments': apartments[:6],
+        'reservations': reservations, 'recent_reservations': reservations[:5],
+        'pending_reservations': reservations[::4], 'reservations_to_review': reservations[::4],
+        'notifications': notifications, 'apartment': apartments[0], 'reservation': reservations[0],
+    }
+    base = {'csrf_token': 'sample-token', 'messages': [], 'cards_version': 1, 'card_cache_timeout': 60}
+    return [
+        {**base, **populated, 'user': staff, 'is_admin': True},
+        {**base, **populated, 'user': tenant, 'is_admin': False},
+        {**base, 'user': AnonymousUser()},
+    ]
+
+
+def _render(engine, name, context):
+    try:
+        return engine.get_template(name).render(Context(context))
+    except Exception as e:
+        # Both sides must fail the same way for the flattened copy to count as equivalent
+        return f'!{type(e).__name__}: {e}'
+
+
+def _benchmark(original, compiled, name, context, iterations):
+    """Median render time in ms for both engines, interleaved so drift hits both equally"""
+    templates = (original.get_template(name), compiled.get_template(name))
+    timings = ([], [])
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            for template, samples in zip(templates, timings):
+                start = time.perf_counter()
+                template.render(Context(context))
+                samples.append(time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return tuple(statistics.median(samples) * 1000 for samples in timings)
+
+
+def compile_templates(output_dir=None, verify=True, benchmark_iterations=0, log=print):
+    """
+    Write flattened templates to ``output_dir`` (default settings.COMPILED_TEMPLATES_DIR).
+
+    Returns a report dict: flattened names, inlined include counts, rejected names and timings.
+    """
+    output_dir = Path(output_dir or settings.COMPILED_TEMPLATES_DIR)
+    roots = source_roots()
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+
+    sources, flattened, inlined = {}, [], {}
+    # Earlier roots win, as with the loaders
+    for root in reversed(roots):
+        for path in root.rglob('*'):
+            if path.is_file() and path.suffix in TEMPLATE_SUFFIXES:
+                sources[path.relative_to(root).as_posix()] = path.read_text(encoding='utf-8')
+
+    for name, source in sorted(sources.items()):
+        target = output_dir / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        compiled, count = flatten(source, roots)
+        target.write_text(compiled, encoding='utf-8')
+        if count:
+            flattened.append(name)
+            inlined[name] = count
+
+    report = {'flattened': flattened, 'inlined': inlined, 'rejected': [], 'timings': {}}
+    original_dirs = [Path(d) for d in settings.TEMPLATES[0]['DIRS'] if Path(d).resolve() != output_dir.resolve()]
+    contexts = sample_contexts()
+
+    with override_settings(CACHES=DUMMY_CACHES):
+        if verify:
+            # Reverting a parent changes what its children extend, so repeat until stable
+            changed = True
+            while changed:
+                changed = False
+                original, compiled = make_engine(original_dirs), make_engine([output_dir] + original_dirs)
+                for name in list(report['flattened']):
+                    if any(_render(original, name, c) != _render(compiled, name, c) for c in contexts):
+                        log(f'  {name}: output differs after flattening; keeping the includes')
+                        (output_dir / name).write_text(sources[name], encoding='utf-8')
+                        report['flattened'].remove(name)
+                        report['rejected'].append(name)
+                        changed = True
+
+        if benchmark_iterations:
+            original, compiled = make_engine(original_dirs), make_engine([output_dir] + original_dirs)
+            for name in report['flattened']:
+                report['timings'][name] = _benchmark(original, compiled, name, contexts[0], benchmark_iterations)
+
+    return report
@@ -0,0 +1,56 @@
+from django import template
+from django.utils.html import format_html
+
+from ..images import variants_are_current
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 768px) 100vw, 400px'
+# Fallback src for browsers without srcset support
+FALLBACK_WIDTH = 640
+
+
+def _srcset(apartment, fmt):
+    storage = apartment.image.storage
+    return ', '.join(
+        f"{storage.url(variant[fmt])} {variant['width']}w" for variant in apartment.image_variants['variants']
+    )
+
+
+@register.filter
+def srcset(apartment, fmt='webp'):
+    """``{{ apartment|srcset:"jpeg" }}``: srcset value for the apartment's image variants, or ''"""
+    if not variants_are_current(apartment):
+        return ''
+    return _srcset(apartment, fmt)
+
+
+@register.simple_tag
+def apartment_image(apartment, sizes=DEFAULT_SIZES, css_class='', alt='', loading='lazy'):
+    """
+    Responsive <picture> for an apartment image: WebP and JPEG srcsets plus a blur placeholder.
+
+    Falls back to the original upload while variants are missing
+    (e.g. before ``manage.py backfill_image_variants`` has run).
+    """
+    if not apartment.image:
+        return ''
+    if not variants_are_current(apartment):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            apartment.image.url, alt, css_class, loading,
+        )
+
+    variants = apartment.image_variants['variants']
+    fallback = next((v for v in variants if v['width'] >= FALLBACK_WIDTH), variants[-1])
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async" '
+        'style="background: url(\'{}\') center / cover no-repeat">'
+        '</picture>',
+        _srcset(apartment, 'webp'), sizes,
+        apartment.image.storage.url(fallback['jpeg']), _srcset(apartment, 'jpeg'), sizes,
+        alt, css_class, loading,
+        apartment.image_variants['placeholder'],
+    )
@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import asyncio
+import fcntl
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.db.utils import ConnectionDoesNotExist
+from django.http import HttpResponse
+from django.template import Context
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import (
+    availability, benchmarks, bootstrap, checks, context_processors, conversations, counters, datasets, events, facets,
+    fragments, images, indexes, jobs, notifications, pagination, portfolio, profiling, replicas, retention, search,
+    stats, template_compiler,
+)
+from .models import (
+    Apartment, Conversation, ConversationParticipant, Job, Message, MessageArchive, Notification, NotificationArchive,
+    Reservation,
+)
+from .forms import ReservationForm
+from .transitions import TransitionError, transition
+
+
+def make_apartment(unit_number='101', **kwargs):
+    defaults = {
+        'name': 'Test Compound',
+        'apartment_type': 'studio',
+        'floor': 1,
+        'unit_number': unit_number,
+        'price_per_month': 10000,
+        'size_sqm': 30,
+        'bedrooms': 1,
+        'bathrooms': 1,
+        'description': 'A test unit',
+        'amenities': 'Wifi, Aircon',
+    }
+    defaults.update(kwargs)
+    return Apartment.objects.create(**defaults)
+
+
+class ReservationTransitionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.tenant = User.objects.create_user('tenant')
+        self.apartment = make_apartment()
+        self.reservation = Reservation.objects.create(
+            user=self.tenant, apartment=self.apartment, check_in='2030-01-01'
+        )
+
+    def test_approve_occupies_apartment(self):
+        transition(self.reservation, 'approved', actor=self.admin)
+
+        self.reservation.refresh_from_db()
+        self.apartment.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'approved')
+        self.assertEqual(self.reservation.reviewed_by, self.admin)
+        self.assertIsNotNone(self.reservation.reviewed_at)
+        self.assertEqual(self.apartment.status, 'occupied')
+
+    def test_second_approval_for_same_unit_is_rejected(self):
+        other = Reservation.objects.create(
+            user=User.objects.create_user('other'), apartment=self.apartment, check_in='2030-02-01'
+        )
+        transition(self.reservation, 'approved', actor=self.admin)
+
+        with self.assertRaises(TransitionError):
+            transition(other, 'approved', actor=self.admin)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'pending')
+
+    def test_invalid_transition_is_rejected(self):
+        transition(self.reservation, 'denied', actor=self.admin, admin_notes='No')
+
+        with self.assertRaises(TransitionError):
+            transition(self.reservation, 'approved', actor=self.admin)
+
+    def test_cancelling_approved_reservation_frees_apartment(self):
+        transition(self.reservation, 'approved', actor=self.admin)
+        transition(self.reservation, 'cancelled', actor=self.admin)
+
+        self.apartment.refresh_from_db()
+        self.assertEqual(self.apartment.status, 'available')
+
+
+class ConcurrentApprovalTests(TransactionTestCase):
+    """Hammer approvals for one unit from many threads; exactly one may win"""
+
+    THREADS = 16
+
+    def test_concurrent_approvals_for_same_unit(self):
+        admin = User.objects.create_user('admin', is_staff=True)
+        apartment = make_apartment()
+        reservations = [
+            Reservation.objects.create(
+                user=User.objects.create_user(f'tenant{i}'), apartment=apartment, check_in='2030-01-01'
+            )
+            for i in range(self.THREADS)
+        ]
+
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        results_lock = threading.Lock()
+
+        def approve(reservation):
+            try:
+                barrier.wait()
+                try:
+                    transition(reservation, 'approved', actor=admin)
+                    outcome = 'approved'
+                except TransitionError:
+                    outcome = 'rejected'
+                except Exception as e:
+                    outcome = f'error: {e}'
+                with results_lock:
+                    results.append(outcome)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=approve, args=(r,)) for r in reservations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(results.count('approved'), 1, results)
+        self.assertEqual(results.count('rejected'), self.THREADS - 1, results)
+        self.assertEqual(Reservation.objects.filter(status='approved').count(), 1)
+        self.assertEqual(Reservation.objects.filter(status='pending').count(), self.THREADS - 1)
+        apartment.refresh_from_db()
+        self.assertEqual(apartment.status, 'occupied')
+
+
+class APIQueryCountTests(TestCase):
+    """Each endpoint runs a fixed number of queries however many rows it returns"""
+
+    ROWS = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.tenant = User.objects.create_user('tenant')
+        for i in range(cls.ROWS):
+            apartment = make_apartment(str(100 + i))
+            reservation = Reservation.objects.create(user=cls.tenant, apartment=apartment, check_in='2030-01-01')
+            Notification.objects.create(
+                user=cls.tenant, notification_type='new_reservation', message=f'n{i}', reservation=reservation,
+            )
+            other = User.objects.create_user(f'staff{i}', is_staff=True)
+            conversation = Conversation.objects.create(subject=f'c{i}')
+            conversation.participants.add(cls.tenant, other)
+            Message.objects.create(conversation=conversation, sender=other, content='hello')
+        cls.conversation = conversation
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.tenant)
+
+    def assertQueries(self, url, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_endpoints(self):
+        self.assertEqual(len(self.assertQueries('/api/v1/apartments/', 1).data['results']), self.ROWS)
+        self.assertQueries('/api/v1/reservations/', 1)
+        self.assertQueries('/api/v1/notifications/', 1)
+        # Conversations + participants prefetch + the viewer's unread-count prefetch
+        self.assertQueries('/api/v1/conversations/', 3)
+        # Membership check + messages joined with their sender
+        self.assertQueries(f'/api/v1/conversations/{self.conversation.pk}/messages/', 2)
+
+    def test_detail_endpoints(self):
+        reservation = Reservation.objects.filter(user=self.tenant).first()
+        self.assertQueries(f'/api/v1/reservations/{reservation.pk}/', 1)
+        self.assertQueries(f'/api/v1/conversations/{self.conversation.pk}/', 3)
+
+    def test_sparse_fields_skip_joins(self):
+        response = self.assertQueries('/api/v1/conversations/?fields=id,subject', 1)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'subject'})
+
+    def test_etag_revalidation(self):
+        response = self.client.get('/api/v1/reservations/')
+        with self.assertNumQueries(1):
+            revalidated = self.client.get('/api/v1/reservations/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class QueryBudgetTests(TestCase):
+    """Every URL stays within its committed query budget (reservations/benchmarks.py)"""
+    # Runs against the configured cache (settings.CACHE_URL), which never queries the database
+
+    @classmethod
+    def setUpTestData(cls):
+        datasets.seed('tiny')
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(benchmarks.uncovered_urls(), [])
+
+    def test_views_stay_within_budget(self):
+        results = benchmarks.run(repeat=1, warmup=0)
+        self.assertEqual(benchmarks.budget_failures(results), [])
+
+
+class RetentionTests(TestCase):
+    """Only read rows past the cutoff leave the live tables, and a thread keeps its latest message"""
+
+    def setUp(self):
+        self.tenant = User.objects.create_user('tenant')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.later = timezone.now() + timedelta(days=400)
+
+    def test_archives_old_read_notifications(self):
+        read = Notification.objects.create(user=self.tenant, notification_type='new_message', message='old', is_read=True)
+        unread = Notification.objects.create(user=self.tenant, notification_type='new_message', message='unread')
+        report = retention.apply('notifications', batch_size=1, now=self.later)
+        self.assertEqual((report.rows, report.batches), (1, 1))
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [unread.pk])
+        archived = NotificationArchive.objects.get()
+        self.assertEqual((archived.original_id, archived.user, archived.message), (read.pk, self.tenant, 'old'))
+        self.assertEqual(retention.apply('notifications', now=timezone.now()).rows, 0)
+
+    def test_keeps_latest_message_of_a_thread(self):
+        conversation = Conversation.objects.create(subject='Lease')
+        conversation.participants.add(self.tenant, self.staff)
+        first, second = (
+            Message.objects.create(conversation=conversation, sender=self.tenant, content=content)
+            for content in ('first', 'second')
+        )
+        conversation.mark_read(self.staff)
+        report = retention.apply('messages', now=self.later)
+        self.assertEqual(report.rows, 1)
+        self.assertEqual(list(conversation.messages.values_list('pk', flat=True)), [second.pk])
+        self.assertEqual(MessageArchive.objects.get().original_id, first.pk)
+
+
+class ConversationKeyTests(TestCase):
+    """One thread per set of participants, found by its key"""
+
+    def setUp(self):
+        self.tenant = User.objects.create_user('tenant')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_send_message_reuses_the_thread(self):
+        self.client.force_login(self.tenant)
+        for content in ('first', 'second'):
+            self.client.post('/messages/send/', {'recipient': self.staff.pk, 'subject': 'Lease', 'content': content})
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.participant_key, f'{self.tenant.pk}-{self.staff.pk}')
+        self.assertEqual(conversation.messages.count(), 2)
+
+    def test_merge_duplicates(self):
+        kept, _ = Conversation.get_or_create_between([self.tenant, self.staff], 'Lease')
+        duplicate = Conversation.objects.create(subject='Lease again')
+        duplicate.participants.add(self.tenant, self.staff)
+        self.assertIsNone(duplicate.participant_key)
+        Message.objects.create(conversation=kept, sender=self.staff, content='read')
+        kept.mark_read(self.tenant)
+        Message.objects.create(conversation=duplicate, sender=self.staff, content='unread')
+
+        report = conversations.merge_duplicates()
+        self.assertEqual((report.sets, report.removed, report.messages), (1, 1, 1))
+        kept = Conversation.objects.get()
+        self.assertEqual(kept.messages.count(), 2)
+        self.assertEqual(kept.last_message_preview, 'unread')
+        self.assertEqual(kept.unread_count_for_user(self.tenant), 1)
+
+
+class IndexAdvisorTests(TestCase):
+    """Candidates come from the captured statements' own predicates"""
+
+    def test_candidates_for_a_captured_query(self):
+        tenant = User.objects.create_user('tenant')
+        for i in range(5):
+            Notification.objects.create(user=tenant, notification_type='new_message', message=f'n{i}')
+        recorder = indexes.WorkloadRecorder()
+        with connection.execute_wrapper(recorder):
+            for _ in range(3):
+                list(Notification.objects.filter(user=tenant, is_read=False).order_by('-created_at'))
+
+        [statement] = recorder.statements.values()
+        self.assertEqual(statement.count, 3)
+        advice = indexes.advise([statement], min_benefit=0)
+        columns = {candidate.columns for candidate in advice.candidates if candidate.table == Notification._meta.db_table}
+        self.assertEqual(columns, {('user_id', 'is_read'), ('user_id', 'is_read', 'created_at')})
+        # Rolled back after measuring
+        self.assertNotIn(indexes.CANDIDATE_INDEX, indexes.existing_indexes()[Notification._meta.db_table])
+
+    def test_migration_only_for_declared_indexes(self):
+        candidate = indexes.Candidate(Notification._meta.db_table, ('user_id', 'is_read'))
+        with self.assertRaisesMessage(indexes.UndeclaredIndexes, candidate.declaration()):
+            indexes.write_migration([candidate])
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index_advisor.py')
+        declared = [*Notification._meta.indexes, candidate.index()]
+        with mock.patch.object(Notification._meta, 'indexes', declared), \
+                mock.patch.object(indexes.MigrationWriter, 'path', path):
+            self.assertEqual(indexes.write_migration([candidate]), path)
+        source = Path(path).read_text()
+        self.assertIn('migrations.AddIndex(', source)
+        self.assertIn(candidate.index().name, source)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_MAX_LAG=2.0)
+class ReplicaRouterTests(SimpleTestCase):
+    """Safe requests read from a replica until they (or the client, recently) wrote"""
+
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        replicas.monitor.record('replica_1', 0.5)
+        self.addCleanup(replicas.monitor.forget)
+
+    def test_reads_follow_the_request_state(self):
+        self.assertEqual(self.router.db_for_read(Apartment), 'default')
+        with replicas.routing(replicas.RequestState()) as state:
+            self.assertEqual(self.router.db_for_read(Apartment), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Apartment), 'default')
+            self.assertEqual(self.router.db_for_read(Apartment), 'default')
+        self.assertTrue(state.wrote)
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        replicas.monitor.record('replica_1', 5.0)
+        with replicas.routing(replicas.RequestState()):
+            self.assertEqual(self.router.db_for_read(Apartment), 'default')
+
+    def test_a_write_pins_the_client(self):
+        def write(request):
+            self.router.db_for_write(Apartment)
+            return HttpResponse()
+
+        factory = RequestFactory()
+        response = replicas.ReplicaMiddleware(write)(factory.get('/'))
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], 10)
+
+        def read(request):
+            return HttpResponse(self.router.db_for_read(Apartment))
+
+        request = factory.get('/', HTTP_COOKIE=f'{replicas.PIN_COOKIE}=1')
+        self.assertEqual(replicas.ReplicaMiddleware(read)(request).content, b'default')
+        self.assertEqual(replicas.ReplicaMiddleware(read)(factory.get('/')).content, b'replica_1')
+
+    async def test_async_requests_stay_on_the_event_loop(self):
+        async def write_then_read(request):
+            # Sync views run in a thread with a copy of the context, as under ASGI
+            read = await sync_to_async(self.router.db_for_read)(Apartment)
+            await sync_to_async(self.router.db_for_write)(Apartment)
+            return HttpResponse(read)
+
+        middleware = replicas.ReplicaMiddleware(write_then_read)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertTrue(asyncio.iscoroutinefunction(middleware.process_view))
+        request = AsyncRequestFactory().get('/')
+        response = await middleware(request)
+        self.assertEqual(response.content, b'replica_1')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        marked = replicas.use_primary(lambda request: None)
+        await middleware.process_view(request, marked, (), {})
+        self.assertTrue(request.replica_state.pinned)
+
+
+_flaky_runs = []
+
+
+@jobs.register('tests.flaky', max_attempts=2)
+def _flaky(fail):
+    _flaky_runs.append(fail)
+    if fail:
+        raise RuntimeError('failed on purpose')
+
+
+class JobQueueTests(TestCase):
+    """Jobs are claimed once, retried with backoff and only run when due"""
+
+    def setUp(self):
+        _flaky_runs.clear()
+        self.worker = jobs.Worker(name='test-worker')
+
+    def test_deferred_notifications_are_queued(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        with self.settings(BACKGROUND_JOBS=True):
+            notifications.notify_staff('new_reservation', 'Queued')
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertEqual(Notification.objects.get().user, staff)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_retry_with_backoff_then_fail(self):
+        job = jobs.enqueue('tests.flaky', fail=True)
+        with self.assertLogs('reservations.jobs', 'WARNING'):
+            self.assertEqual(self.worker.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('failed on purpose', job.last_error)
+        # Not due yet
+        self.assertEqual(self.worker.run_once(), 0)
+        with self.assertLogs('reservations.jobs', 'WARNING'):
+            self.worker.run_once(now=job.run_at)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(_flaky_runs, [True, True])
+
+    def test_scheduled_and_keyed_jobs(self):
+        later = timezone.now() + timedelta(hours=1)
+        job = jobs.enqueue('tests.flaky', run_at=later, key='once', fail=False)
+        self.assertEqual(jobs.enqueue('tests.flaky', key='once', fail=False), job)
+        self.assertEqual(jobs.claim('other-worker'), [])
+        [claimed] = jobs.claim('other-worker', now=later)
+        self.assertEqual(jobs.claim('test-worker', now=later), [])
+        self.assertTrue(jobs.execute(claimed))
+        self.assertEqual(jobs.metrics(now=later)['depth'], {('default', 'done'): 1})
+        # Finished, so the key is free again
+        self.assertNotEqual(jobs.enqueue('tests.flaky', key='once', fail=False), job)
+
+    def test_expired_lease_is_requeued(self):
+        job = jobs.enqueue('tests.flaky', fail=False)
+        jobs.claim('dead-worker')
+        self.assertEqual(jobs.maintenance(now=timezone.now() + timedelta(days=1)), (1, 0))
+        self.assertEqual(self.worker.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('done', 2, 'test-worker'))
+
+    def test_job_requeued_for_later_is_not_claimed(self):
+        job = jobs.enqueue('tests.flaky', delay=3600, fail=False)
+        # A candidate list read before another worker pushed the job back
+        with mock.patch.object(jobs, '_due', return_value=Job.objects.filter(pk=job.pk)):
+            self.assertEqual(jobs.claim('test-worker'), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 0))
+
+
+_lease_checks = []
+
+
+@jobs.register('tests.slow')
+def _slow(seconds):
+    time.sleep(seconds)
+    job = Job.objects.get(key='slow')
+    _lease_checks.append((job.locked_at > job.started_at, jobs.maintenance()[0]))
+
+
+class JobLeaseTests(TransactionTestCase):
+    """A running job keeps its lease for as long as it runs"""
+
+    @override_settings(JOB_LEASE_SECONDS=0.3)
+    def test_heartbeat_renews_the_lease(self):
+        _lease_checks.clear()
+        jobs.enqueue('tests.slow', key='slow', seconds=0.5)
+        self.assertEqual(jobs.Worker(name='test-worker').run_once(), 1)
+        # Renewed while running, so maintenance() left it to its worker
+        self.assertEqual(_lease_checks, [(True, 0)])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertFalse(any(thread.name.endswith('-heartbeat') for thread in threading.enumerate()))
+
+
+class SearchTests(TestCase):
+    """Prefix matching and ranking through the FTS5 table on SQLite"""
+
+    def setUp(self):
+        make_apartment('A101', name='Garden Court', description='Quiet unit')
+        make_apartment('A102', name='Harbor View', description='Near the garden')
+        make_apartment('B201', name='Garden Tower', description='High floor')
+
+    def units(self, query):
+        return [apartment.unit_number for apartment in search.search_apartments(Apartment.objects.all(), query)]
+
+    def test_prefix_terms(self):
+        self.assertEqual(sorted(self.units('A1')), ['A101', 'A102'])
+        self.assertEqual(self.units('garden tower'), ['B201'])
+        self.assertEqual(self.units('and or not'), [])
+        self.assertEqual(self.units('!!'), [])
+
+    def test_rank_prefers_unit_number_then_name(self):
+        make_apartment('G301', name='Plain', description='Plain')
+        ranked = self.units('g')
+        self.assertEqual(ranked[0], 'G301')
+        # Name matches come before the description-only match
+        self.assertEqual(ranked[-1], 'A102')
+
+    def test_edits_are_reindexed(self):
+        apartment = Apartment.objects.get(unit_number='B201')
+        apartment.name = 'Sea Breeze'
+        apartment.save()
+        self.assertEqual(self.units('breeze'), ['B201'])
+        apartment.delete()
+        self.assertEqual(self.units('breeze'), [])
+
+    def test_a_missing_table_is_not_remembered(self):
+        search._fts_tables.clear()
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {search.FTS_TABLE} RENAME TO fts_away')
+            self.assertFalse(search._has_fts_table('default'))
+            cursor.execute(f'ALTER TABLE fts_away RENAME TO {search.FTS_TABLE}')
+        self.assertTrue(search._has_fts_table('default'))
+
+
+class StatsTests(TestCase):
+    """Cached dashboard counters follow the changes they count"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_staff_change_updates_user_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user('tenant', password='pw')
+        self.assertEqual(stats.global_stats()['total_users'], 1)
+        user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+            # Not before the commit, or a concurrent reader could cache the old rows as new
+            self.assertEqual(stats.global_stats()['total_users'], 1)
+        self.assertEqual(stats.global_stats()['total_users'], 0)
+
+    def test_sign_in_keeps_the_snapshot(self):
+        user = User.objects.create_user('tenant', password='pw')
+        version = stats._version()
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        self.assertEqual(stats._version(), version)
+
+    def test_several_processes_need_a_shared_atomic_cache(self):
+        self.assertEqual(checks.shared_cache_check(None), [])
+        with override_settings(WEB_CONCURRENCY=4):
+            self.assertEqual([error.id for error in checks.shared_cache_check(None)], ['reservations.E001'])
+            with override_settings(CACHES={'default': {'BACKEND': checks.REDIS, 'LOCATION': 'redis://cache:6379/0'}}):
+                self.assertEqual(checks.shared_cache_check(None), [])
+
+
+class AvailabilityTests(TestCase):
+    """Approved tenancies block overlapping dates; only tenancy changes invalidate the tree"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.tenant = User.objects.create_user('tenant')
+        self.apartment = make_apartment()
+        # Approved for March, while the unit itself stays listed as available
+        self.tenancy = Reservation.objects.create(
+            user=self.tenant, apartment=self.apartment, status='approved',
+            check_in=date(2030, 3, 1), check_out=date(2030, 4, 1),
+        )
+
+    def test_is_available(self):
+        self.assertFalse(availability.is_available(self.apartment, date(2030, 3, 15), date(2030, 3, 20)))
+        self.assertFalse(availability.is_available(self.apartment, date(2030, 2, 1)))  # open-ended request
+        # check_out is exclusive on both sides
+        self.assertTrue(availability.is_available(self.apartment, date(2030, 2, 1), date(2030, 3, 1)))
+        self.assertTrue(availability.is_available(self.apartment, date(2030, 4, 1), date(2030, 5, 1)))
+        self.assertTrue(availability.is_available(
+            self.apartment, date(2030, 3, 15), date(2030, 3, 20), exclude_reservation=self.tenancy,
+        ))
+        self.assertTrue(availability.is_available(make_apartment('102'), date(2030, 3, 15)))
+
+    def test_open_ended_tenancy_blocks_everything_after(self):
+        self.tenancy.check_out = None
+        self.tenancy.save()
+        self.assertFalse(availability.is_available(self.apartment, date(2031, 1, 1), date(2031, 2, 1)))
+        self.assertTrue(availability.is_available(self.apartment, date(2030, 1, 1), date(2030, 3, 1)))
+
+    def test_pending_reservations_leave_the_version_alone(self):
+        version = availability.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = Reservation.objects.create(user=self.tenant, apartment=self.apartment, check_in=date(2030, 3, 10))
+            pending.special_requests = 'Ground floor please'
+            pending.save()
+            pending.delete()
+            self.tenancy.admin_notes = 'Paid'
+            self.tenancy.save()
+        self.assertEqual(availability.version(), version)
+
+    def test_tenancy_changes_bump_the_version(self):
+        version = availability.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenancy.check_out = date(2030, 5, 1)
+            self.tenancy.save()
+        self.assertNotEqual(availability.version(), version)
+
+        version = availability.version()
+        pending = Reservation.objects.create(
+            user=self.tenant, apartment=make_apartment('102'), check_in=date(2030, 3, 10),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            transition(pending, 'approved', actor=self.admin)
+        self.assertNotEqual(availability.version(), version)
+
+    def test_form_rejects_overlapping_stay(self):
+        form = ReservationForm(data={
+            'apartment': self.apartment.pk, 'check_in': '2030-03-20', 'check_out': '2030-04-10',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('already booked', form.errors['apartment'][0])
+
+        form = ReservationForm(data={
+            'apartment': self.apartment.pk, 'check_in': '2030-04-01', 'check_out': '2030-05-01',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_occupied_unit_can_be_booked_after_the_tenancy(self):
+        self.apartment.status = 'occupied'
+        self.apartment.save()
+        form = ReservationForm(data={'apartment': self.apartment.pk, 'check_in': '2030-04-01', 'check_out': '2030-06-01'})
+        self.assertIn(self.apartment, form.fields['apartment'].queryset)
+        self.assertTrue(form.is_valid(), form.errors)
+        later = form.save(commit=False)
+        later.user = User.objects.create_user('next')
+        later.save()
+
+        transition(later, 'approved', actor=self.admin)
+        transition(self.tenancy, 'completed', actor=self.admin)
+        # The later tenancy still holds the unit
+        self.apartment.refresh_from_db()
+        self.assertEqual(self.apartment.status, 'occupied')
+        clashing = Reservation.objects.create(user=self.tenant, apartment=self.apartment, check_in=date(2030, 5, 1))
+        with self.assertRaises(TransitionError):
+            transition(clashing, 'approved', actor=self.admin)
+
+    def test_form_ignores_the_reservation_being_edited(self):
+        form = ReservationForm(instance=self.tenancy, data={
+            'apartment': self.apartment.pk, 'check_in': '2030-03-05', 'check_out': '2030-04-01',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class UnreadCounterTests(TestCase):
+    """Header counters follow deliveries and deletes without recounting"""
+
+    def setUp(self):
+        # The cache outlives each test's rollback, and user ids repeat
+        cache.clear()
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.tenant = User.objects.create_user('tenant', password='pw')
+        self.client.force_login(self.tenant)
+
+    def notify(self, user, count, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                notifications.deliver([user], 'new_message', 'Hello', **kwargs)
+
+    def assertUnread(self, user, expected):
+        # The counter must already be cached: no COUNT query
+        with CaptureQueriesContext(connection) as queries:
+            counts = counters.unread_counts(user)
+        self.assertFalse([q for q in queries if 'COUNT' in q['sql']])
+        self.assertEqual(counts['notifications'], expected)
+
+    def test_deliveries_shift_the_cached_counter(self):
+        self.assertEqual(counters.unread_counts(self.tenant)['notifications'], 0)
+        self.notify(self.tenant, 3)
+        self.assertUnread(self.tenant, 3)
+
+    def test_delete_and_clear_all(self):
+        counters.unread_counts(self.tenant)
+        self.notify(self.tenant, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/notifications/{Notification.objects.filter(user=self.tenant).first().pk}/read/')
+        unread = Notification.objects.filter(user=self.tenant, is_read=False).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/notifications/{unread.pk}/delete/')
+        self.assertUnread(self.tenant, 2)
+
+        self.notify(self.tenant, 20)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.client.post('/notifications/clear-all/')
+        deletes = [q for q in queries if q['sql'].startswith('DELETE FROM "reservations_notification"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertFalse(Notification.objects.filter(user=self.tenant).exists())
+        self.assertUnread(self.tenant, 0)
+
+    def test_bulk_delete_runs_in_batches(self):
+        counters.unread_counts(self.tenant)
+        self.notify(self.tenant, 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.deliver([self.admin], 'new_message', 'Not yours')
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            deleted = notifications.delete(Notification.objects.filter(user=self.tenant), batch_size=3)
+        self.assertEqual(deleted, 7)
+        deletes = [q for q in queries if q['sql'].startswith('DELETE FROM "reservations_notification"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertUnread(self.tenant, 0)
+        self.assertEqual(Notification.objects.filter(user=self.admin).count(), 1)
+
+    def test_deleting_a_reservation_discounts_its_notifications(self):
+        reservation = Reservation.objects.create(user=self.tenant, apartment=make_apartment(), check_in='2030-01-01')
+        counters.unread_counts(self.admin)
+        self.notify(self.admin, 2, reservation_id=reservation.pk)
+        self.notify(self.admin, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertUnread(self.admin, 1)
+
+
+class EventBrokerTests(SimpleTestCase):
+    """InMemoryBroker hands events to the subscribers of a channel, from any thread"""
+
+    def test_publish_reaches_subscribers_of_the_channel(self):
+        broker = events.InMemoryBroker()
+
+        async def scenario():
+            mine, other = broker.subscribe('user:1'), broker.subscribe('user:2')
+            self.assertEqual(broker.subscriber_count(), 2)
+            # publish() is called from request threads, not the stream's loop
+            thread = threading.Thread(target=broker.publish, args=('user:1', {'id': 1}))
+            thread.start()
+            thread.join()
+            self.assertEqual(await mine.get(timeout=1), {'id': 1})
+            self.assertIsNone(await other.get(timeout=0.01))
+            mine.close()
+            other.close()
+        asyncio.run(scenario())
+        self.assertEqual(broker.subscriber_count(), 0)
+        broker.publish('user:1', {'id': 2})  # nobody listening
+
+    def test_slow_reader_loses_oldest_events(self):
+        broker = events.InMemoryBroker()
+
+        async def scenario():
+            subscription = broker.subscribe('user:1')
+            for number in range(events.QUEUE_SIZE + 5):
+                broker.publish('user:1', {'id': number})
+            await asyncio.sleep(0)  # let the queued pushes run
+            return [(await subscription.get(timeout=1))['id'] for _ in range(events.QUEUE_SIZE)]
+        self.assertEqual(asyncio.run(scenario()), list(range(5, events.QUEUE_SIZE + 5)))
+
+    def test_subscription_of_a_closed_loop_is_dropped(self):
+        broker = events.InMemoryBroker()
+
+        async def subscribe():
+            broker.subscribe('user:1')
+        asyncio.run(subscribe())
+        broker.publish('user:1', {'id': 1})
+        self.assertEqual(broker.subscriber_count('user:1'), 0)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tenant')
+
+    def test_events_are_published_on_commit(self):
+        with mock.patch.object(events, '_send') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                events.publish([self.user.pk], 'notification', {'message': 'Hi'})
+                send.assert_not_called()
+        user_ids, event = send.call_args.args
+        self.assertEqual(user_ids, [self.user.pk])
+        self.assertEqual((event['type'], event['data']), ('notification', {'message': 'Hi'}))
+
+    def test_wsgi_and_anonymous_requests_get_no_stream(self):
+        self.assertEqual(self.client.get('/events/').status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/events/').status_code, 204)
+        # Nor do WSGI pages try to open one
+        self.assertNotContains(self.client.get('/notifications/'), 'EventSource')
+
+    def test_only_asgi_pages_open_the_stream(self):
+        for factory, expected in ((RequestFactory(), False), (AsyncRequestFactory(), True)):
+            request = factory.get('/')
+            request.user = self.user
+            self.assertEqual(context_processors.unread_badges(request)['live_events'], expected)
+
+    async def test_stream_delivers_published_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        next_chunk = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)  # the stream is now waiting on its subscription
+        events.get_broker().publish(
+            events.user_channel(self.user.pk), {'id': 7, 'type': 'message', 'data': {'content': 'Hi'}},
+        )
+        frame = await asyncio.wait_for(next_chunk, timeout=2)
+        self.assertEqual(frame, b'id: 7\nevent: message\ndata: {"content": "Hi"}\n\n')
+
+        # The client goes away: the server cancels the task waiting on the stream
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(events.get_broker().subscriber_count(events.user_channel(self.user.pk)), 0)
+
+
+class ImageVariantTests(TestCase):
+    """Variants are rendered into the image's storage and replaced when the image changes"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        storages = {**settings.STORAGES, 'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': self.media},
+        }}
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.apartment = make_apartment()
+
+    def upload(self, name, size):
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 80, 40, 255)).save(buffer, 'PNG')
+        self.apartment.image.save(name, ContentFile(buffer.getvalue()), save=False)
+        Apartment.objects.filter(pk=self.apartment.pk).update(image=self.apartment.image.name)
+
+    def test_variants_never_upscale(self):
+        self.upload('wide.png', (800, 400))
+        self.assertFalse(images.variants_are_current(self.apartment))
+        variants = images.refresh_variants(self.apartment)
+
+        self.assertEqual(variants['source'], self.apartment.image.name)
+        self.assertEqual([v['width'] for v in variants['variants']], [320, 640, 800])
+        self.assertTrue(variants['placeholder'].startswith('data:image/webp;base64,'))
+        storage = self.apartment.image.storage
+        for variant in variants['variants']:
+            self.assertTrue(storage.exists(variant['webp']))
+            self.assertTrue(storage.exists(variant['jpeg']))
+        self.apartment.refresh_from_db()
+        self.assertTrue(images.variants_are_current(self.apartment))
+
+    def test_new_image_replaces_old_variants(self):
+        self.upload('first.png', (400, 300))
+        old = images.refresh_variants(self.apartment)
+        self.upload('second.png', (400, 300))
+        self.assertFalse(images.variants_are_current(self.apartment))
+
+        new = images.refresh_variants(self.apartment)
+        storage = self.apartment.image.storage
+        self.assertTrue(images.variants_are_current(self.apartment))
+        self.assertNotEqual(old['variants'][0]['webp'], new['variants'][0]['webp'])
+        self.assertFalse(storage.exists(old['variants'][0]['webp']))
+        self.assertTrue(storage.exists(new['variants'][0]['webp']))
+
+    def test_no_image_means_no_variants(self):
+        self.assertEqual(images.refresh_variants(self.apartment), {})
+        self.assertFalse(images.variants_are_current(self.apartment))
+
+
+class ConditionalPageTests(TestCase):
+    """Personal pages answer If-None-Match with 304 until something they show changes"""
+
+    def setUp(self):
+        self.tenant = User.objects.create_user('tenant')
+        self.client.force_login(self.tenant)
+        self.apartment = make_apartment()
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def test_list_and_detail_revalidate_until_an_edit(self):
+        for url in ('/apartments/', f'/apartments/{self.apartment.pk}/'):
+            etag = self.assertRevalidates(url)
+            self.apartment.description = f'Edited for {url}'
+            self.apartment.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_new_notification_changes_the_tag(self):
+        etag = self.assertRevalidates('/apartments/')
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.deliver([self.tenant], 'new_message', 'Hello')
+        self.assertEqual(self.client.get('/apartments/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_flash_message_disables_the_tag(self):
+        etag = self.assertRevalidates('/apartments/')
+        self.client.post('/notifications/clear-all/')  # flashes "0 notification(s) cleared!"
+        response = self.client.get('/apartments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_opening_a_thread_always_marks_it_read(self):
+        other = User.objects.create_user('other')
+        conversation, _ = Conversation.get_or_create_between([self.tenant, other], 'Hello')
+        Message.objects.create(conversation=conversation, sender=other, content='First')
+        response = self.client.get(f'/messages/{conversation.pk}/')
+        self.assertFalse(response.has_header('ETag'))
+
+        Message.objects.create(conversation=conversation, sender=other, content='Second')
+        self.assertEqual(self.client.get(f'/messages/{conversation.pk}/', HTTP_IF_NONE_MATCH='*').status_code, 200)
+        unread = ConversationParticipant.objects.filter(user=self.tenant).with_unread_count().get().unread_count
+        self.assertEqual(unread, 0)
+
+
+@override_settings(SQL_PROFILER_ENABLED=True)
+class SQLProfilerTests(TestCase):
+    """The profiler records every statement of a request and flags repeated shapes"""
+
+    def setUp(self):
+        profiling.clear_profiles()
+        self.apartments = [make_apartment(str(number)) for number in range(101, 105)]
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            profiling.fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b = 42 AND c IN (1, 2, 3)"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)',
+        )
+        self.assertEqual(
+            profiling.fingerprint('SELECT *\n  FROM t WHERE id = %s AND id IN (%s, %s)'),
+            'SELECT * FROM t WHERE id = ? AND id IN (...)',
+        )
+        self.assertEqual(profiling.fingerprint('SELECT "t1"."id" FROM t1'), 'SELECT "t1"."id" FROM t1')
+
+    def one_query_per_apartment(self, request):
+        for apartment in self.apartments:
+            Apartment.objects.filter(pk=apartment.pk).exists()
+        return HttpResponse()
+
+    def assertProfiled(self, response):
+        self.assertIn('4 queries', response['Server-Timing'])
+        self.assertIn('nplus1', response['Server-Timing'])
+        profile = profiling.recent_profiles()[0]
+        self.assertEqual(profile.query_count, 4)
+        self.assertEqual(profile.repeated[0]['count'], 4)
+        call_site = profile.repeated[0]['call_sites'][0][0]
+        self.assertIn('one_query_per_apartment', call_site[0])
+
+    def test_middleware_records_repeated_queries(self):
+        middleware = profiling.SQLProfilerMiddleware(self.one_query_per_apartment)
+        self.assertProfiled(middleware(RequestFactory().get('/apartments/')))
+
+    async def test_async_middleware_records_the_sync_thread_queries(self):
+        async def view(request):
+            return await sync_to_async(self.one_query_per_apartment)(request)
+        middleware = profiling.SQLProfilerMiddleware(view)
+        self.assertProfiled(await middleware(RequestFactory().get('/apartments/')))
+
+    @override_settings(SQL_PROFILER_ENABLED=False)
+    def test_disabled_middleware_leaves_the_chain(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.SQLProfilerMiddleware(self.one_query_per_apartment)
+
+
+class PortfolioTests(TestCase):
+    """Apartments stream out and back in; a stopped import resumes where it committed"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = lambda name: os.path.join(directory, name)
+
+    def write(self, name, units):
+        with open(self.path(name), 'w') as f:
+            for unit in units:
+                f.write((unit if isinstance(unit, str) else json.dumps(unit)) + '\n')
+        return self.path(name)
+
+    def unit(self, number, **fields):
+        return {'unit_number': str(number), 'name': 'Tower', 'apartment_type': 'studio', 'floor': 1,
+                'price_per_month': '12000.00', 'size_sqm': '30.00', 'bedrooms': 1, 'bathrooms': 1,
+                'description': 'A unit', 'amenities': 'Wifi', **fields}
+
+    def test_export_imports_back_unchanged(self):
+        make_apartment('101', description='Corner unit, "sea" view', amenities='Wifi\nAircon')
+        make_apartment('102', status='maintenance')
+        before = list(Apartment.objects.order_by('unit_number').values_list(*portfolio.FIELDS))
+        for fmt in portfolio.FORMATS:
+            with self.subTest(fmt):
+                path = self.path(f'units.{fmt}')
+                self.assertEqual(portfolio.export_apartments(path), 2)
+                Apartment.objects.all().delete()
+                report = portfolio.import_apartments(path)
+                self.assertEqual((report.created, report.rejected), (2, 0))
+                self.assertEqual(list(Apartment.objects.order_by('unit_number').values_list(*portfolio.FIELDS)), before)
+
+    def test_invalid_rows_are_reported_by_line(self):
+        path = self.write('units.jsonl', [self.unit(101), '', self.unit(102, floor='high'), '{oops'])
+        report = portfolio.import_apartments(path)
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertIn('floor', report.errors[0][1])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_fixed_row_resumes_after_the_checkpoint(self):
+        units = [self.unit(number) for number in range(101, 107)]
+        units[4] = self.unit(105, bedrooms='many')
+        path = self.write('units.jsonl', units)
+        with self.assertRaises(portfolio.ImportStopped) as stopped:
+            portfolio.import_apartments(path, batch_size=2, max_errors=0)
+        self.assertTrue(stopped.exception.checkpointed)
+        self.assertNotIn('..', str(stopped.exception))
+        self.assertEqual(Apartment.objects.count(), 4)
+
+        with self.assertRaisesMessage(portfolio.PortfolioError, 'pass --resume'):
+            portfolio.import_apartments(path, batch_size=2)
+        # The fix changes the line's length, so byte offsets after it move
+        units[4] = self.unit(105, bedrooms=3, description='Fixed')
+        self.write('units.jsonl', units)
+        report = portfolio.import_apartments(path, batch_size=2, resume=True)
+        self.assertEqual((report.created, report.line), (6, 6))
+        self.assertEqual(Apartment.objects.get(unit_number='105').bedrooms, 3)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_csv_resume_counts_physical_lines(self):
+        for number in range(101, 105):
+            make_apartment(str(number), amenities='Wifi\nAircon')  # quoted across two lines
+        path = self.path('units.csv')
+        portfolio.export_apartments(path)
+        Apartment.objects.all().delete()
+        with open(path, newline='') as f:
+            exported = f.read()
+        with open(path, 'a', newline='') as f:
+            f.write('105,Tower,studio,ninth,1,1,1,1,available,A unit,Wifi,\n')
+        with self.assertRaises(portfolio.ImportStopped):
+            portfolio.import_apartments(path, batch_size=2, max_errors=0)
+
+        with open(path, 'w', newline='') as f:
+            f.write(exported + '105,Tower,studio,9,1,1,1,1,available,A unit,Wifi,\n')
+        report = portfolio.import_apartments(path, batch_size=2, resume=True)
+        self.assertEqual((report.created, report.rejected), (5, 0))
+        self.assertEqual(Apartment.objects.get(unit_number='104').amenities, 'Wifi\nAircon')
+
+    def test_lines_added_before_the_checkpoint_are_caught(self):
+        units = [self.unit(number) for number in range(101, 105)] + ['{oops']
+        path = self.write('units.jsonl', units)
+        with self.assertRaises(portfolio.ImportStopped):
+            portfolio.import_apartments(path, batch_size=2, max_errors=0)
+        self.write('units.jsonl', [self.unit(100)] + units[:4])
+        with self.assertRaisesMessage(portfolio.PortfolioError, 'changed before line 4'):
+            portfolio.import_apartments(path, batch_size=2, resume=True)
+
+    def test_command_only_suggests_resume_when_something_was_committed(self):
+        path = self.write('units.jsonl', ['{oops'])
+        with self.assertRaisesMessage(CommandError, 'Nothing was imported') as raised:
+            call_command('portfolio', 'import', path, '--max-errors', '0')
+        self.assertNotIn('--resume', str(raised.exception))
+
+
+class ReadCursorTests(TestCase):
+    """Unread messages are the ones past each participant's read cursor"""
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = User.objects.create_user('tenant')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.conversation, _ = Conversation.get_or_create_between([self.tenant, self.staff], 'Lease')
+
+    def say(self, sender, content='Hello'):
+        return Message.objects.create(conversation=self.conversation, sender=sender, content=content)
+
+    def unread(self, user):
+        return ConversationParticipant.objects.with_unread_count().get(conversation=self.conversation, user=user).unread_count
+
+    def test_with_unread_count(self):
+        self.say(self.staff)
+        self.say(self.staff)
+        self.say(self.tenant)
+        self.assertEqual(self.unread(self.tenant), 2)
+        self.assertEqual(self.unread(self.staff), 1)
+        self.conversation.mark_read(self.tenant)
+        self.assertEqual(self.unread(self.tenant), 0)
+
+    def test_joining_starts_with_the_history_read(self):
+        self.say(self.staff)
+        latest = self.say(self.tenant)
+        manager = User.objects.create_user('manager', is_staff=True)
+        self.conversation.participants.add(manager)
+        self.assertEqual(self.unread(manager), 0)
+        state = ConversationParticipant.objects.get(conversation=self.conversation, user=manager)
+        self.assertEqual(state.last_read_message_id, latest.pk)
+
+        other, _ = Conversation.get_or_create_between([self.tenant, self.staff], 'Deposit')
+        Message.objects.create(conversation=other, sender=self.staff, content='Paid?')
+        owner = User.objects.create_user('owner')
+        owner.conversations.add(self.conversation, other)
+        self.assertFalse([
+            state.unread_count for state in ConversationParticipant.objects.with_unread_count().filter(user=owner)
+            if state.unread_count
+        ])
+
+    def test_mark_read_leaves_a_message_arriving_meanwhile_unread(self):
+        self.say(self.staff)
+        update = QuerySet.update
+        arrived = []
+
+        def update_after_a_new_message(queryset, **kwargs):
+            # Lands between mark_read's count and its cursor update
+            if queryset.model is ConversationParticipant and not arrived:
+                arrived.append(self.say(self.staff, 'Meanwhile'))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_after_a_new_message):
+            self.assertEqual(self.conversation.mark_read(self.tenant), 1)
+        self.assertTrue(arrived)
+        self.assertEqual(self.unread(self.tenant), 1)
+        self.assertEqual(self.conversation.mark_read(self.tenant), 1)
+        self.assertEqual(self.unread(self.tenant), 0)
+
+    def test_deleting_messages_forgets_the_readers_counters(self):
+        self.say(self.staff)
+        self.say(self.staff)
+        self.assertEqual(counters.unread_counts(self.tenant)['messages'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                counters.forget_message_readers(Message.objects.filter(sender=self.staff))
+            Message.objects.filter(sender=self.staff).delete()
+        self.assertEqual(counters.unread_counts(self.tenant)['messages'], 0)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Starts each test migrated back to ``before``; ends it migrated forward again"""
+
+    before = after = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        self.executor.loader.build_graph()
+        self.executor.migrate(targets)
+        return self.executor.loader.project_state(targets).apps
+
+
+class ReadCursorMigrationTests(MigrationTestCase):
+    """Migration 0015 turns the read flags into cursors and back"""
+
+    before = [('reservations', '0014_retention_archives')]
+    after = [('reservations', '0015_message_read_cursors')]
+
+    def test_backfill_and_reverse(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        User = apps.get_model('auth', 'User')
+        Conversation = apps.get_model('reservations', 'Conversation')
+        Participant = apps.get_model('reservations', 'ConversationParticipant')
+        Message = apps.get_model('reservations', 'Message')
+        tenant = User.objects.create(username='tenant')
+        staff = User.objects.create(username='staff')
+        conversation = Conversation.objects.create(subject='Lease')
+        read = Message.objects.create(conversation=conversation, sender=staff, content='read', is_read=True)
+        unread = Message.objects.create(conversation=conversation, sender=staff, content='unread', is_read=False)
+        reply = Message.objects.create(conversation=conversation, sender=tenant, content='reply', is_read=True)
+        Participant.objects.create(conversation=conversation, user=tenant, unread_count=1)
+        Participant.objects.create(conversation=conversation, user=staff, unread_count=0)
+        idle = Conversation.objects.create(subject='Empty')
+        Participant.objects.create(conversation=idle, user=tenant, unread_count=0)
+
+        apps = self.migrate(self.after)
+        Participant = apps.get_model('reservations', 'ConversationParticipant')
+        cursors = Participant.objects.filter(conversation_id=conversation.pk).values_list('user_id', 'last_read_message_id')
+        self.assertEqual(dict(cursors), {tenant.pk: unread.pk - 1, staff.pk: reply.pk})
+        self.assertEqual(Participant.objects.get(conversation_id=idle.pk).last_read_message_id, 0)
+
+        apps = self.migrate(self.before)
+        Participant = apps.get_model('reservations', 'ConversationParticipant')
+        Message = apps.get_model('reservations', 'Message')
+        self.assertEqual(
+            dict(Message.objects.values_list('pk', 'is_read')), {read.pk: True, unread.pk: False, reply.pk: True},
+        )
+        self.assertEqual(
+            dict(Participant.objects.filter(conversation_id=conversation.pk).values_list('user_id', 'unread_count')),
+            {tenant.pk: 1, staff.pk: 0},
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaCacheFillTests(TransactionTestCase):
+    """
+    Shared caches are filled from the primary. replica_1 isn't a configured
+    database, so a read routed there fails instead of returning its rows.
+    """
+
+    def setUp(self):
+        replicas.monitor.record('replica_1', 0.0)
+        self.addCleanup(replicas.monitor.forget)
+        self.tenant = User.objects.create_user('tenant')
+        self.apartment = make_apartment()
+
+    def test_a_lagging_replica_cannot_poison_the_tree(self):
+        # Committed on the primary; a lagging replica doesn't have it yet
+        Reservation.objects.create(
+            user=self.tenant, apartment=self.apartment, status='approved',
+            check_in=date(2030, 3, 1), check_out=date(2030, 4, 1),
+        )
+        with replicas.routing(replicas.RequestState()) as state:
+            self.assertFalse(availability.is_available(self.apartment, date(2030, 3, 15), date(2030, 3, 20)))
+            self.assertFalse(state.pinned)
+            # Reads that aren't cached still go to the replica
+            with self.assertRaises(ConnectionDoesNotExist):
+                Apartment.objects.count()
+
+    def test_other_cache_fills(self):
+        notifications.deliver([self.tenant], 'new_message', 'Hello')
+        with replicas.routing(replicas.RequestState()) as state:
+            self.assertEqual(counters.unread_counts(self.tenant)['notifications'], 1)
+            self.assertEqual(stats.global_stats()['total_apartments'], 1)
+            rows = facets.cells(Apartment.objects.all(), facets.signature())
+            self.assertEqual(sum(row[-1] for row in rows), 1)
+            self.assertFalse(state.pinned)
+
+    def test_a_write_inside_keeps_the_pin(self):
+        with replicas.routing(replicas.RequestState()) as state:
+            with replicas.primary_reads():
+                self.assertEqual(Apartment.objects.count(), 1)
+                make_apartment('102')
+            self.assertTrue(state.pinned)
+            self.assertEqual(Apartment.objects.count(), 2)
+
+
+class FragmentVersionTests(TestCase):
+    """Cards are re-rendered after an edit to the rows they show, not before it commits"""
+
+    def test_apartment_and_user_edits_bump_on_commit(self):
+        apartment = make_apartment()
+        user = User.objects.create_user('tenant')
+        for save in (apartment.save, user.save):
+            version = fragments.version()
+            with self.captureOnCommitCallbacks(execute=True):
+                save()
+                self.assertEqual(fragments.version(), version)
+            self.assertNotEqual(fragments.version(), version)
+
+        version = fragments.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        self.assertEqual(fragments.version(), version)
+
+
+class FacetTests(TestCase):
+    """One cached grouped query answers every facet count; each facet ignores its own selection"""
+
+    def setUp(self):
+        cache.clear()
+        make_apartment('101', price_per_month=8_000)
+        make_apartment('102', price_per_month=15_000, bedrooms=2)
+        make_apartment('103', price_per_month=15_000, apartment_type='condo', bedrooms=2)
+        make_apartment('104', price_per_month=40_000, apartment_type='condo', status='maintenance')
+
+    def test_cells_are_grouped_and_cached(self):
+        rows = facets.cells(Apartment.objects.all(), facets.signature())
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(sum(row[-1] for row in rows), 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.cells(Apartment.objects.all(), facets.signature()), rows)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_apartment('105', price_per_month=70_000)
+            # Not before the commit, or stale counts would be cached under the new version
+            self.assertEqual(facets.cells(Apartment.objects.all(), facets.signature()), rows)
+        self.assertEqual(sum(row[-1] for row in facets.cells(Apartment.objects.all(), facets.signature())), 5)
+
+    def test_signature(self):
+        self.assertEqual(facets.signature('  Studio   unit '), facets.signature('studio unit'))
+        self.assertNotEqual(facets.signature(min_price=10_000), facets.signature())
+        with_dates = facets.signature(available_from=date(2030, 1, 1))
+        availability.invalidate()
+        self.assertNotEqual(facets.signature(available_from=date(2030, 1, 1)), with_dates)
+
+    def test_a_facet_ignores_its_own_selection(self):
+        rows = facets.cells(Apartment.objects.all(), facets.signature())
+        counts, total = facets.facet_counts(rows, {'apartment_type': 'condo', 'price_bucket': 1})
+        self.assertEqual(total, 1)
+        # Other types and buckets show what switching to them would give
+        self.assertEqual(counts['apartment_type'], {'studio': 1, 'condo': 1})
+        self.assertEqual(counts['price_bucket'], {1: 1, 3: 1})
+        self.assertEqual(counts['bedrooms'], {2: 1})
+
+    def test_price_chip_is_a_selection(self):
+        self.client.force_login(User.objects.create_user('tenant'))
+        response = self.client.get('/apartments/', {'price': 1})
+        self.assertEqual(response.context['total_matching'], 2)
+        self.assertEqual([unit.unit_number for unit in response.context['apartments']], ['102', '103'])
+        chips = {chip['value']: chip for chip in response.context['facets']['price_bucket']}
+        self.assertEqual((chips[0]['count'], chips[1]['count'], chips[3]['count']), (1, 2, 1))
+        self.assertTrue(chips[1]['selected'])
+        self.assertNotIn('price', chips[1]['query'])
+        self.assertIn('price=0', chips[0]['query'])
+
+
+class PaginationTests(TestCase):
+    """Keyset pages: cursors round-trip in both directions and ties fall back to the pk"""
+
+    def setUp(self):
+        # Floors repeat, so most of the order comes from the pk tie-breaker
+        for number in range(11):
+            make_apartment(f'{number:03}', floor=number % 3)
+        self.queryset = Apartment.objects.order_by('-floor')
+        # The pk follows the direction of the last ordering key
+        self.expected = list(self.queryset.order_by('-floor', '-pk'))
+
+    def walk(self, queryset, page_size, **kwargs):
+        """Every page forward, then back again from the last one"""
+        pages, cursor = [], None
+        while True:
+            page = pagination.paginate_queryset(queryset, cursor, page_size, **kwargs)
+            pages.append(page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        backwards = [page.items]
+        while page.has_previous:
+            page = pagination.paginate_queryset(queryset, page.previous_cursor, page_size, **kwargs)
+            backwards.append(page.items)
+        self.assertEqual(backwards[::-1], pages)
+        return pages
+
+    def test_round_trip_with_ties(self):
+        pages = self.walk(self.queryset, 4)
+        self.assertEqual([len(page) for page in pages], [4, 4, 3])
+        self.assertEqual([item for page in pages for item in page], self.expected)
+
+    def test_backwards_starts_from_the_end(self):
+        pages = self.walk(self.queryset, 4, backwards=True)
+        self.assertEqual(pages[0], self.expected[-4:])
+        self.assertEqual([item for page in reversed(pages) for item in page], self.expected)
+
+    def test_with_count(self):
+        page = pagination.paginate_queryset(self.queryset, page_size=4, with_count=True)
+        self.assertEqual(page.count, 11)
+        self.assertIsNone(pagination.paginate_queryset(self.queryset, page_size=4).count)
+
+    def test_invalid_cursors(self):
+        keys = pagination._ordering(self.queryset)
+        cursor = pagination.paginate_queryset(self.queryset, page_size=4).next_cursor
+        for bad in ('!!!', cursor[:-3], pagination.encode_cursor(keys[:1], self.expected[0], 'next'),
+                    pagination.encode_cursor(keys, self.expected[0], 'sideways')):
+            with self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(self.queryset, keys, bad)
+        # The view helper falls back to the first page
+        page = pagination.paginate(RequestFactory().get('/', {'cursor': '!!!'}), self.queryset, page_size=4)
+        self.assertEqual(page.items, self.expected[:4])
+        with self.assertRaises(ValueError):
+            pagination.paginate_queryset(Apartment.objects.order_by('?'))
+
+    def test_search_rank_ordering(self):
+        # Float ranks, many of them equal: the seek has to compare them exactly
+        for number in range(20):
+            make_apartment(f'G{number:02}', name='Garden ' * (number % 4 + 1), floor=number % 2)
+        results = search.search_apartments(Apartment.objects.all(), 'garden')
+        self.assertEqual(len({apartment.search_rank for apartment in results}), 4)
+        pages = self.walk(results, 6)
+        self.assertEqual([item for page in pages for item in page], list(results))
+        self.assertEqual(sum(len(page) for page in pages), 20)
+
+
+class BootstrapTests(TestCase):
+    """Startup work runs once per change of migrations, superuser or fixture, and is skipped otherwise"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.fixture = os.path.join(self.directory, 'apartments.json')
+        patcher = mock.patch.object(bootstrap, 'fixture_path', return_value=Path(self.fixture))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def steps(self, report):
+        return [name for name, _ in report.steps]
+
+    def write_fixture(self, *unit_numbers):
+        apartments = [make_apartment(number) for number in unit_numbers]
+        with open(self.fixture, 'w') as fixture:
+            fixture.write(serializers.serialize('json', apartments))
+        Apartment.objects.filter(pk__in=[apartment.pk for apartment in apartments]).delete()
+
+    def test_first_run_then_skip(self):
+        self.write_fixture('101')
+        report = bootstrap.run_bootstrap()
+        self.assertFalse(report.skipped)
+        self.assertEqual(self.steps(report), ['fingerprint', 'check', 'lock wait', 'migrate', 'superuser', 'loaddata'])
+        self.assertTrue(User.objects.filter(username=bootstrap.SUPERUSER[0], is_superuser=True).exists())
+        self.assertTrue(Apartment.objects.filter(unit_number='101').exists())
+
+        # A warm start is the one SELECT
+        with self.assertNumQueries(1):
+            self.assertTrue(bootstrap.run_bootstrap().skipped)
+
+    def test_only_what_changed_runs_again(self):
+        bootstrap.run_bootstrap()
+        self.write_fixture('102')
+        self.assertEqual(self.steps(bootstrap.run_bootstrap())[3:], ['loaddata'])
+
+        # An edited migration (same name) re-runs migrate, but not the unchanged fixture
+        source = bootstrap._migration_source
+
+        def edited(migration):
+            return source(migration) + (b'\n# edited' if migration.name == '0001_initial' else b'')
+
+        with mock.patch.object(bootstrap, '_migration_source', side_effect=edited):
+            self.assertEqual(self.steps(bootstrap.run_bootstrap())[3:], ['migrate', 'superuser'])
+
+    def test_a_database_cache_gets_its_table(self):
+        bootstrap.run_bootstrap()
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'bootstrap_cache'}}
+        with override_settings(CACHES=caches):
+            self.assertIn('migrate', self.steps(bootstrap.run_bootstrap()))
+        self.assertIn('bootstrap_cache', connection.introspection.table_names())
+
+    def test_waiters_recheck_after_the_lock(self):
+        wanted = (bootstrap.migrations_fingerprint(), bootstrap.fixture_hash())
+
+        @contextmanager
+        def finished_by_another_instance(using):
+            # Someone else held the lock and did the work meanwhile
+            bootstrap.save_state(using, wanted, bootstrap.BootstrapReport())
+            yield
+
+        with mock.patch.object(bootstrap, 'bootstrap_lock', finished_by_another_instance):
+            report = bootstrap.run_bootstrap()
+        self.assertTrue(report.skipped)
+        self.assertEqual(self.steps(report), ['fingerprint', 'check', 'lock wait'])
+
+    def test_sqlite_lock_file_excludes_other_processes(self):
+        database = os.path.join(self.directory, 'db.sqlite3')
+        with mock.patch.dict(connection.settings_dict, NAME=database), \
+                mock.patch.object(connection, 'is_in_memory_db', return_value=False):
+            with bootstrap.bootstrap_lock():
+                with open(f'{database}.bootstrap.lock') as other:
+                    with self.assertRaises(BlockingIOError):
+                        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with open(f'{database}.bootstrap.lock') as other:
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+class TemplateCompilerTests(SimpleTestCase):
+    """Flattened templates render exactly like the originals, or are kept unflattened"""
+
+    TREE = {
+        'tc/page.html': "<ul>{% for apartment in apartments %}{% include 'tc/row.html' %}{% endfor %}</ul>",
+        'tc/row.html': "<li>{{ apartment.unit_number }}{% include 'tc/badge.html' with label=apartment.status %}</li>",
+        'tc/badge.html': '<b>{{ label|upper }}</b>',
+        'tc/isolated.html': "{% include 'tc/badge.html' with label='x' only %}{% include template_name %}",
+        'tc/extended.html': "{% include 'tc/base_child.html' %}",
+        'tc/base_child.html': "{% extends 'tc/base.html' %}{% block body %}child{% endblock %}",
+        'tc/base.html': '{% block body %}{% endblock %}',
+        # An included template's {% cycle %} restarts on every include; inlined, it would keep counting
+        'tc/cycles.html': "{% for apartment in apartments %}{% include 'tc/cycle.html' %}{% endfor %}",
+        'tc/cycle.html': "{% cycle 'odd' 'even' %}",
+    }
+
+    def setUp(self):
+        self.source = Path(tempfile.mkdtemp())
+        self.output = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.output)
+        for name, text in self.TREE.items():
+            (self.source / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.source / name).write_text(text, encoding='utf-8')
+
+    def test_flatten(self):
+        roots = [self.source]
+        page, count = template_compiler.flatten(self.TREE['tc/page.html'], roots)
+        self.assertEqual(count, 2)
+        self.assertNotIn('include', page)
+        self.assertIn("{% with label=apartment.status %}<b>{{ label|upper }}</b>{% endwith %}", page)
+        # only, a variable name and a component that extends stay real includes
+        isolated = self.TREE['tc/isolated.html']
+        self.assertEqual(template_compiler.flatten(isolated, roots), (isolated, 0))
+        self.assertEqual(template_compiler.flatten(self.TREE['tc/extended.html'], roots)[1], 0)
+
+    def test_compile_and_verify(self):
+        templates = [{**settings.TEMPLATES[0], 'DIRS': [self.source]}]
+        with override_settings(TEMPLATES=templates), \
+                mock.patch.object(template_compiler, 'source_roots', return_value=[self.source]):
+            report = template_compiler.compile_templates(self.output, log=lambda line: None)
+        self.assertEqual(report['flattened'], ['tc/page.html', 'tc/row.html'])
+        self.assertEqual(report['rejected'], ['tc/cycles.html'])
+        self.assertEqual((self.output / 'tc/cycles.html').read_text(), self.TREE['tc/cycles.html'])
+
+        original = template_compiler.make_engine([self.source])
+        compiled = template_compiler.make_engine([self.output, self.source])
+        for context in template_compiler.sample_contexts(rows=5):
+            for name in self.TREE:
+                if name != 'tc/isolated.html':
+                    self.assertEqual(
+                        compiled.get_template(name).render(Context(context)),
+                        original.get_template(name).render(Context(context)),
+                    )
+
+
+class ConversationSummaryMigrationTests(MigrationTestCase):
+    """Migration 0009 fills in each thread's summary and its participants' unread counts"""
+
+    before = [('reservations', '0008_alter_notification_notification_type')]
+    after = [('reservations', '0009_conversation_summary')]
+
+    def test_backfill(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        User = apps.get_model('auth', 'User')
+        Conversation = apps.get_model('reservations', 'Conversation')
+        Message = apps.get_model('reservations', 'Message')
+        tenant = User.objects.create(username='tenant')
+        staff = User.objects.create(username='staff')
+        conversation = Conversation.objects.create(subject='Lease')
+        conversation.participants.add(tenant, staff)
+        Message.objects.create(conversation=conversation, sender=staff, content='first', is_read=True)
+        Message.objects.create(conversation=conversation, sender=staff, content='second', is_read=False)
+        last = Message.objects.create(conversation=conversation, sender=tenant, content='x' * 300, is_read=False)
+        empty = Conversation.objects.create(subject='Nothing yet')
+        empty.participants.add(tenant)
+
+        apps = self.migrate(self.after)
+        Conversation = apps.get_model('reservations', 'Conversation')
+        Participant = apps.get_model('reservations', 'ConversationParticipant')
+        summary = Conversation.objects.get(pk=conversation.pk)
+        self.assertEqual(summary.last_message_id, last.pk)
+        self.assertEqual(summary.last_message_preview, 'x' * 255)
+        self.assertEqual(summary.last_message_sender_id, tenant.pk)
+        self.assertEqual(summary.last_message_at, last.created_at)
+        self.assertEqual(
+            dict(Participant.objects.filter(conversation_id=conversation.pk).values_list('user_id', 'unread_count')),
+            {tenant.pk: 1, staff.pk: 1},
+        )
+        self.assertIsNone(Conversation.objects.get(pk=empty.pk).last_message_id)
+        self.assertEqual(Participant.objects.get(conversation_id=empty.pk).unread_count, 0)
+
+
+class ConversationSummaryTests(TestCase):
+    """record_message keeps the thread's summary on the latest message"""
+
+    def test_record_message(self):
+        tenant = User.objects.create_user('tenant')
+        staff = User.objects.create_user('staff', is_staff=True)
+        conversation, _ = Conversation.get_or_create_between([tenant, staff], 'Lease')
+        message = Message.objects.create(conversation=conversation, sender=staff, content='y' * 300)
+        # Message saves call it (signals.py); it reports who the message is unread for
+        self.assertEqual(conversation.record_message(message), [tenant.pk])
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message, message)
+        self.assertEqual(conversation.last_message_preview, 'y' * 255)
+        self.assertEqual(conversation.last_message_sender, staff)
+        self.assertEqual(conversation.last_message_at, message.created_at)
+        self.assertEqual(conversation.updated_at, message.created_at)
 
-# Create your tests here.
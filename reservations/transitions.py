@@ -0,0 +1,117 @@
+"""
+Reservation state machine.
+
+Every status change allowed by Reservation.TRANSITIONS (pending ->
+approved/denied/cancelled, approved -> completed/cancelled) goes through
+``transition()``. Each call:
+
+* runs in one transaction;
+* locks the apartment row first, then the reservation row
+  (``select_for_update``), always in that order, so concurrent approvals
+  for the same unit serialize instead of deadlocking;
+* approves only if no other approved tenancy of the unit overlaps the
+  stay (``availability.booked_apartment_ids``), so a unit occupied now can
+  be approved for after its tenancy ends. The apartment is written before
+  that check: on SQLite (no row locks) the first write takes the database
+  write lock, so two overlapping approvals can't both pass it;
+* writes the reservation with a compare-and-swap UPDATE (``WHERE status =
+  <expected>``), so without row locks the loser of a race sees 0 rows
+  updated rather than overwriting the winner;
+* raises TransitionError when the move is not allowed or lost a race.
+
+The apartment's status says whether it has an approved tenancy at all.
+
+SQLite reports lock contention as an immediate "database is locked" error.
+Those transactions are retried a few times with a short backoff.
+"""
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .models import Apartment, Reservation
+from . import availability, facets, stats
+
+# Transitions that review the request and record who did it
+REVIEW_STATUSES = {'approved', 'denied'}
+
+LOCK_RETRIES = 20
+
+
+class TransitionError(Exception):
+    pass
+
+
+def transition(reservation, to_status, actor=None, admin_notes=None):
+    """
+    Move ``reservation`` to ``to_status`` and keep its apartment's status consistent.
+
+    Returns the updated reservation (the passed instance is refreshed too).
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return _transition(reservation, to_status, actor, admin_notes)
+        except OperationalError as e:
+            # SQLite has no row locks and reports contention as "database is locked"
+            # instead of waiting; back off and retry the whole transaction
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(random.uniform(0.005, 0.02) * (attempt + 1))
+
+
+def _transition(reservation, to_status, actor, admin_notes):
+    with transaction.atomic():
+        apartment = Apartment.objects.select_for_update().get(pk=reservation.apartment_id)
+        current = Reservation.objects.select_for_update().get(pk=reservation.pk)
+        from_status = current.status
+
+        if not current.can_transition_to(to_status):
+            raise TransitionError(
+                f"Cannot change a {current.get_status_display().lower()} reservation to {to_status}."
+            )
+
+        now = timezone.now()
+        changes = {'status': to_status, 'updated_at': now}
+        if to_status in REVIEW_STATUSES:
+            changes.update(reviewed_by=actor, reviewed_at=now)
+        if admin_notes is not None:
+            changes['admin_notes'] = admin_notes
+
+        # Claim or release the unit first; it is the contended row
+        if to_status == 'approved':
+            if apartment.status == 'maintenance':
+                raise TransitionError(f"Unit {apartment.unit_number} is under maintenance.")
+            Apartment.objects.filter(pk=apartment.pk).update(status='occupied', updated_at=now)
+            booked = availability.booked_apartment_ids(current.check_in, current.check_out, exclude_reservation=current)
+            if apartment.pk in booked:
+                raise TransitionError(
+                    f"Unit {apartment.unit_number} is already approved for another tenant for part of those dates."
+                )
+        elif from_status == 'approved':
+            # Tenant leaves (completed) or the approval is revoked (cancelled); the unit is free
+            # once no other approved tenancy remains
+            others = Reservation.objects.filter(
+                apartment=apartment, status__in=availability.BLOCKING_STATUSES
+            ).exclude(pk=current.pk)
+            if not others.exists():
+                Apartment.objects.filter(pk=apartment.pk, status='occupied').update(
+                    status='available', updated_at=now
+                )
+
+        updated = Reservation.objects.filter(pk=current.pk, status=from_status).update(**changes)
+        if not updated:
+            # Only reachable without row locks: someone else moved it first
+            raise TransitionError("This reservation was changed by someone else; please reload.")
+
+        # Queryset updates skip post_save, so invalidate the derived caches here. Robust: they run
+        # after the commit, and a cache write that fails (a locked database cache) must not reach
+        # the retry loop above, which would run the already committed transition again
+        transaction.on_commit(stats.invalidate, robust=True)
+        if from_status in availability.BLOCKING_STATUSES or to_status in availability.BLOCKING_STATUSES:
+            transaction.on_commit(availability.invalidate, robust=True)
+        transaction.on_commit(facets.invalidate, robust=True)
+
+    for field, value in changes.items():
+        setattr(reservation, field, value)
+    return reservation
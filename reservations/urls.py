@@ -10,6 +10,7 @@ urlpatterns = [
     
     # Admin Dashboard
     path('admin-panel/', views.admin_dashboard_view, name='admin_dashboard'),
+    path('admin-panel/sql/', views.sql_profiles_view, name='sql_profiles'),
     
     # Apartments
     path('apartments/', views.apartment_list_view, name='apartment_list'),
@@ -37,5 +38,7 @@ urlpatterns = [
     path('inbox/', views.inbox_view, name='inbox'),
     path('messages/send/', views.send_message_view, name='send_message'),
     path('messages/<int:pk>/', views.message_detail_view, name='message_detail'),
+    path('messages/<int:pk>/read/', views.message_read_view, name='message_read'),
+    path('events/', views.event_stream_view, name='event_stream'),
     path('my-apartment/', views.my_apartment_view, name='my_apartment'),
 ]
\ No newline at end of file
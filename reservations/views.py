@@ -1,13 +1,56 @@
+import json
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.db import transaction
 from django.db.models import Q, Count
 from django.utils import timezone
 from datetime import date
+from decimal import Decimal, InvalidOperation
 from .forms import RegisterForm, TenantProfileForm, ApartmentForm, ReservationForm
+from .search import search_apartments
+from .pagination import paginate
+from .stats import global_stats, user_stats
+from .notifications import delete as delete_notifications, notify, notify_staff
+from .transitions import transition, TransitionError
+from .availability import available_apartments
+from .events import get_broker, user_channel
+from . import facets, fragments, replicas
+from .conditional import apartment_detail_etag, apartment_list_etag, conditional_page
+from .profiling import clear_profiles, recent_profiles
+from .counters import MESSAGES, NOTIFICATIONS, unread_counts, adjust as adjust_counter
 from django.contrib.auth.models import User
-from .models import Apartment, Reservation, Tenant, Notification, Message, Conversation
+from .models import Apartment, Reservation, Tenant, Notification, Message, Conversation, ConversationParticipant
+
+APARTMENTS_PER_PAGE = 24
+RESERVATIONS_PER_PAGE = 20
+NOTIFICATIONS_PER_PAGE = 30
+MESSAGES_PER_PAGE = 50
+SSE_KEEPALIVE = 20
+SSE_RETRY_MS = 5000
+
+
+def _parse_date(value):
+    """YYYY-MM-DD from a query string, or None if it is malformed"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _parse_price(value):
+    """A non-negative price from a query string, or None"""
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
 
 
 def register_view(request):
@@ -64,41 +107,32 @@ def logout_view(request):
 
 @login_required
 def dashboard_view(request):
-    # Statistics
-    total_apartments = Apartment.objects.count()
-    available_apartments = Apartment.objects.filter(status='available').count()
+    # Statistics (cached snapshot, one aggregate query per model on a miss)
+    stats = global_stats() if request.user.is_staff else user_stats(request.user)
     
-    # Get unread notifications count
-    unread_notifications = Notification.objects.filter(user=request.user, is_read=False).count()
+    # Unread count comes from the cached per-user counter (see counters.py)
+    unread_notifications = unread_counts(request.user)[NOTIFICATIONS]
     
     # Show different stats based on role
     if request.user.is_staff:
-        # ADMIN: See all reservations statistics
-        all_reservations = Reservation.objects.all()
-        pending_reservations = all_reservations.filter(status='pending').count()
-        approved_reservations = all_reservations.filter(status='approved').count()
-        
         # FIXED: Admin sees ALL recent reservations, not just their own
-        recent_reservations = Reservation.objects.all().order_by('-created_at')[:5]
+        recent_reservations = Reservation.objects.select_related('apartment', 'user').order_by('-created_at')[:5]
         
         # Recent reservations to review (from all users)
-        reservations_to_review = Reservation.objects.filter(status='pending').order_by('-created_at')[:5]
+        reservations_to_review = Reservation.objects.filter(status='pending').select_related('apartment', 'user').order_by('-created_at')[:5]
     else:
         # REGULAR USER: See only their reservations
-        user_reservations = Reservation.objects.filter(user=request.user)
-        pending_reservations = user_reservations.filter(status='pending').count()
-        approved_reservations = user_reservations.filter(status='approved').count()
-        recent_reservations = user_reservations[:5]
+        recent_reservations = Reservation.objects.filter(user=request.user).select_related('apartment', 'user')[:5]
         reservations_to_review = None
     
     # Featured apartments
     featured_apartments = Apartment.objects.filter(status='available')[:6]
     
     context = {
-        'total_apartments': total_apartments,
-        'available_apartments': available_apartments,
-        'pending_reservations': pending_reservations,
-        'approved_reservations': approved_reservations,
+        'total_apartments': stats['total_apartments'],
+        'available_apartments': stats['available_apartments'],
+        'pending_reservations': stats['pending_reservations'],
+        'approved_reservations': stats['approved_reservations'],
         'recent_reservations': recent_reservations,
         'featured_apartments': featured_apartments,
         'unread_notifications': unread_notifications,
@@ -110,60 +144,91 @@ def dashboard_view(request):
 
 
 @login_required
+@conditional_page(apartment_list_etag)
 def apartment_list_view(request):
-    apartments = Apartment.objects.all()
-    
     # Search and filter
     search = request.GET.get('search', '')
     apartment_type = request.GET.get('type', '')
     status = request.GET.get('status', '')
+    bedrooms = request.GET.get('bedrooms', '')
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
+    available_from = request.GET.get('available_from', '')
+    available_to = request.GET.get('available_to', '')
     
-    # Debug: Print to console
-    print(f"Search: {search}")
-    print(f"Type: {apartment_type}")
-    print(f"Status: {status}")
-    print(f"Total apartments before filter: {apartments.count()}")
-    
+    # Narrowing filters first; the facet counts are computed over this set
+    apartments = Apartment.objects.all()
     if search:
-        apartments = apartments.filter(
-            Q(name__icontains=search) | 
-            Q(unit_number__icontains=search) |
-            Q(description__icontains=search)
-        )
-        print(f"After search filter: {apartments.count()}")
-    
-    if apartment_type:
-        apartments = apartments.filter(apartment_type=apartment_type)
-        print(f"After type filter: {apartments.count()}")
-    
-    if status:
-        apartments = apartments.filter(status=status)
-        print(f"After status filter: {apartments.count()}")
-    
-    if min_price:
-        apartments = apartments.filter(price_per_month__gte=min_price)
-        print(f"After min_price filter: {apartments.count()}")
-    
-    if max_price:
-        apartments = apartments.filter(price_per_month__lte=max_price)
-        print(f"After max_price filter: {apartments.count()}")
+        # Indexed full-text search, ranked best match first
+        apartments = search_apartments(apartments, search)
+    
+    low, high = _parse_price(min_price), _parse_price(max_price)
+    if low is not None:
+        apartments = apartments.filter(price_per_month__gte=low)
+    if high is not None:
+        apartments = apartments.filter(price_per_month__lte=high)
+    
+    start = _parse_date(available_from) if available_from else None
+    end = _parse_date(available_to) if available_to else None
+    if start and (end is None or end > start):
+        # Units with no approved tenancy overlapping the requested stay
+        apartments = available_apartments(apartments, start, end)
+    else:
+        start = end = None
+    
+    price = request.GET.get('price', '')
+    selected = {
+        'apartment_type': apartment_type or None,
+        'status': status or None,
+        'bedrooms': int(bedrooms) if bedrooms.isdigit() else None,
+        'price_bucket': int(price) if price.isdigit() and int(price) < len(facets.PRICE_BUCKETS) else None,
+    }
+    # One grouped query (cached per filter signature) for every facet count, see facets.py
+    counts, total = facets.facet_counts(
+        facets.cells(apartments, facets.signature(search, low, high, start, end)), selected
+    )
+    for field, value in selected.items():
+        if value is not None:
+            if field == 'price_bucket':
+                apartments = apartments.filter(facets.bucket_filter(value))
+            else:
+                apartments = apartments.filter(**{field: value})
+    
+    facet_options = facets.options(counts, selected)
+    for bucket in facet_options['price_bucket']:
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        # A chip toggles its bucket; the min/max inputs stay as they are
+        if bucket['selected']:
+            params.pop('price', None)
+        else:
+            params['price'] = bucket['value']
+        bucket['query'] = params.urlencode()
     
-    print(f"Final count: {apartments.count()}")
+    # The rows fill cached cards (fragments.py), so they come from the primary
+    with replicas.primary_reads():
+        page = paginate(request, apartments, page_size=APARTMENTS_PER_PAGE)
     
     context = {
-        'apartments': apartments,
+        'apartments': page,
+        'total_matching': total,
+        'facets': facet_options,
         'search': search,
         'apartment_type': apartment_type,
         'status': status,
+        'bedrooms': bedrooms,
         'min_price': min_price,
         'max_price': max_price,
+        'price': price,
+        'available_from': available_from,
+        'available_to': available_to,
+        **fragments.context(),
     }
     
     return render(request, 'reservations/apartment_list.html', context)
 
 @login_required
+@conditional_page(apartment_detail_etag)
 def apartment_detail_view(request, pk):
     apartment = get_object_or_404(Apartment, pk=pk)
     return render(request, 'reservations/apartment_detail.html', {'apartment': apartment})
@@ -247,12 +312,19 @@ def reservation_list_view(request):
     if status:
         reservations = reservations.filter(status=status)
     
+    # Joined up front so cache misses don't load each card's relations one by one
+    reservations = reservations.select_related('apartment', 'user', 'reviewed_by')
+    
+    with replicas.primary_reads():
+        page = paginate(request, reservations, page_size=RESERVATIONS_PER_PAGE, with_count=True)
+    
     context = {
-        'reservations': reservations,
+        'reservations': page,
         'status': status,
         'view_mode': view_mode,
         'title': title,
         'is_admin': request.user.is_staff,
+        **fragments.context(),
     }
     
     return render(request, 'reservations/reservation_list.html', context)
@@ -281,17 +353,16 @@ def reservation_create_view(request):
             
             # If Admin chooses "Auto-approve"
             if request.user.is_staff and request.POST.get('auto_approve'):
-                reservation.status = 'approved'
-                reservation.reviewed_by = request.user
-                reservation.reviewed_at = timezone.now()
-                
-                # SAVE FIRST before changing apartment status
-                reservation.save()
-                
-                # Mark apartment as occupied immediately
                 apartment = reservation.apartment
-                apartment.status = 'occupied'
-                apartment.save()
+                try:
+                    # Create and approve together so a failed approval leaves no stray pending request
+                    with transaction.atomic():
+                        reservation.status = 'pending'
+                        reservation.save()
+                        transition(reservation, 'approved', actor=request.user)
+                except TransitionError as e:
+                    messages.error(request, str(e))
+                    return redirect('reservation_list')
                 
                 messages.success(request, f'Reservation for Unit {apartment.unit_number} auto-approved!')
             else:
@@ -303,14 +374,11 @@ def reservation_create_view(request):
                 messages.success(request, 'Move-in request submitted! Waiting for admin review.')
                 
                 # NOW create notifications after reservation is saved
-                admins = User.objects.filter(is_staff=True)
-                for admin in admins:
-                    Notification.objects.create(
-                        user=admin,
-                        notification_type='new_reservation',
-                        reservation=reservation,
-                        message=f"New reservation request from {request.user.username} for Unit {reservation.apartment.unit_number}"
-                    )
+                notify_staff(
+                    'new_reservation',
+                    f"New reservation request from {request.user.username} for Unit {reservation.apartment.unit_number}",
+                    reservation=reservation,
+                )
             
             return redirect('reservation_list')
     else:
@@ -382,16 +450,19 @@ def reservation_delete_view(request, pk):
         return redirect('reservation_list')
     
     if request.method == 'POST':
-        reservation.status = 'cancelled'
-        reservation.save()
+        try:
+            transition(reservation, 'cancelled', actor=request.user)
+        except TransitionError as e:
+            messages.error(request, str(e))
+            return redirect('reservation_list')
         
         # Create notification for user (if admin cancelled someone else's reservation)
         if request.user.is_staff and reservation.user != request.user:
-            Notification.objects.create(
-                user=reservation.user,
-                notification_type='reservation_cancelled',
+            notify(
+                [reservation.user_id],
+                'reservation_cancelled',
+                f'Your reservation for {reservation.apartment.name} has been cancelled by admin.',
                 reservation=reservation,
-                message=f'Your reservation for {reservation.apartment.name} has been cancelled by admin.'
             )
         
         messages.success(request, 'Reservation cancelled successfully!')
@@ -411,22 +482,21 @@ def reservation_approve_view(request, pk):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
     
-    reservation = get_object_or_404(Reservation, pk=pk)
-    reservation.status = 'approved'
-    reservation.reviewed_by = request.user
-    reservation.reviewed_at = timezone.now()
-    reservation.save()
-    
-    # Logic: Once approved, the apartment is no longer available
+    reservation = get_object_or_404(Reservation.objects.select_related('apartment'), pk=pk)
     apartment = reservation.apartment
-    apartment.status = 'occupied'
-    apartment.save()
     
-    Notification.objects.create(
-        user=reservation.user,
-        notification_type='reservation_approved',
+    # Logic: Once approved, the apartment is no longer available (enforced atomically)
+    try:
+        transition(reservation, 'approved', actor=request.user)
+    except TransitionError as e:
+        messages.error(request, str(e))
+        return redirect('admin_dashboard')
+    
+    notify(
+        [reservation.user_id],
+        'reservation_approved',
+        f"Your move-in request for Unit {apartment.unit_number} has been approved!",
         reservation=reservation,
-        message=f"Your move-in request for Unit {apartment.unit_number} has been approved!"
     )
     
     messages.success(request, f"Reservation approved. Unit {apartment.unit_number} is now Occupied.")
@@ -441,7 +511,7 @@ def reservation_deny_view(request, pk):
     
     reservation = get_object_or_404(Reservation, pk=pk)
     
-    if not reservation.can_be_denied():
+    if not reservation.can_transition_to('denied'):
         messages.error(request, 'This reservation cannot be denied.')
         return redirect('reservation_list')
     
@@ -452,18 +522,18 @@ def reservation_deny_view(request, pk):
             messages.error(request, 'Please provide a reason for denial.')
             return render(request, 'reservations/reservation_deny.html', {'reservation': reservation})
         
-        reservation.status = 'denied'
-        reservation.reviewed_by = request.user
-        reservation.reviewed_at = timezone.now()
-        reservation.admin_notes = admin_notes
-        reservation.save()
+        try:
+            transition(reservation, 'denied', actor=request.user, admin_notes=admin_notes)
+        except TransitionError as e:
+            messages.error(request, str(e))
+            return redirect('reservation_list')
         
         # Create notification for user
-        Notification.objects.create(
-            user=reservation.user,
-            notification_type='reservation_denied',
+        notify(
+            [reservation.user_id],
+            'reservation_denied',
+            f'Your reservation for {reservation.apartment.name} has been denied. Reason: {admin_notes}',
             reservation=reservation,
-            message=f'Your reservation for {reservation.apartment.name} has been denied. Reason: {admin_notes}'
         )
         
         messages.success(request, 'Reservation denied and user notified.')
@@ -479,13 +549,14 @@ def notifications_view(request):
     
     # Mark as read
     if request.GET.get('mark_read'):
-        notifications.update(is_read=True)
+        marked = notifications.filter(is_read=False).update(is_read=True)
+        adjust_counter(NOTIFICATIONS, [request.user.pk], -marked)
         messages.success(request, 'All notifications marked as read.')
         return redirect('notifications')
     
     context = {
-        'notifications': notifications,
-        'unread_notifications_count': notifications.filter(is_read=False).count(),
+        'notifications': paginate(request, notifications, page_size=NOTIFICATIONS_PER_PAGE),
+        'unread_notifications_count': unread_counts(request.user)[NOTIFICATIONS],
     }
     
     return render(request, 'reservations/notifications.html', context)
@@ -495,8 +566,9 @@ def notifications_view(request):
 def notification_read_view(request, pk):
     """Mark a single notification as read"""
     notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    notification.is_read = True
-    notification.save()
+    # Conditional update, so a double click can't decrement the counter twice
+    if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+        adjust_counter(NOTIFICATIONS, [request.user.pk], -1)
     
     return redirect('notifications')
 
@@ -507,6 +579,8 @@ def notification_delete_view(request, pk):
     if request.method == 'POST':
         notification = get_object_or_404(Notification, pk=pk, user=request.user)
         notification.delete()
+        if not notification.is_read:
+            adjust_counter(NOTIFICATIONS, [request.user.pk], -1)
         messages.success(request, 'Notification deleted successfully!')
     return redirect('notifications')
 
@@ -515,8 +589,8 @@ def notification_delete_view(request, pk):
 def notification_clear_all_view(request):
     """Delete all notifications for current user"""
     if request.method == 'POST':
-        deleted_count = Notification.objects.filter(user=request.user).count()
-        Notification.objects.filter(user=request.user).delete()
+        # Batched DELETEs by primary key, and one counter adjustment
+        deleted_count = delete_notifications(Notification.objects.filter(user=request.user))
         messages.success(request, f'{deleted_count} notification(s) cleared!')
     return redirect('notifications')
 
@@ -533,44 +607,64 @@ def admin_dashboard_view(request):
         return redirect('dashboard')
     
     # Pending reservations that need review
-    pending_reservations = Reservation.objects.filter(status='pending').order_by('-created_at')
+    pending_reservations = Reservation.objects.filter(status='pending').select_related('apartment', 'user').order_by('-created_at')
     
-    # Statistics
-    total_users = User.objects.filter(is_staff=False).count()
-    total_reservations = Reservation.objects.count()
-    approved_today = Reservation.objects.filter(
-        status='approved',
-        reviewed_at__date=timezone.now().date()
-    ).count()
+    # Statistics (cached snapshot, one aggregate query per model on a miss)
+    stats = global_stats()
     
     context = {
         'pending_reservations': pending_reservations,
-        'total_users': total_users,
-        'total_reservations': total_reservations,
-        'approved_today': approved_today,
+        'pending_count': stats['pending_reservations'],
+        'total_users': stats['total_users'],
+        'total_reservations': stats['total_reservations'],
+        'approved_today': stats['approved_today'],
     }
     
     return render(request, 'reservations/admin_dashboard.html', context)
 
+
+@login_required
+def sql_profiles_view(request):
+    """Recent request profiles from the SQL profiler (this worker process only)"""
+    if not request.user.is_staff:
+        messages.error(request, 'Access denied. Admin only.')
+        return redirect('dashboard')
+    
+    if request.method == 'POST':
+        clear_profiles()
+        return redirect('sql_profiles')
+    
+    profiles = recent_profiles()
+    if request.GET.get('nplus1'):
+        profiles = [profile for profile in profiles if profile.repeated]
+    
+    context = {
+        'profiles': profiles,
+        'enabled': settings.SQL_PROFILER_ENABLED,
+        'only_nplus1': bool(request.GET.get('nplus1')),
+        'repeat_threshold': settings.SQL_PROFILER_REPEAT_THRESHOLD,
+    }
+    return render(request, 'reservations/sql_profiles.html', context)
+
 @login_required
 def inbox_view(request):
     """Show all conversations for the current user"""
-    conversations = Conversation.objects.filter(
-        participants=request.user
-    ).prefetch_related('messages', 'participants').order_by('-updated_at')
+    # One query for the user's threads (the summary lives on the rows, unread counts are
+    # range counts past each read cursor), plus one prefetch for the participants
+    memberships = ConversationParticipant.objects.filter(
+        user=request.user
+    ).with_unread_count().select_related(
+        'conversation', 'conversation__last_message_sender'
+    ).prefetch_related('conversation__participants').order_by('-conversation__updated_at')
     
     # Prepare conversation data with last message and unread count
     conversation_data = []
-    for conv in conversations:
-        last_msg = conv.get_last_message()
-        other_user = conv.get_other_participant(request.user)
-        unread = conv.unread_count_for_user(request.user)
-        
+    for membership in memberships:
+        conv = membership.conversation
         conversation_data.append({
             'conversation': conv,
-            'other_user': other_user,
-            'last_message': last_msg,
-            'unread_count': unread,
+            'other_user': conv.get_other_participant(request.user),
+            'unread_count': membership.unread_count,
         })
     
     context = {
@@ -581,11 +675,12 @@ def inbox_view(request):
 
 @login_required
 def message_detail_view(request, pk):
-    """View a conversation thread and send replies"""
+    """View a conversation thread and send replies (not conditional: viewing marks it read)"""
     conversation = get_object_or_404(Conversation, pk=pk, participants=request.user)
     
     # Mark all messages in this conversation as read for current user
-    conversation.messages.exclude(sender=request.user).update(is_read=True)
+    cleared = conversation.mark_read(request.user)
+    adjust_counter(MESSAGES, [request.user.pk], -cleared)
     
     # Get other participant
     other_user = conversation.get_other_participant(request.user)
@@ -593,29 +688,22 @@ def message_detail_view(request, pk):
     if request.method == 'POST':
         content = request.POST.get('content')
         if content:
-            # Create new message in this conversation
+            # Create new message in this conversation (the conversation summary
+            # and timestamp are updated when the message is saved)
             Message.objects.create(
                 conversation=conversation,
                 sender=request.user,
                 content=content
             )
             
-            # Update conversation timestamp
-            conversation.updated_at = timezone.now()
-            conversation.save()
-            
             # Create notification
-            Notification.objects.create(
-                user=other_user,
-                notification_type='new_message',
-                message=f"New message from {request.user.username}"
-            )
+            notify([other_user], 'new_message', f"New message from {request.user.username}")
             
             messages.success(request, f"Message sent to {other_user.username}!")
             return redirect('message_detail', pk=pk)
     
-    # Get all messages in chronological order
-    message_list = conversation.messages.all()
+    # Newest page of messages (chronological within the page), with "load older" cursors
+    message_list = paginate(request, conversation.messages.all(), page_size=MESSAGES_PER_PAGE, backwards=True)
     
     return render(request, 'reservations/message_detail.html', {
         'conversation': conversation,
@@ -623,6 +711,52 @@ def message_detail_view(request, pk):
         'other_user': other_user
     })
 
+@login_required
+@require_POST
+def message_read_view(request, pk):
+    """Mark a thread read while it is open (called when a live message arrives)"""
+    conversation = get_object_or_404(Conversation, pk=pk, participants=request.user)
+    cleared = conversation.mark_read(request.user)
+    adjust_counter(MESSAGES, [request.user.pk], -cleared)
+    return HttpResponse(status=204)
+
+
+def _sse_frame(event):
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream_view(request):
+    """
+    Server-Sent Events stream of the user's new messages and notifications.
+    
+    The only query is the session lookup on connect; afterwards the stream
+    just waits on its broker subscription.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not hasattr(request, 'scope'):
+        # Under WSGI a stream would tie up a worker forever; 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    
+    subscription = get_broker().subscribe(user_channel(user.pk))
+    
+    async def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                event = await subscription.get(timeout=SSE_KEEPALIVE)
+                # A comment line keeps proxies from closing an idle connection
+                yield _sse_frame(event) if event is not None else ": keepalive\n\n"
+        finally:
+            subscription.close()
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def send_message_view(request):
     """Start a new conversation"""
@@ -632,41 +766,16 @@ def send_message_view(request):
         content = request.POST.get('content')
         recipient = get_object_or_404(User, id=recipient_id)
         
-        # Check if conversation already exists between these users
-        existing_conv = Conversation.objects.filter(
-            participants=request.user
-        ).filter(
-            participants=recipient
-        ).first()
-        
-        if existing_conv:
-            # Add message to existing conversation
-            Message.objects.create(
-                conversation=existing_conv,
-                sender=request.user,
-                content=content
-            )
-            existing_conv.updated_at = timezone.now()
-            existing_conv.save()
-            conversation = existing_conv
-        else:
-            # Create new conversation
-            conversation = Conversation.objects.create(subject=subject)
-            conversation.participants.add(request.user, recipient)
-            
-            # Create first message
-            Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                content=content
-            )
+        # One indexed lookup on the participant key (created if this is the first message)
+        conversation, _ = Conversation.get_or_create_between([request.user, recipient], subject)
+        Message.objects.create(
+            conversation=conversation,
+            sender=request.user,
+            content=content
+        )
         
         # Create notification
-        Notification.objects.create(
-            user=recipient,
-            notification_type='new_message',
-            message=f"New message from {request.user.username}"
-        )
+        notify([recipient], 'new_message', f"New message from {request.user.username}")
         
         messages.success(request, 'Message sent successfully!')
         return redirect('message_detail', pk=conversation.pk)